@@ -0,0 +1,252 @@
+"""Benchmarks of shane on synthetic media.
+
+    python benchmarks/bench.py [--only open command remux extract] [--repeat 5]
+    python benchmarks/bench.py --compare results/OLD.json results/NEW.json
+
+The fixtures are made by FFmpeg (see fixtures.py) and the results are
+written to benchmarks/results as JSON, so versions can be compared.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from collections import Counter
+
+# benchmark the working tree, not an installed shane
+BASE = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE.parent))
+
+import shane
+from shane import _probe
+from shane.__version__ import __version__
+from shane._utils import FFMPEG
+from shane._ffmpeg import FFmpegCompressor, extention_for_extracting
+
+from fixtures import make_fixtures, FIXTURES
+
+
+BENCHMARKS = ['open', 'command', 'remux', 'extract']
+STREAM_COUNTS = [10, 50, 100, 200, 400]
+
+
+class ProcessCounter:
+    """Counts the processes started inside the block by the name of
+    the program."""
+    def __enter__(self):
+        self.counts = Counter()
+        counts = self.counts
+        self._popen = popen = subprocess.Popen
+
+        class Popen(popen):
+            def __init__(self, args, *rest, **kwargs):
+                counts[os.path.basename(str(args[0]))] += 1
+                super().__init__(args, *rest, **kwargs)
+
+        subprocess.Popen = Popen
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.Popen = self._popen
+
+
+def measure(function, repeat, setup=None) -> dict:
+    """Times `function` `repeat` times. `setup` runs before every call
+    and is not timed."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+
+
+def bench_open(fixtures, repeat, workdir):
+    results = {}
+    for name, path in fixtures.items():
+        for backend in _probe.PROBE_BACKENDS:
+            for lazy in (False, True):
+                _probe.set_probe_backend(backend)
+                with ProcessCounter() as counter:
+                    result = measure(lambda: shane.open(path, lazy=lazy), repeat)
+                result['processes'] = sum(counter.counts.values()) / repeat
+                results[f'{name}/{backend}/{"lazy" if lazy else "eager"}'] = result
+    _probe.set_probe_backend('ffprobe')
+    return results
+
+
+def synthetic_probe(count) -> dict:
+    streams = [{
+        'index': 0, 'codec_type': 'video', 'codec_name': 'h264',
+        'width': 1920, 'height': 1080, 'avg_frame_rate': '24/1',
+    }]
+    kinds = [
+        {'codec_type': 'audio', 'codec_name': 'dts', 'channels': 6, 'sample_rate': '48000'},
+        {'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2, 'sample_rate': '48000'},
+        {'codec_type': 'subtitle', 'codec_name': 'subrip'},
+        {'codec_type': 'subtitle', 'codec_name': 'ass'},
+    ]
+    for index in range(1, count):
+        stream = dict(kinds[index % len(kinds)], index=index)
+        stream['tags'] = {'language': 'eng', 'title': f'Track {index}'}
+        streams.append(stream)
+    return {
+        'format': {'filename': 'synthetic.mkv', 'duration': '5400.0', 'size': '1000'},
+        'streams': streams,
+        'chapters': [],
+    }
+
+
+def bench_command(fixtures, repeat, workdir):
+    """Command generation time versus the number of streams, for a
+    remux to .m4v where every stream needs a decision."""
+    results = {}
+    for count in STREAM_COUNTS:
+        container = shane.Container(path='synthetic.mkv', probe=synthetic_probe(count))
+
+        def generate():
+            compressor = FFmpegCompressor()
+            compressor.add_input_files(*container._get_all_input_files())
+            compressor.add_output_path('synthetic.m4v')
+            compressor._generate_common_command()
+
+        results[f'{count}-streams'] = measure(generate, repeat)
+    return results
+
+
+def bench_remux(fixtures, repeat, workdir):
+    results = {}
+    for name, path in fixtures.items():
+        output = os.path.join(workdir, 'remux' + os.path.splitext(path)[-1])
+
+        def setup():
+            if os.path.exists(output):
+                os.remove(output)
+
+        def remux():
+            container = shane.open(path)
+            container.path = output
+            container.save()
+
+        result = measure(remux, repeat, setup)
+        size = os.path.getsize(path)
+        result['mb_per_second'] = size / result['median'] / 1024 ** 2
+        results[name] = result
+    return results
+
+
+def bench_extract(fixtures, repeat, workdir):
+    """Extraction of all the subtitles and attachments, one stream by
+    one and in one pass."""
+    results = {}
+    for name, path in fixtures.items():
+        container = shane.open(path)
+        selected = [s for s in container.streams if s.is_subtitle or s.is_attachment]
+        if not selected:
+            continue
+        directory = os.path.join(workdir, 'extract')
+
+        def setup():
+            shutil.rmtree(directory, ignore_errors=True)
+            os.mkdir(directory)
+
+        def one_by_one():
+            for stream in selected:
+                if stream.is_subtitle:
+                    extention = extention_for_extracting(stream)
+                    stream.extract(os.path.join(directory, f'{stream.index}{extention}'))
+
+        def one_pass():
+            container.extract_streams(
+                lambda s: s.is_subtitle or s.is_attachment,
+                os.path.join(directory, '{index}{ext}'),
+            )
+
+        subtitles = sum(1 for s in selected if s.is_subtitle)
+        results[f'{name}/one-by-one/{subtitles}-subtitles'] = measure(one_by_one, repeat, setup)
+        results[f'{name}/one-pass/{len(selected)}-streams'] = measure(one_pass, repeat, setup)
+    return results
+
+
+def environment() -> dict:
+    ffmpeg = subprocess.run(
+        [FFMPEG, '-version'], stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.splitlines()
+    return {
+        'shane': __version__,
+        'python': platform.python_version(),
+        'ffmpeg': ffmpeg[0] if ffmpeg else None,
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def compare(old_path, new_path):
+    """Prints the median times of the `new_path` results relative to
+    the `old_path` ones."""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old['environment']['shane']} -> {new['environment']['shane']}")
+    for benchmark, cases in new['results'].items():
+        for case, result in cases.items():
+            before = old['results'].get(benchmark, {}).get(case)
+            if before is None:
+                continue
+            ratio = result['median'] / before['median']
+            print(f"{benchmark:8} {case:40} {before['median']:9.4f}s "
+                  f"{result['median']:9.4f}s  x{ratio:.2f}")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--fixture', nargs='+', choices=[f.name for f in FIXTURES],
+                        help='the fixtures to use, all by default')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fixtures-dir',
+                        default=os.path.join(tempfile.gettempdir(), 'shane-benchmarks'))
+    parser.add_argument('--regenerate', action='store_true',
+                        help='make the fixtures again')
+    parser.add_argument('--output', help='the results file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(args)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    fixtures = {}
+    if set(args.only) != {'command'}:
+        fixtures = make_fixtures(args.fixtures_dir, args.fixture, args.regenerate)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only:
+            print(f'{name}...', file=sys.stderr)
+            results[name] = globals()['bench_' + name](fixtures, args.repeat, workdir)
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = BASE / 'results' / f'{__version__}-{stamp}.json'
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Deterministic media files for the benchmarks, made by FFmpeg from
+its lavfi sources. Nothing is downloaded; a fixture is generated again
+only if it is missing or its spec changed."""
+import os
+import json
+import random
+import subprocess as sp
+from collections import namedtuple
+
+from shane._utils import FFMPEG
+
+
+Fixture = namedtuple('Fixture', [
+    'name', 'extention', 'duration', 'size', 'rate', 'vcodec', 'acodecs',
+    'scodecs', 'attachments', 'chapters',
+])
+
+FIXTURES = [
+    Fixture('simple', '.mkv', 10, '640x360', 24, 'libx264',
+            ['aac'], ['srt'], 0, 0),
+    Fixture('many-tracks', '.mkv', 30, '640x360', 24, 'libx264',
+            ['aac', 'ac3', 'flac'] * 6, ['srt', 'ass'] * 16, 8, 20),
+    Fixture('mpeg4', '.mp4', 30, '640x360', 24, 'mpeg4',
+            ['aac', 'ac3'], ['mov_text'], 0, 5),
+    Fixture('long', '.mkv', 3600, '160x90', 1, 'libx264',
+            ['aac'], ['srt'], 0, 60),
+]
+
+LANGUAGES = ['eng', 'fre', 'ger', 'spa', 'ita', 'jpn', 'rus', 'por']
+
+# the output doesn't depend on the FFmpeg build or the time
+BITEXACT = ['-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact']
+
+
+def make_fixtures(directory, names=None, regenerate=False) -> dict:
+    """Makes the fixtures in `directory` and returns their paths by
+    name."""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'fixtures.json')
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    paths = {}
+    for fixture in FIXTURES:
+        if names and fixture.name not in names:
+            continue
+        path = os.path.join(directory, fixture.name + fixture.extention)
+        spec = list(fixture)
+        if regenerate or manifest.get(fixture.name) != spec or not os.path.exists(path):
+            make_fixture(fixture, path)
+            manifest[fixture.name] = spec
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+        paths[fixture.name] = path
+    return paths
+
+
+def make_fixture(fixture, path):
+    directory = os.path.join(os.path.dirname(path), fixture.name + '-sources')
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(fixture.name)
+    inputs = [
+        '-f', 'lavfi', '-i',
+        f'testsrc2=size={fixture.size}:rate={fixture.rate}:duration={fixture.duration}',
+    ]
+    outputs = ['-map', '0:v', '-codec:v', fixture.vcodec, '-g', str(fixture.rate * 2)]
+    if fixture.vcodec == 'libx264':
+        outputs += ['-preset', 'ultrafast', '-crf', '35']
+    sample_rate = 48000 if fixture.duration < 600 else 8000
+    for i, codec in enumerate(fixture.acodecs):
+        inputs += [
+            '-f', 'lavfi', '-i',
+            f'sine=frequency={220 + 55 * i}:sample_rate={sample_rate}'
+            f':duration={fixture.duration}',
+        ]
+        outputs += [
+            '-map', f'{i + 1}:a', f'-codec:a:{i}', codec,
+            f'-metadata:s:a:{i}', f'language={LANGUAGES[i % len(LANGUAGES)]}',
+        ]
+    first = 1 + len(fixture.acodecs)
+    for i, codec in enumerate(fixture.scodecs):
+        subtitles = os.path.join(directory, f'{i}.srt')
+        write_subtitles(subtitles, fixture.duration, rng)
+        inputs += ['-i', subtitles]
+        outputs += [
+            '-map', f'{first + i}:s', f'-codec:s:{i}', codec,
+            f'-metadata:s:s:{i}', f'language={LANGUAGES[i % len(LANGUAGES)]}',
+            f'-metadata:s:s:{i}', f'title=Subtitles {i}',
+        ]
+    if fixture.chapters:
+        metadata = os.path.join(directory, 'chapters.txt')
+        write_chapters(metadata, fixture.duration, fixture.chapters)
+        inputs += ['-i', metadata]
+        index = first + len(fixture.scodecs)
+        outputs += ['-map_metadata', str(index), '-map_chapters', str(index)]
+    for i in range(fixture.attachments):
+        font = os.path.join(directory, f'font{i}.ttf')
+        with open(font, 'wb') as f:
+            f.write(bytes(rng.getrandbits(8) for _ in range(64 * 1024)))
+        outputs += [
+            '-attach', font,
+            f'-metadata:s:t:{i}', 'mimetype=application/x-truetype-font',
+            f'-metadata:s:t:{i}', f'filename=font{i}.ttf',
+        ]
+    command = [FFMPEG, '-y', '-loglevel', 'error'] + inputs + outputs + BITEXACT + [path]
+    sp.run(command, check=True)
+
+
+def write_subtitles(path, duration, rng):
+    step = 2 if duration < 600 else 30
+    with open(path, 'w', encoding='utf-8') as f:
+        for number, start in enumerate(range(0, duration - 1, step), 1):
+            words = ' '.join(rng.choice(LANGUAGES) for _ in range(6))
+            f.write(f'{number}\n{_srt_time(start)} --> {_srt_time(start + 1)}\n{words}\n\n')
+
+
+def write_chapters(path, duration, count):
+    length = duration * 1000 // count
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(';FFMETADATA1\ntitle=Benchmark\n')
+        for i in range(count):
+            f.write(
+                f'[CHAPTER]\nTIMEBASE=1/1000\nSTART={i * length}\n'
+                f'END={(i + 1) * length}\ntitle=Chapter {i + 1}\n'
+            )
+
+
+def _srt_time(seconds):
+    return f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02},000'
@@ -33,6 +33,12 @@ setup(
     python_requires='>=3.6',
     url='https://github.com/dmkskn/shane',
     packages=find_packages(),
+    extras_require={
+        'numpy': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': ['shane=shane._cli:main'],
+    },
     license='MIT',
     keywords='video metadata converting muxing ffmpeg',
     classifiers=[
@@ -1,7 +1,12 @@
 from ._api import *
+from ._probe import *
 
-from ._utils import check_ffmpeg as _check_ffmpeg
+from ._capabilities import *
+from ._cache import ProbeCache
 from ._container import Container
-
-_check_ffmpeg()
+from ._ffmpeg import Progress
+from ._packets import PacketIndex
+from ._packaging import Package, PackagingError
+from ._scheduler import Scheduler, SchedulerError
+from ._library import Library, LibraryError
 
@@ -0,0 +1,44 @@
+import asyncio
+import subprocess as sp
+
+from ._utils import ffprobe_command, parse_ffprobe, PROBE_SECTIONS
+
+
+async def run_process(command, timeout=None, on_line=None) -> tuple:
+    """Runs the `command` and returns its return code and stdout. If
+    `on_line` is passed, it is called with every line of stdout as soon
+    as the line is written and the returned stdout is empty.
+
+    If the call is cancelled or takes more than `timeout` seconds, the
+    process is killed before the exception is propagated.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *map(str, command), stdout=sp.PIPE, stdin=sp.DEVNULL
+    )
+    try:
+        stdout = await asyncio.wait_for(_communicate(process, on_line), timeout)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    return process.returncode, stdout
+
+
+async def _communicate(process, on_line):
+    if on_line is None:
+        stdout, _ = await process.communicate()
+        return stdout
+    async for line in process.stdout:
+        on_line(line.decode())
+    await process.wait()
+    return b''
+
+
+async def acall_ffprobe(path, timeout=None, sections=PROBE_SECTIONS) -> dict:
+    """An awaitable version of `call_ffprobe`."""
+    command = ffprobe_command(path, sections)
+    returncode, response = await run_process(command, timeout)
+    if returncode:
+        raise sp.CalledProcessError(returncode, command, response)
+    return parse_ffprobe(response, sections)
@@ -1,17 +1,130 @@
 import os
+import weakref
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from ._utils import Something
+from ._probe import probe as probe_path, aprobe
+from ._container import Container
+from ._pipe import PipeSource, PIPE_PATH
 
 
-__all__ = ['open']
+__all__ = ['open', 'aopen', 'open_many', 'OpenManyError']
 
 
-def open(path):
+class OpenManyError(Exception):
+    """Some paths passed to `open_many` could not be opened. The
+    `errors` attribute maps these paths to their exceptions."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Failed to open {len(errors)} path(s).")
+
+
+def open(path, lazy=True, keep_raw=False):
+    """Opens the `path` as a stream or a container. `lazy` and
+    `keep_raw` are described in `Container`.
+
+    `path` can also be bytes or a readable binary file object. The data
+    is fed to FFprobe and FFmpeg over a pipe; the media has no path
+    until it is set. MP4 files with the media data before the header
+    are written to a temporary file first."""
+    if not isinstance(path, (str, os.PathLike)):
+        return _open_source(PipeSource(path), keep_raw)
     if not os.path.exists(path):
-        raise FileNotFoundError("The path '{path}' doesn't exists.")
+        raise FileNotFoundError(f"The path '{path}' doesn't exists.")
+    elif lazy:
+        probe = probe_path(path, ("format",))
+        if probe["format"].get("nb_streams") != 1:
+            return Container(path=path, probe=probe, keep_raw=keep_raw)
+        something = Something(path, probe if "streams" in probe else None)
     else:
         something = Something(path)
-    
+
+    if something.is_stream:
+        return something.as_stream(keep_raw)
+    else:
+        return something.as_container(keep_raw)
+
+
+def _open_source(source, keep_raw=False):
+    if source.needs_seeking():
+        path = source.spool(suffix=".mp4")
+        media = open(path, keep_raw=keep_raw)
+        weakref.finalize(media, _remove, path)
+        return media
+    something = Something(PIPE_PATH, source.probe())
+    if something.is_stream:
+        media = something.as_stream(keep_raw)
+    else:
+        media = something.as_container(keep_raw)
+    media._source = source
+    return media
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def aopen(path, timeout=None, lazy=True, keep_raw=False):
+    """An awaitable version of `open`. The probe is killed if it takes
+    more than `timeout` seconds or if the call is cancelled."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"The path '{path}' doesn't exists.")
+    elif lazy:
+        probe = await aprobe(path, timeout, ("format",))
+        if probe["format"].get("nb_streams") != 1:
+            return Container(path=path, probe=probe, keep_raw=keep_raw)
+        if "streams" not in probe:
+            probe = await aprobe(path, timeout)
+        something = Something(path, probe=probe)
+    else:
+        something = Something(path, probe=await aprobe(path, timeout))
+
     if something.is_stream:
-        return something.as_stream()
+        return something.as_stream(keep_raw)
     else:
-        return something.as_container()
+        return something.as_container(keep_raw)
+
+
+def open_many(paths, workers=8, ordered=False, errors=None, lazy=True, keep_raw=False):
+    """Opens many paths at once and yields `(path, media)` pairs.
+
+    Paths are probed in a pool of `workers` threads (probing is almost
+    all waiting for ffprobe). Pairs are yielded as soon as they are
+    ready or, if `ordered` is true, in the order of `paths`. A path
+    that can't be opened doesn't stop the others: its exception is
+    stored in the `errors` dict. If `errors` is not passed,
+    `OpenManyError` is raised after all other paths were yielded.
+    `lazy` and `keep_raw` are passed to `open`.
+    """
+    failed = {} if errors is None else errors
+    paths = iter(paths)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}  # future -> path, in the submission order
+    try:
+        while True:
+            # keep a bounded number of paths in flight
+            for path in itertools.islice(paths, 2 * workers - len(pending)):
+                pending[executor.submit(open, path, lazy, keep_raw)] = path
+            if not pending:
+                break
+            if ordered:
+                done = [next(iter(pending))]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    media = future.result()
+                except Exception as e:
+                    failed[path] = e
+                else:
+                    yield path, media
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+    if errors is None and failed:
+        raise OpenManyError(failed)
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class ProbeCache:
+    """A persistent cache of the probe results.
+
+    The results are stored in the SQLite database at `path` and are
+    keyed by the file identity: (device, inode, size, mtime_ns). If a
+    file changes, its identity changes too, so the old entry is never
+    returned again. Entries that were not used for `max_age` seconds
+    and the least recently used entries above `max_size` bytes are
+    evicted. The access times of hits are written in batches, on
+    every eviction pass and when the cache is closed.
+    """
+    _EVICT_EVERY = 100
+    _FLUSH_EVERY = 100
+
+    def __init__(self, path, max_size=256 * 1024 ** 2, max_age=30 * 24 * 60 * 60):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        # key -> access time of the hits that are not written yet
+        self._accessed = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            "device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "path TEXT, data TEXT, accessed REAL, "
+            "PRIMARY KEY (device, inode, size, mtime_ns))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS probes_path ON probes (path)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS probes_accessed ON probes (accessed)"
+        )
+
+    def __repr__(self):
+        return (f"ProbeCache(path={self.path}, hits={self.hits}, " +
+            f"misses={self.misses})")
+
+    @staticmethod
+    def key(path) -> tuple:
+        """The identity of the file at `path`."""
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, path, key=None):
+        """Returns the cached probe of the `path` or None."""
+        if key is None:
+            key = self.key(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM probes WHERE device = ? AND inode = ? "
+                "AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[tuple(key)] = time.time()
+            if len(self._accessed) >= self._FLUSH_EVERY:
+                self._flush_accessed()
+        probe = json.loads(row[0])
+        # The file could be renamed or hard-linked since it was probed.
+        probe["format"]["filename"] = os.fspath(path)
+        return probe
+
+    def put(self, path, probe, key=None):
+        """Stores the `probe` of the `path`, replacing the older probes
+        of the same path."""
+        if key is None:
+            key = self.key(path)
+        data = json.dumps(probe)
+        with self._lock:
+            self._accessed.pop(tuple(key), None)
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "DELETE FROM probes WHERE path = ?", (os.fspath(path),)
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*key, os.fspath(path), data, time.time())
+                )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            self._puts += 1
+            evict = self._puts % self._EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def _flush_accessed(self):
+        """Writes the pending access times in one transaction. The
+        lock must be held."""
+        if not self._accessed:
+            return
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.executemany(
+                "UPDATE probes SET accessed = ? WHERE device = ? "
+                "AND inode = ? AND size = ? AND mtime_ns = ?",
+                [(accessed, *key) for key, accessed in self._accessed.items()]
+            )
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        self._accessed.clear()
+
+    def evict(self) -> int:
+        """Removes expired entries and the least recently used entries
+        above `max_size`. Returns the number of removed entries."""
+        removed = 0
+        with self._lock:
+            self._flush_accessed()
+            if self.max_age is not None:
+                removed += self._connection.execute(
+                    "DELETE FROM probes WHERE accessed < ?",
+                    (time.time() - self.max_age,)
+                ).rowcount
+            if self.max_size is not None:
+                rows = self._connection.execute(
+                    "SELECT rowid, LENGTH(data) FROM probes "
+                    "ORDER BY accessed DESC"
+                )
+                total, expired = 0, []
+                for rowid, size in rows:
+                    total += size
+                    if total > self.max_size:
+                        expired.append((rowid,))
+                self._connection.executemany(
+                    "DELETE FROM probes WHERE rowid = ?", expired
+                )
+                removed += len(expired)
+        return removed
+
+    def clear(self):
+        """Removes all the entries."""
+        with self._lock:
+            self._accessed.clear()
+            self._connection.execute("DELETE FROM probes")
+
+    def stats(self) -> dict:
+        """Hits and misses of this process and the size of the cache."""
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), TOTAL(LENGTH(data)) FROM probes"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": int(size),
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+        self._connection.close()
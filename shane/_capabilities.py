@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import shutil
+import threading
+import subprocess as sp
+
+from ._utils import FFMPEG, FFPROBE
+
+
+__all__ = ['Capabilities', 'get_capabilities', 'set_capabilities']
+
+CACHE_PATH = os.getenv("SHANE_CAPABILITIES_CACHE", os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "shane", "capabilities.json",
+))
+
+# encoders by codec, the fastest first
+SOFTWARE_ENCODERS = {
+    "h264": ["libx264", "libopenh264"],
+    "hevc": ["libx265", "libkvazaar", "libsvt_hevc"],
+    "aac": ["libfdk_aac", "aac_at", "aac"],
+    "ac3": ["ac3", "ac3_fixed"],
+}
+# they are listed by FFmpeg even if there is no device for them
+HARDWARE_ENCODERS = {
+    "h264": ["h264_nvenc", "h264_qsv", "h264_videotoolbox", "h264_amf"],
+    "hevc": ["hevc_nvenc", "hevc_qsv", "hevc_videotoolbox", "hevc_amf"],
+}
+# names of the codecs that FFmpeg doesn't use
+CODEC_ALIASES = {"h265": "hevc"}
+
+ENCODER_LINE = re.compile(r"^\s*([VAS][\w.]{5})\s+(\S+)\s+(.*)$")
+CODEC_NAME = re.compile(r"\(codec (\w+)\)")
+
+_capabilities = None
+# changes whenever other capabilities are set or read
+_generation = 0
+_lock = threading.Lock()
+
+
+class Capabilities:
+    """What the FFmpeg build can do: its version, encoders, muxers and
+    bitstream filters. `encoders` maps the encoder names to the names
+    of their codecs.
+
+    An empty registry knows nothing, so the codec names are passed to
+    FFmpeg as they are.
+    """
+    def __init__(self, version=None, ffprobe_version=None, encoders=None,
+                 muxers=(), bsfs=(), hardware=False):
+        self.version = version
+        self.ffprobe_version = ffprobe_version
+        self.encoders = dict(encoders or {})
+        self.muxers = frozenset(muxers)
+        self.bsfs = frozenset(bsfs)
+        self.hardware = hardware
+
+    def __repr__(self):
+        return (f"Capabilities(version={self.version}, "
+                f"encoders={len(self.encoders)}, muxers={len(self.muxers)})")
+
+    def encoder_for(self, codec) -> str:
+        """The fastest encoder for the `codec` in this build. Hardware
+        encoders are chosen only if `hardware` is true. If none of the
+        known encoders is there, the codec name is returned and FFmpeg
+        picks its default encoder."""
+        codec = CODEC_ALIASES.get(codec, codec)
+        candidates = SOFTWARE_ENCODERS.get(codec, [])
+        if self.hardware:
+            candidates = HARDWARE_ENCODERS.get(codec, []) + candidates
+        for encoder in candidates:
+            if encoder in self.encoders:
+                return encoder
+        return codec
+
+    def codec_of(self, encoder) -> str:
+        """The codec the `encoder` writes."""
+        if encoder in self.encoders:
+            return self.encoders[encoder]
+        for tables in (SOFTWARE_ENCODERS, HARDWARE_ENCODERS):
+            for codec, encoders in tables.items():
+                if encoder in encoders:
+                    return codec
+        return CODEC_ALIASES.get(encoder, encoder)
+
+    def has_encoder(self, name) -> bool:
+        return name in self.encoders
+
+    def has_muxer(self, name) -> bool:
+        return name in self.muxers
+
+    def has_bsf(self, name) -> bool:
+        return name in self.bsfs
+
+    def as_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "ffprobe_version": self.ffprobe_version,
+            "encoders": self.encoders,
+            "muxers": sorted(self.muxers),
+            "bsfs": sorted(self.bsfs),
+        }
+
+
+def get_capabilities() -> Capabilities:
+    """Returns the `Capabilities` of FFmpeg. They are read on first
+    use and cached on disk by the path and the modification time of
+    the binaries, so FFmpeg is asked again only after an upgrade."""
+    global _capabilities, _generation
+    if _capabilities is None:
+        with _lock:
+            if _capabilities is None:
+                _capabilities = load_capabilities()
+                _generation += 1
+    return _capabilities
+
+
+def capabilities_generation() -> int:
+    """A number that changes when the `Capabilities` change, without
+    reading them."""
+    return _generation
+
+
+def set_capabilities(capabilities):
+    """Sets the `Capabilities` to use instead of asking FFmpeg. `None`
+    makes them read again on next use."""
+    global _capabilities, _generation
+    with _lock:
+        _capabilities = capabilities
+        _generation += 1
+
+
+def load_capabilities(cache_path=CACHE_PATH) -> Capabilities:
+    ffmpeg = _binary(FFMPEG)
+    if ffmpeg is None:
+        raise FileNotFoundError("Shane requires FFmpeg installed.")
+    ffprobe = _binary(FFPROBE)
+    key = {"ffmpeg": ffmpeg, "ffprobe": ffprobe}
+    hardware = bool(os.getenv("SHANE_HARDWARE_ENCODERS"))
+    cache = _read_cache(cache_path) if cache_path else {}
+    entry = cache.get(ffmpeg[0])
+    if entry is not None and entry.get("key") == _jsonable(key):
+        return Capabilities(hardware=hardware, **entry["capabilities"])
+    capabilities = query_capabilities(ffmpeg[0], ffprobe and ffprobe[0])
+    capabilities.hardware = hardware
+    if cache_path:
+        cache[ffmpeg[0]] = {
+            "key": _jsonable(key), "capabilities": capabilities.as_dict()
+        }
+        _write_cache(cache_path, cache)
+    return capabilities
+
+
+def query_capabilities(ffmpeg, ffprobe=None) -> Capabilities:
+    """Asks the binaries what they can do."""
+    return Capabilities(
+        version=parse_version(_output([ffmpeg, "-version"])),
+        ffprobe_version=parse_version(_output([ffprobe, "-version"])) if ffprobe else None,
+        encoders=parse_encoders(_output([ffmpeg, "-hide_banner", "-encoders"])),
+        muxers=parse_muxers(_output([ffmpeg, "-hide_banner", "-muxers"])),
+        bsfs=parse_bsfs(_output([ffmpeg, "-hide_banner", "-bsfs"])),
+    )
+
+
+def parse_version(output):
+    words = output.split(maxsplit=3)
+    return words[2] if len(words) > 2 and words[1] == "version" else None
+
+
+def parse_encoders(output) -> dict:
+    encoders = {}
+    for line in _after_rule(output):
+        match = ENCODER_LINE.match(line)
+        if match:
+            _, name, description = match.groups()
+            codec = CODEC_NAME.search(description)
+            encoders[name] = codec.group(1) if codec else name
+    return encoders
+
+
+def parse_muxers(output) -> set:
+    muxers = set()
+    for line in _after_rule(output):
+        fields = line.split(None, 2)
+        if len(fields) >= 2 and "E" in fields[0]:
+            muxers.update(fields[1].split(","))
+    return muxers
+
+
+def parse_bsfs(output) -> set:
+    lines = output.splitlines()
+    return {line.strip() for line in lines[1:] if line.strip()}
+
+
+def _after_rule(output):
+    """The lines after the dashed line that ends the legend."""
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() and set(line.strip()) == {"-"}:
+            return lines[i + 1:]
+    return []
+
+
+def _output(command):
+    try:
+        return sp.run(
+            command, stdout=sp.PIPE, stderr=sp.DEVNULL, stdin=sp.DEVNULL,
+            universal_newlines=True, errors="replace",
+        ).stdout or ""
+    except OSError:
+        return ""
+
+
+def _binary(name):
+    """`(path, mtime, size)` of the binary or None if there is none."""
+    path = shutil.which(name)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def _jsonable(key):
+    return json.loads(json.dumps(key))
+
+
+def _read_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_cache(path, cache):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(temp_path, path)
+    except OSError:
+        # a read-only home only costs a query per process
+        pass
@@ -0,0 +1,252 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+
+from ._api import open as open_media
+from ._scheduler import Scheduler
+from ._utils import SUPPORTED_VIDEO_EXTENTIONS
+
+
+JOURNAL_NAME = ".shane-journal.jsonl"
+
+# see FFmpegCompressor._choose_temp_path
+TEMP_PATH = re.compile(r" \(temp \d+\)\.\w+$")
+
+STATES = ["pending", "running", "done", "skipped", "failed"]
+
+
+class Journal:
+    """An append-only JSON lines file with the state of every file of a
+    batch: pending, running, done, skipped or failed, the output path
+    and the timings. The last record of a path wins, so a killed batch
+    can be resumed from the journal."""
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line of a killed batch can be cut
+                        continue
+                    self.entries[record["path"]] = record
+        self._file = open(path, "a+", encoding="utf-8")
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell():
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def state(self, path) -> str:
+        entry = self.entries.get(path)
+        return entry["state"] if entry else None
+
+    def update(self, path, state, **fields):
+        """Records the new `state` of the `path` with other `fields`."""
+        with self._lock:
+            record = dict(self.entries.get(path, {"path": path}), **fields)
+            record.update(state=state, time=time.time())
+            self.entries[path] = record
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys(STATES, 0)
+        for entry in self.entries.values():
+            counts[entry["state"]] += 1
+        return counts
+
+    def close(self):
+        self._file.close()
+
+
+def find_media(root, extentions=SUPPORTED_VIDEO_EXTENTIONS):
+    """Yields the sorted paths of the media files under `root`."""
+    for directory, dirs, names in os.walk(root):
+        dirs.sort()
+        for name in sorted(names):
+            if os.path.splitext(name)[-1].lower() in extentions:
+                yield os.path.join(directory, name)
+
+
+def remove_leftovers(entry):
+    """Removes the incomplete output and the temp files of an entry
+    that was running when the batch was killed."""
+    output = entry.get("output")
+    if not output:
+        return
+    # without the source the output is the only copy left
+    source_exists = os.path.exists(entry["path"])
+    if output != entry["path"] and source_exists and os.path.exists(output):
+        os.remove(output)
+    root, ext = os.path.splitext(output)
+    for temp_path in glob.glob(f"{glob.escape(root)} (temp *){glob.escape(ext)}"):
+        os.remove(temp_path)
+
+
+def output_path(path, to=None) -> str:
+    if to is None:
+        return path
+    root, _ = os.path.splitext(path)
+    return root + to
+
+
+def remux(path, journal, to=None, languages=None, remove_source=False, stopping=None):
+    """Remuxes the container at `path` to the `to` extention and drops
+    its audio streams that are not in `languages`, if any audio stream
+    is left. Records every step in the `journal`."""
+    output = output_path(path, to)
+    started = time.time()
+    if output != path and os.path.exists(output):
+        journal.update(path, "failed", output=output, started=started,
+            finished=time.time(), error=f"The path '{output}' already exists")
+        return
+    journal.update(path, "running", output=output, started=started,
+        finished=None, error=None)
+    try:
+        container = open_media(path)
+        changed = False
+        if not container.is_container:
+            journal.update(path, "skipped", finished=time.time(),
+                error="Not a container")
+            return
+        if languages:
+            keep = [a for a in container.audios
+                    if a.metadata.get("language") in languages]
+            if keep and len(keep) < len(container.audios):
+                container.remove_streams(lambda s: s.is_audio and s not in keep)
+                changed = True
+        if output != path:
+            container.extention = to
+            changed = True
+        if not changed:
+            journal.update(path, "skipped", output=path,
+                finished=time.time(), error="Nothing to change")
+            return
+        container.save()
+    except BaseException as e:
+        remove_leftovers({"path": path, "output": output})
+        interrupted = stopping is not None and stopping.is_set()
+        journal.update(path, "pending" if interrupted else "failed",
+            finished=time.time(), error=f"{type(e).__name__}: {e}")
+        if not isinstance(e, Exception):
+            raise
+        return
+    finished = time.time()
+    # the output is complete before the source is gone
+    journal.update(path, "done", finished=finished, elapsed=finished - started)
+    if remove_source and output != path:
+        os.remove(path)
+
+
+def command_remux(args) -> int:
+    journal_path = args.journal or os.path.join(args.dir, JOURNAL_NAME)
+    to = args.to
+    stopping = threading.Event()
+    with Journal(journal_path) as journal:
+        for entry in list(journal.entries.values()):
+            if entry["state"] == "running":
+                # the batch was killed while this file was running
+                remove_leftovers(entry)
+                output = entry.get("output")
+                if not os.path.exists(entry["path"]) and output and os.path.exists(output):
+                    # killed while the source was being removed
+                    journal.update(entry["path"], "done", error=None)
+                else:
+                    journal.update(entry["path"], "pending")
+        outputs = {
+            e.get("output") for e in journal.entries.values()
+            if e.get("output") != e["path"]
+        }
+        paths = []
+        for path in find_media(args.dir):
+            if path in outputs or TEMP_PATH.search(path):
+                continue
+            state = journal.state(path)
+            if state in ("done", "skipped"):
+                continue
+            if state == "failed" and not args.retry_failed:
+                continue
+            if state != "pending":
+                journal.update(path, "pending")
+            paths.append(path)
+        print(f"{len(paths)} file(s) to remux.", flush=True)
+        scheduler = Scheduler(workers=args.jobs)
+        try:
+            for path in paths:
+                scheduler.submit(
+                    lambda path=path: remux(path, journal, to, args.drop_audio_not,
+                        args.remove_source, stopping),
+                    name=path, paths=[path], output_path=output_path(path, to),
+                    expected_size=os.path.getsize(path),
+                )
+            scheduler.shutdown()
+        except KeyboardInterrupt:
+            interrupted_at = time.time() - 1
+            stopping.set()
+            print("Interrupted, waiting for running files...", file=sys.stderr)
+            scheduler.shutdown(cancel=True)
+            # FFmpeg gets the interrupt too and can fail just before
+            # `stopping` is set
+            for path, entry in list(journal.entries.items()):
+                if entry["state"] == "failed" and \
+                        (entry.get("finished") or 0) >= interrupted_at:
+                    journal.update(path, "pending")
+        counts = journal.counts()
+    print(", ".join(f"{count} {state}" for state, count in counts.items()))
+    return 1 if counts["failed"] else 0
+
+
+def extention(value) -> str:
+    value = value if value.startswith(".") else "." + value
+    if value not in SUPPORTED_VIDEO_EXTENTIONS:
+        raise argparse.ArgumentTypeError(
+            f"The extention '{value}' is not supported.")
+    return value
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="shane")
+    commands = parser.add_subparsers(dest="command", required=True)
+    remux_parser = commands.add_parser(
+        "remux", help="remux all the containers under a directory",
+        description="Remuxes all the containers under DIR. The state of "
+        "every file is kept in a journal, so a killed run is resumed "
+        "where it stopped.",
+    )
+    remux_parser.add_argument("dir")
+    remux_parser.add_argument("--to", metavar="EXT", type=extention,
+        help="the new extention, for example .m4v")
+    remux_parser.add_argument("--drop-audio-not", metavar="LANG",
+        action="append", help="drop audio streams in other languages "
+        "(can be repeated)")
+    remux_parser.add_argument("-j", "--jobs", type=int, default=None,
+        help="the number of files remuxed at once")
+    remux_parser.add_argument("--journal", metavar="PATH",
+        help=f"the journal path (DIR/{JOURNAL_NAME} by default)")
+    remux_parser.add_argument("--retry-failed", action="store_true",
+        help="remux the files that failed in a previous run again")
+    remux_parser.add_argument("--remove-source", action="store_true",
+        help="remove the source file when the output has another path")
+    remux_parser.set_defaults(function=command_remux)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+    return args.function(args)
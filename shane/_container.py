@@ -1,20 +1,34 @@
 import os
+import copy
 import math
 import subprocess as sp
-from ._utils import SUPPORTED_VIDEO_EXTENTIONS
-from ._ffmpeg import FFmpegCompressor
+from ._utils import SUPPORTED_VIDEO_EXTENTIONS, PROBE_SECTIONS, Something, make_stream
+from ._ffmpeg import FFmpegCompressor, run_outputs, extention_for_extracting
+from ._segments import SegmentedEncoder
+from ._matroska import save_in_place
+from ._keyframes import read_packets, keyframe_before, cut_points, size_points
 
 
 class Container:
     """A Container wraps a file that contains several multimedia 
     streams.
+
+    A container is lazy by default: only the format (the path, the
+    size, the duration and the tags) is read when it is created, the
+    streams and the chapters are read on first access. Pass
+    `lazy=False` to read everything at once. `shane.open`, `aopen` and
+    `open_many` take the same `lazy` argument. The ffprobe dicts of the
+    streams are kept in `raw` only if `keep_raw` is true.
     """
-    def __init__(self, *streams, path=None, ):
+    def __init__(self, *streams, path=None, probe=None, lazy=True, keep_raw=False):
+        self._lazy = lazy
+        self._keep_raw = keep_raw
         if path is not None:
-            self._init_from_path(path)
+            self._init_from_path(path, probe)
         else:
             self._empty_init()
-        self.streams += [s for s in streams]
+        if streams:
+            self.streams += [s for s in streams]
     
     def __repr__(self):
         path = self.path
@@ -22,28 +36,80 @@ class Container:
         duration = self.human_duration
         return f"Container(path={path}, size={size}, duration={duration})"
 
-    def _init_from_path(self, path):
-        from ._utils import (
-            call_chapters, call_format, call_streams, make_stream
-        )
-        self._ffprobe = call_format(path)
-        self.chapters = tuple(call_chapters(path))
-        self.streams = list(map(make_stream, call_streams(path)))
+    def _init_from_path(self, path, probe=None):
+        from ._probe import probe as probe_path
+        if probe is None:
+            probe = probe_path(path, ("format",) if self._lazy else PROBE_SECTIONS)
+        self._ffprobe = probe["format"]
         self.metadata = self._ffprobe.get("tags", {})
-        for stream in self.streams:
+        self._defaults = copy.deepcopy(self._ffprobe)
+        self._probe = probe
+        # the PipeSource of a container that is read from a pipe
+        self._source = None
+        self._streams = None
+        self._chapters = None
+        self._default_streams = ()
+        if not self._lazy:
+            self._load()
+
+    def _load(self):
+        """Reads the streams and the chapters."""
+        from ._probe import probe as probe_path
+        from ._utils import make_stream
+        probe = self._probe
+        if "streams" not in probe or "chapters" not in probe:
+            probe = probe_path(self.default_path, ("streams", "chapters"))
+        self._probe = None
+        self._chapters = tuple(probe["chapters"])
+        self._streams = [make_stream(s, self._keep_raw) for s in probe["streams"]]
+        for stream in self._streams:
             stream.container = self
-        self._defaults = self._ffprobe.copy()
+        self._default_streams = tuple(self._streams)
     
     def _empty_init(self):
         self._ffprobe = {}
         self._defaults = {}
-        self.chapters = ()
-        self.streams = []
+        self._default_streams = ()
+        self._probe = None
+        self._source = None
+        self._chapters = ()
+        self._streams = []
         self.metadata = {}
         # self._defaults["default_filename"] = \
         # self._ffprobe["filename"] = \
         # self._ffprobe.get("filename")
 
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the streams and the chapters are already read."""
+        return self._streams is not None
+
+    @property
+    def streams(self) -> list:
+        """All streams in the container"""
+        if self._streams is None:
+            self._load()
+        return self._streams
+
+    @streams.setter
+    def streams(self, streams: list):
+        if self._streams is None:
+            self._load()
+        self._streams = streams
+
+    @property
+    def chapters(self) -> tuple:
+        """The chapters of the container"""
+        if self._chapters is None:
+            self._load()
+        return self._chapters
+
+    @chapters.setter
+    def chapters(self, chapters: tuple):
+        if self._chapters is None:
+            self._load()
+        self._chapters = chapters
+
     @property
     def path(self) -> str:
         """The path to the file that is wrapped by the Container"""
@@ -181,8 +247,85 @@ class Container:
         """Removes streams for which function returns true""" 
         self.streams = [s for s in self.streams if not function(s)]
 
-    # def trim(start, end, path, **settings): # TODO
-    #     pass
+    def trim(self, start, end, path, accurate=False, progress=None, **settings) -> 'Container':
+        """Writes the part from `start` to `end` seconds (to the end if
+        `end` is None) to the `path` and returns it.
+
+        Nothing is re-encoded: the part starts at the keyframe at or
+        before `start`. If `accurate` is true, the video is re-encoded
+        to start exactly at `start`. Chapters and subtitles are cut and
+        shifted with the streams."""
+        if end is not None and end <= start:
+            raise ValueError(f"The end {end} is not after the start {start}.")
+        if not accurate:
+            start = keyframe_before(self._keyframes(), start)
+        return self._write_part(start, end, path, accurate, progress, settings)
+
+    def split(self, points=None, every=None, max_bytes=None, path_template=None,
+              accurate=False, progress=None, **settings) -> list:
+        """Splits the container into parts and returns them. The parts
+        start at the `points` (in seconds), `every` seconds, or so that
+        none is larger than `max_bytes`.
+
+        The parts start at keyframes and nothing is re-encoded unless
+        the cuts are `accurate`. The paths are made of `path_template`
+        with `str.format` and the fields `name` (the file name without
+        the extention), `number` (from 1), `start` and `ext`;
+        '{name}.{number:03}{ext}' next to the container by default."""
+        if [points, every, max_bytes].count(None) != 2:
+            raise ValueError("Pass one of `points`, `every` and `max_bytes`.")
+        if max_bytes is not None:
+            if accurate:
+                raise ValueError("The size of re-encoded parts is unknown.")
+            videos = self.videos
+            # the points are keyframes already
+            points = size_points(
+                read_packets(self.default_path),
+                videos[0].index if videos else None,
+                max_bytes,
+            )
+        else:
+            duration = self.duration
+            if every is not None:
+                if every <= 0:
+                    raise ValueError("`every` must be positive.")
+                if not duration:
+                    raise ValueError(
+                        "The duration is unknown, pass `points` instead of `every`."
+                    )
+                points = [every * i for i in range(1, math.ceil(duration / every))]
+            if accurate:
+                points = sorted({
+                    p for p in points if 0 < p and (not duration or p < duration)
+                })
+            else:
+                points = cut_points(self._keyframes(), points)
+        if path_template is None:
+            path_template = os.path.join(
+                os.path.dirname(self.path), '{name}.{number:03}{ext}'
+            )
+        name, ext = os.path.splitext(os.path.basename(self.path))
+        bounds = [0] + points + [None]
+        parts = []
+        for number, (start, end) in enumerate(zip(bounds, bounds[1:]), 1):
+            path = path_template.format(name=name, number=number, start=start, ext=ext)
+            parts.append(self._write_part(start, end, path, accurate, progress, settings))
+        return parts
+
+    def _keyframes(self) -> list:
+        """The keyframe times of the first video stream."""
+        videos = self.videos
+        return videos[0].keyframes() if videos else []
+
+    def _write_part(self, start, end, path, accurate, progress, settings):
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(*self._get_all_input_files())
+        compressor.add_output_path(path)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        compressor.add_cut(start, None if end is None else end - start, accurate)
+        compressor.run()
+        return Container(path=path, keep_raw=self._keep_raw)
 
     def _get_all_input_files(self):
         if self.default_path is not None:
@@ -192,12 +335,155 @@ class Container:
              # only outer streams
             return [s for s in self.streams if not s.inner]
     
-    def save(self, **settings) -> int:
+    def plan(self, **settings):
+        """Returns what `save(**settings)` is going to do with every
+        stream and the FFmpeg command, without running anything."""
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(*self._get_all_input_files())
+        compressor.add_output_path(self.path)
+        compressor.add_settings(**settings)
+        return compressor.plan()
+
+    def save(self, progress=None, segments=None, **settings) -> int:
+        """Saves all the changes. If `progress` is passed, it is called
+        with `shane.Progress` tuples while FFmpeg runs.
+
+        If only titles, languages, tags and default or forced flags of
+        a Matroska file are changed, the file is edited in place.
+
+        If `segments` is passed, transcoded video streams are split at
+        keyframes and the parts are encoded by `segments` FFmpeg
+        processes at once. `progress` is reported only for the final
+        remux then."""
+        if not settings and save_in_place(self):
+            self._init_from_path(self.path)
+            return None
         compressor = FFmpegCompressor()
         compressor.add_input_files(*self._get_all_input_files())
         compressor.add_output_path(self.path)
         compressor.add_settings(**settings)
-        response = compressor.run()
+        compressor.add_progress(progress)
+        if segments and segments > 1:
+            with SegmentedEncoder(compressor, segments):
+                response = compressor.run()
+        else:
+            response = compressor.run()
         self._init_from_path(self.path)
         return response
 
+    def save_to(self, sink, extention=None, progress=None, **settings) -> int:
+        """Writes the container with all the changes to `sink`, a
+        writable binary file object or a callable that takes bytes,
+        without a file on disk. The format is chosen by the `extention`
+        (the container extention by default); MP4 is fragmented.
+
+        If FFmpeg fails, the sink may have got a part of the output."""
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(*self._get_all_input_files())
+        compressor.add_output_sink(sink, extention or self.extention)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        return compressor.run()
+
+    def export(self, outputs, progress=None) -> int:
+        """Writes the container to several files with one FFmpeg run,
+        so the input is read once. `outputs` maps the paths to dicts
+        of options:
+
+        - `streams`: a function that returns true for the streams to
+          keep, all the streams by default;
+        - `metadata`: the container tags to change;
+        - the settings of `save`, e.g. `crf`.
+
+        The codecs are chosen by the extention of every path. The files
+        are renamed in place only if all of them are written."""
+        compressors = []
+        for path, options in outputs.items():
+            options = dict(options or {})
+            compressor = FFmpegCompressor()
+            compressor.add_input_files(*self._get_all_input_files())
+            compressor.add_output_path(os.fspath(path))
+            streams = options.pop('streams', None)
+            if streams is not None:
+                compressor.add_stream_filter(streams)
+            compressor.add_metadata(options.pop('metadata', None) or {})
+            compressor.add_settings(**options)
+            compressors.append(compressor)
+        if not compressors:
+            raise ValueError('No outputs to export.')
+        response = run_outputs(compressors, progress)
+        if any(c.output_path == self.default_path for c in compressors):
+            self._init_from_path(self.default_path)
+        return response
+
+    def extract_streams(self, selector, path_template, progress=None, **settings) -> list:
+        """Extracts the streams for which `selector` returns true with
+        one FFmpeg run and returns them as streams.
+
+        The paths are made of the `path_template` with `str.format` and
+        the fields of every stream: `name` (the container file name
+        without the extention), `index`, `type`, `codec`, `language`,
+        `title`, `filename` (of an attachment) and `ext`, an extention
+        that keeps the codec if it can. Attachments are written as they
+        are."""
+        streams = [s for s in self.streams if s.inner and selector(s)]
+        paths = [path_template.format(**_template_fields(s)) for s in streams]
+        compressors, attachments = [], {}
+        for stream, path in zip(streams, paths):
+            if stream.is_attachment:
+                attachments[stream] = path
+                continue
+            compressor = FFmpegCompressor()
+            compressor.add_input_files(self)
+            compressor.add_output_path(path)
+            compressor.add_settings(**settings)
+            compressor.add_selected_stream(stream)
+            compressors.append(compressor)
+        if not streams:
+            return []
+        if not compressors:
+            # attachments are dumped when the input is opened
+            compressor = FFmpegCompressor()
+            compressor.add_input_files(self)
+            compressor.add_stream_filter(lambda s: False)
+            compressors.append(compressor)
+        run_outputs(compressors, progress, attachments)
+        result = []
+        for stream, path in zip(streams, paths):
+            if stream.is_attachment:
+                result.append(make_stream(dict(stream.raw, filename=path)))
+            else:
+                result.append(Something(path).as_stream())
+        return result
+
+    async def asave(self, timeout=None, progress=None, **settings) -> int:
+        """An awaitable version of `save`. FFmpeg is killed and the
+        incomplete output is removed if the call is cancelled or takes
+        more than `timeout` seconds."""
+        from ._probe import aprobe
+        if not settings and save_in_place(self):
+            self._init_from_path(self.path, await aprobe(self.path, timeout))
+            return None
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(*self._get_all_input_files())
+        compressor.add_output_path(self.path)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        response = await compressor.arun(timeout)
+        self._init_from_path(self.path, await aprobe(self.path, timeout))
+        return response
+
+
+
+def _template_fields(stream) -> dict:
+    name = os.path.basename(stream.container.default_path or '')
+    return {
+        'name': os.path.splitext(name)[0],
+        'index': stream.index,
+        'type': stream.type,
+        'codec': stream.codec,
+        'language': stream.metadata.get('language', 'und'),
+        'title': stream.metadata.get('title', ''),
+        'filename': stream.metadata.get('filename', ''),
+        'ext': extention_for_extracting(stream),
+    }
@@ -0,0 +1,155 @@
+import struct
+from collections import namedtuple
+
+
+class EBMLError(Exception):
+    pass
+
+
+Element = namedtuple('Element', ['id', 'start', 'data_start', 'size', 'end'])
+Element.__doc__ = """An EBML element found in a buffer. `start` is the
+offset of its header, `data_start` the offset of its data and `end`
+the offset right after it."""
+
+
+UNKNOWN_SIZE = None
+
+
+def read_id(buffer, pos) -> tuple:
+    """Returns the element ID at `pos` (with its marker bits) and the
+    length of the ID."""
+    first = buffer[pos]
+    length = 1
+    mask = 0x80
+    while length <= 4 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 4:
+        raise EBMLError(f'Invalid element ID at {pos}')
+    if pos + length > len(buffer):
+        raise EBMLError(f'Truncated element ID at {pos}')
+    return int.from_bytes(buffer[pos:pos + length], 'big'), length
+
+
+def read_size(buffer, pos) -> tuple:
+    """Returns the data size at `pos` (or `UNKNOWN_SIZE`) and the length
+    of the size."""
+    first = buffer[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise EBMLError(f'Invalid element size at {pos}')
+    if pos + length > len(buffer):
+        raise EBMLError(f'Truncated element size at {pos}')
+    value = first & (mask - 1)
+    for byte in buffer[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if value == (1 << (7 * length)) - 1:
+        return UNKNOWN_SIZE, length
+    return value, length
+
+
+def read_element(buffer, pos, parent_end=None) -> Element:
+    """Returns the element at `pos`. An element of unknown size ends
+    at `parent_end`."""
+    element_id, id_length = read_id(buffer, pos)
+    size, size_length = read_size(buffer, pos + id_length)
+    data_start = pos + id_length + size_length
+    if size is UNKNOWN_SIZE:
+        end = len(buffer) if parent_end is None else parent_end
+        size = end - data_start
+    return Element(element_id, pos, data_start, size, data_start + size)
+
+
+def iter_elements(buffer, start, end):
+    """Yields the elements between `start` and `end`."""
+    pos = start
+    end = min(end, len(buffer))
+    while pos < end:
+        element = read_element(buffer, pos, end)
+        if element.end > end:
+            raise EBMLError(f'The element at {pos} is out of its parent')
+        yield element
+        pos = element.end
+
+
+def children(buffer, element):
+    """Yields the children of the master `element`."""
+    return iter_elements(buffer, element.data_start, element.end)
+
+
+def read_uint(buffer, element) -> int:
+    return int.from_bytes(buffer[element.data_start:element.end], 'big')
+
+
+def read_float(buffer, element) -> float:
+    data = bytes(buffer[element.data_start:element.end])
+    if element.size == 4:
+        return struct.unpack('>f', data)[0]
+    elif element.size == 8:
+        return struct.unpack('>d', data)[0]
+    elif element.size == 0:
+        return 0.0
+    raise EBMLError(f'Invalid float size {element.size}')
+
+
+def read_string(buffer, element) -> str:
+    data = bytes(buffer[element.data_start:element.end])
+    return data.split(b'\0', 1)[0].decode('utf-8', errors='replace')
+
+
+def read_binary(buffer, element) -> bytes:
+    return bytes(buffer[element.data_start:element.end])
+
+
+def encode_id(element_id) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def encode_size(size, length=None) -> bytes:
+    """Encodes the `size` with the minimal or the given `length`."""
+    minimal = 1
+    while size >= (1 << (7 * minimal)) - 1:
+        minimal += 1
+    if length is None:
+        length = minimal
+    if length < minimal or length > 8:
+        raise EBMLError(f"Can't encode the size {size} with {length} bytes")
+    return ((1 << (7 * length)) | size).to_bytes(length, 'big')
+
+
+def encode_element(element_id, data, size_length=None) -> bytes:
+    return encode_id(element_id) + encode_size(len(data), size_length) + data
+
+
+def encode_uint(element_id, value) -> bytes:
+    length = max(1, (value.bit_length() + 7) // 8)
+    return encode_element(element_id, value.to_bytes(length, 'big'))
+
+
+def encode_string(element_id, value) -> bytes:
+    return encode_element(element_id, value.encode('utf-8'))
+
+
+VOID = 0xEC
+CRC32 = 0xBF
+
+
+def encode_void(length) -> bytes:
+    """Encodes a Void element that is exactly `length` bytes long.
+    `length` must be at least 2."""
+    if length < 2:
+        raise EBMLError(f"A Void element can't be {length} bytes long")
+    for size_length in range(1, 9):
+        data_length = length - 1 - size_length
+        if data_length < 0:
+            break
+        try:
+            header = encode_id(VOID) + encode_size(data_length, size_length)
+        except EBMLError:
+            continue
+        return header + bytes(data_length)
+    raise EBMLError(f"Can't encode a Void element of {length} bytes")
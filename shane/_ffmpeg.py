@@ -1,5 +1,9 @@
 import subprocess as sp
 import os
+import shutil
+import threading
+from collections import namedtuple, OrderedDict
+from ._capabilities import get_capabilities, capabilities_generation, CODEC_ALIASES
 from ._utils import (    
     FFMPEG_COMMAND,
 
@@ -43,24 +47,219 @@ def codec_if_convert_to_extention(stream, extention):
         possible_extentions = (
             SUPPORTED_VIDEO_EXTENTIONS + SUPPORTED_SUBTITLE_EXTENTIONS
         )
+    else:
+        raise ValueError(f"Can't convert the {stream.type} stream '{stream.codec}'")
     for possible_extention in possible_extentions:
         if possible_extention == extention:
             if stream.codec in supported_codecs[extention]:
                 return 'copy'
             else:
-                return supported_codecs[extention][0]
+                return get_capabilities().encoder_for(supported_codecs[extention][0])
     raise ValueError(f"Can't return codec for the extention '{extention}'")
 
 
+def extention_for_extracting(stream):
+    """The extention of the stream's own type that keeps its codec,
+    '.mkv' if there is none. An attachment keeps its file extention."""
+    if stream.is_attachment:
+        return os.path.splitext(stream.metadata.get('filename', ''))[-1]
+    if stream.is_video:
+        extentions, codecs = SUPPORTED_VIDEO_EXTENTIONS, CONTAINERS_VCODECS
+    elif stream.is_audio:
+        extentions, codecs = SUPPORTED_AUDIO_EXTENTIONS, CONTAINERS_ACODECS
+    elif stream.is_subtitle:
+        extentions, codecs = SUPPORTED_SUBTITLE_EXTENTIONS, CONTAINERS_SCODECS
+    else:
+        raise ValueError(f"Can't extract the {stream.type} stream '{stream.codec}'")
+    for extention in extentions:
+        if stream.codec in codecs[extention]:
+            return extention
+    return '.mkv'
+
+
 
 class FFmpegCompressorError(Exception):
     pass
 
 
+# muxers that write to a pipe, by the output extention
+PIPE_FORMATS = {
+    '.mkv': ['-f', 'matroska'],
+    '.mp4': ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+    '.m4v': ['-f', 'ipod', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+    '.aac': ['-f', 'adts'],
+    '.ac3': ['-f', 'ac3'],
+    '.srt': ['-f', 'srt'],
+}
+
+PIPE_CHUNK_SIZE = 1024 ** 2
+
+
+Progress = namedtuple('Progress', [
+    'out_time', 'frames', 'fps', 'speed', 'bitrate', 'total_size',
+    'percent', 'done',
+])
+Progress.__doc__ = """The state of a running FFmpeg process. `out_time`
+is in seconds, `bitrate` in bits per second, `total_size` in bytes.
+`percent` is None if the duration of the input is unknown."""
+
+
+class ProgressParser:
+    """Turns the lines of FFmpeg's `-progress` output into `Progress`
+    tuples."""
+    def __init__(self, duration=None):
+        self.duration = duration
+        self._block = {}
+
+    def feed(self, line):
+        """Returns a `Progress` when the `line` completes a block."""
+        key, _, value = line.strip().partition('=')
+        if not key:
+            return None
+        self._block[key] = value
+        if key != 'progress':
+            return None
+        block, self._block = self._block, {}
+        return self._make_progress(block)
+
+    def _make_progress(self, block):
+        out_time = _number(block.get('out_time_us'), int)
+        out_time = out_time / 1000000 if out_time is not None else None
+        bitrate = _number(block.get('bitrate', '').replace('kbits/s', ''))
+        speed = _number(block.get('speed', '').rstrip('x'))
+        percent = None
+        if self.duration and out_time is not None:
+            percent = max(0.0, min(100.0, out_time / self.duration * 100))
+        done = block['progress'] == 'end'
+        if done and self.duration:
+            percent = 100.0
+        return Progress(
+            out_time=out_time,
+            frames=_number(block.get('frame'), int),
+            fps=_number(block.get('fps')),
+            speed=speed,
+            bitrate=bitrate * 1000 if bitrate is not None else None,
+            total_size=_number(block.get('total_size'), int),
+            percent=percent,
+            done=done,
+        )
+
+
+def _number(value, type_=float):
+    try:
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+
+StreamPlan = namedtuple('StreamPlan', [
+    'stream', 'input', 'output', 'action', 'codec', 'reason',
+])
+StreamPlan.__doc__ = """What happens to a stream on saving. `input` is
+the FFmpeg input specifier, `output` is the output stream index (None
+for dropped streams), `action` is 'copy', 'transcode' or 'drop'."""
+
+
+class Plan:
+    """What `save` is going to do: a `StreamPlan` for every stream and
+    the FFmpeg command. Nothing is run to create it."""
+    def __init__(self, streams, command):
+        self.streams = streams
+        self.command = command
+
+    def __repr__(self):
+        return f"Plan(cost={self.cost}, streams={len(self.streams)})"
+
+    @property
+    def transcoded(self) -> tuple:
+        """Plans of the streams that are transcoded."""
+        return tuple(s for s in self.streams if s.action == 'transcode')
+
+    @property
+    def cost(self) -> str:
+        """'remux' if all the streams are copied, 'video-transcode' if
+        a video stream is transcoded and 'transcode' otherwise."""
+        if any(s.stream.is_video for s in self.transcoded):
+            return 'video-transcode'
+        elif self.transcoded:
+            return 'transcode'
+        else:
+            return 'remux'
+
+
+StreamMapping = namedtuple('StreamMapping', [
+    'streams', 'outputs', 'inputs', 'replacements', 'attachments',
+])
+StreamMapping.__doc__ = """Where the streams go, built once for a
+command: the output `streams` in order, their `outputs` and `inputs`
+specifier indexes and the input indexes of the `replacements` by
+stream, and the `attachments` that are kept."""
+
+
+Cut = namedtuple('Cut', ['start', 'duration', 'accurate'])
+Cut.__doc__ = """The part of the inputs that is written: from `start`
+for `duration` seconds (to the end if None). The video is re-encoded
+only if the cut is frame `accurate`."""
+
+
+# compiled output commands by stream layout
+COMPILED_COMMANDS_SIZE = 256
+_compiled_commands = OrderedDict()
+_compiled_commands_lock = threading.Lock()
+
+StreamTags = namedtuple('StreamTags', ['number', 'outputs'])
+StreamTags.__doc__ = """The tags of the streams of the input file
+`number` in a compiled command. `outputs` are `(position, output index)`
+pairs of the streams that are mapped."""
+
+ContainerTags = namedtuple('ContainerTags', ['number'])
+ContainerTags.__doc__ = """The tags of the input container `number` in
+a compiled command."""
+
+
+class CompiledCommand:
+    """The output options of a command for a stream layout. The options
+    that depend only on the layout (codecs, maps, frame rates, sizes)
+    are kept; the tags are filled in from the files of every command,
+    so files with the same layout share it."""
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __repr__(self):
+        return f"CompiledCommand(parts={len(self.parts)})"
+
+    def fill(self, compressor) -> list:
+        """The output options for the input files of `compressor`."""
+        commands = []
+        for part in self.parts:
+            if isinstance(part, StreamTags):
+                streams = compressor._input_streams(compressor.input_files[part.number])
+                for position, output in part.outputs:
+                    commands += _tags_commands(streams[position].metadata, f':s:{output}')
+            elif isinstance(part, ContainerTags):
+                commands += compressor.command_metadata(compressor.input_files[part.number])
+            else:
+                commands += part
+        return commands
+
+
 class FFmpegCompressor:
     def __init__(self):
         self.input_files = None
+        self.selected_streams = None
+        # a function that chooses the streams of the output
+        self.stream_filter = None
+        # container tags of the output on top of the input ones
+        self.metadata = {}
+        # attachment stream -> path it is dumped to
+        self.attachment_dumps = {}
+        self.cut = None
         self.settings = {}
+        self.progress = None
+        # stream -> path of the file that replaces it
+        self.replacements = {}
+        self.sink = None
+        self.sink_extention = None
         # one inner list for one input file
         self.input_paths = []
         self.input_commands = [] 
@@ -73,6 +272,7 @@ class FFmpegCompressor:
             self.command_codec,
             self.command_map,
             self.command_metadata,
+            self.command_disposition,
             # only video
             self.command_fps,
             self.command_frame_size,
@@ -84,10 +284,16 @@ class FFmpegCompressor:
         self.global_commands_functions = [
             self.command_crf,
         ]
+        # commands that depend on the tags, filled in for every file
+        # of a compiled command
+        self.tags_commands_functions = [
+            self.command_metadata,
+        ]
+        self._mapping = None
 
     @property
     def output_path_extention(self):
-        return os.path.splitext(self.output_path)[-1]
+        return self._get_output_extention()
     
     @property
     def command_without_output_path(self):
@@ -96,12 +302,15 @@ class FFmpegCompressor:
         for i in range(len(self.input_paths)):
             cmd += self.input_commands[i]
             cmd += self.input_paths[i]
+        for path in self.replacements.values():
+            cmd += ['-i', path]
         cmd += self.output_commands
         # cmd += [self.output_path]
         return cmd
 
     def add_input_files(self, *input_files):
         self.input_files = list(input_files)
+        self._mapping = None
 
     def _generate_common_command(self):
         if self.input_files is None:
@@ -115,10 +324,78 @@ class FFmpegCompressor:
             self.input_commands.append(
                 list(self._generate_input_commands(input_file))
             )
-            self.output_commands.extend(
-                list(self._generate_output_commands(input_file))
-            )
+        self.output_commands.extend(self._compiled_command().fill(self))
+        if self.cut is not None:
+            if self.cut.duration is not None:
+                self.output_commands += ['-t', str(self.cut.duration)]
+            self.output_commands += ['-avoid_negative_ts', 'make_zero']
         return self.command_without_output_path
+
+    def _compiled_command(self) -> CompiledCommand:
+        """The compiled output commands. They are shared by the
+        commands for files with the same stream layout."""
+        key = self._layout_key()
+        if key is None:
+            return self._compile()
+        with _compiled_commands_lock:
+            compiled = _compiled_commands.get(key)
+            if compiled is not None:
+                _compiled_commands.move_to_end(key)
+                return compiled
+        compiled = self._compile()
+        with _compiled_commands_lock:
+            _compiled_commands[key] = compiled
+            while len(_compiled_commands) > COMPILED_COMMANDS_SIZE:
+                _compiled_commands.popitem(last=False)
+        return compiled
+
+    def _compile(self) -> CompiledCommand:
+        parts = []
+        for number, input_file in enumerate(self.input_files):
+            streams = self._input_streams(input_file)
+            for function in self.stream_commands_functions:
+                if function in self.tags_commands_functions:
+                    parts.append(StreamTags(number, [
+                        (position, self._get_output_specifier_index_for(x))
+                        for position, x in enumerate(streams)
+                        if not x.is_attachment or self._keep_attachment(x)
+                    ]))
+                else:
+                    parts.append([c for x in streams for c in function(x)])
+            if input_file.is_container:
+                for function in self.container_commands_functions:
+                    if function in self.tags_commands_functions:
+                        parts.append(ContainerTags(number))
+                    else:
+                        parts.append(list(function(input_file)))
+                for function in self.global_commands_functions:
+                    parts.append(list(function()))
+        return CompiledCommand(parts)
+
+    def _layout_key(self):
+        """What the compiled output commands depend on besides the
+        tags, or None if they can't be shared."""
+        if self.stream_filter is not None or self.replacements \
+                or self.selected_streams is not None:
+            return None
+        files = []
+        for input_file in self.input_files:
+            if input_file.is_container:
+                streams = input_file.streams
+                extention = input_file.default_extention
+            else:
+                streams = [input_file]
+                extention = None
+            files.append((extention, tuple(
+                _stream_layout(x, input_file) for x in streams
+            )))
+        settings = tuple(sorted((k, repr(v)) for k, v in self.settings.items()))
+        accurate = self.cut is not None and self.cut.accurate
+        return (
+            # capabilities are read only if a stream is encoded
+            type(self), capabilities_generation(), self._get_output_extention(),
+            settings, accurate, tuple(files),
+        )
     
     def _generate_command_for_extracting_stream(self, stream):
         if self.input_files is None:
@@ -131,6 +408,8 @@ class FFmpegCompressor:
                 {len(self.input_files)}'
             )
         container = self.input_files[0]
+        self.selected_streams = [stream]
+        self._mapping = None
 
         self.input_paths.append(['-i', container.default_path])
         self.input_commands.append(
@@ -141,37 +420,302 @@ class FFmpegCompressor:
             )
         return self.command_without_output_path
 
+    def _generate_command(self):
+        if self.selected_streams is not None:
+            return self._generate_command_for_extracting_stream(
+                *self.selected_streams
+            )
+        return self._generate_common_command()
+
+    def plan(self) -> Plan:
+        """Returns the `Plan` of the command without running it."""
+        command = self._generate_common_command() + [self.output_path]
+        output_streams = self._stream_mapping().outputs
+        streams = []
+        for input_index, input_file in enumerate(self.input_files):
+            if input_file.is_container:
+                candidates = [s for s in input_file.streams if s.inner]
+            else:
+                candidates = [input_file]
+            for x in candidates:
+                input_specifier = f"{input_index}:{x.index}"
+                if x not in output_streams:
+                    action, codec, reason = 'drop', None, \
+                        'attachments are kept only in the same format'
+                    if self.stream_filter is not None and not self.stream_filter(x):
+                        reason = 'it is not selected'
+                elif x.is_attachment:
+                    action, codec, reason = 'copy', 'copy', \
+                        'attachments are always copied'
+                else:
+                    action, codec, reason = self._codec_decision(x)
+                output = self._get_output_specifier_index_for(x)
+                streams.append(StreamPlan(
+                    x, input_specifier, output, action, codec, reason
+                ))
+        return Plan(streams, command)
+
     def add_output_path(self, path):
+        if path is not None and str(path).startswith('pipe:'):
+            raise FFmpegCompressorError(
+                'Media read from a pipe needs a path to be saved, '
+                'or use save_to.'
+            )
         self.output_path = path
+        self._mapping = None
     
     def add_settings(self, **settings):
         self.settings = settings
 
+    def add_stream_filter(self, function):
+        """Only the streams for which `function` returns true are
+        written to the output."""
+        self.stream_filter = function
+        self._mapping = None
+
+    def add_metadata(self, metadata):
+        """Sets the container tags of the output."""
+        self.metadata = dict(metadata)
+
+    def add_cut(self, start, duration=None, accurate=False):
+        """Writes only `duration` seconds from `start`. The start must
+        be a keyframe unless the cut is `accurate`."""
+        self.cut = Cut(start, duration, accurate)
+
+    def add_selected_stream(self, stream):
+        """Only the `stream` of the input container is extracted."""
+        self.selected_streams = [stream]
+        self._mapping = None
+
+    def add_attachment_dump(self, stream, path):
+        """The attachment `stream` of an input container is written to
+        the `path` while the input is read."""
+        self.attachment_dumps[stream] = path
+
+    def add_output_sink(self, sink, extention):
+        """Writes the output to `sink`, a writable binary file object
+        or a callable that takes bytes, instead of a file. The muxer is
+        chosen by the `extention`."""
+        if extention not in PIPE_FORMATS:
+            raise FFmpegCompressorError(
+                f"The extention '{extention}' can't be written to a pipe."
+            )
+        self.sink = sink
+        self.sink_extention = extention
+        self._mapping = None
+
+    def add_replacement(self, stream, path):
+        """The first stream of the file at `path` is copied to the
+        output instead of `stream`, e.g. when it was already encoded."""
+        self.replacements[stream] = path
+        self._mapping = None
+
+    def add_progress(self, callback):
+        """`callback` is called with a `Progress` while FFmpeg runs."""
+        self.progress = callback
+
+    def _get_duration(self):
+        durations = [f.duration for f in self.input_files or [] if f.duration]
+        return max(durations) if durations else None
+
+    def _with_progress_option(self, command, url='pipe:1'):
+        return command[:1] + ['-progress', url, '-nostats'] + command[1:]
+
     def _run_command(self, command, temp_output_path):
         command.append(temp_output_path)
         # print(command)
-        response = sp.run(command)
-        if response:
-            self._remove_and_rename_path(temp_output_path, self.output_path)
+        return self._run_outputs(command, [(temp_output_path, self.output_path)])
+
+    def _run_outputs(self, command, outputs):
+        """Runs the `command` that writes the temporary paths of the
+        `(temp_path, path)` pairs in `outputs` and renames them."""
+        try:
+            if self.progress is None and self._pipe_source() is None:
+                response = sp.run(command)
+            else:
+                response = self._run_with_progress(command)
+        except BaseException:
+            # interrupted: the outputs are incomplete
+            for temp_path, _ in outputs:
+                self._remove_temp_path(temp_path)
+            raise
+        if response.returncode:
+            for temp_path, _ in outputs:
+                self._remove_temp_path(temp_path)
+            raise FFmpegCompressorError(
+                f'FFmpeg exited with the code {response.returncode}.'
+            )
+        for temp_path, path in outputs:
+            self._remove_and_rename_path(temp_path, path)
         return response
 
+    def _run_with_progress(self, command):
+        stdout = None
+        if self.progress is not None:
+            command = self._with_progress_option(command)
+            parser = ProgressParser(self._get_duration())
+            stdout = sp.PIPE
+        process, feeder = self._popen(command, stdout=stdout)
+        try:
+            for line in process.stdout or ():
+                progress = parser.feed(line.decode(errors='replace'))
+                if progress is not None:
+                    self.progress(progress)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            if process.stdout is not None:
+                process.stdout.close()
+            process.wait()
+            if feeder is not None:
+                feeder.join()
+        return sp.CompletedProcess(command, process.returncode)
+
+    def _pipe_source(self):
+        """The `PipeSource` of the input that is read from stdin."""
+        sources = [
+            f._source for f in self.input_files or []
+            if getattr(f, '_source', None) is not None
+        ]
+        if len(sources) > 1:
+            raise FFmpegCompressorError(
+                'Only one input can be read from a pipe.'
+            )
+        return sources[0] if sources else None
+
+    def _popen(self, command, **kwargs):
+        """Starts FFmpeg. If an input is read from a pipe, it is fed to
+        FFmpeg's stdin by a thread that is returned too."""
+        source = self._pipe_source()
+        if source is None:
+            return sp.Popen(command, stdin=sp.DEVNULL, **kwargs), None
+        source.check()
+        process = sp.Popen(command, stdin=sp.PIPE, **kwargs)
+        feeder = threading.Thread(
+            target=source.feed, args=(process.stdin,), daemon=True
+        )
+        feeder.start()
+        return process, feeder
+
+    async def _arun_command(self, command, temp_output_path, timeout=None):
+        from ._aio import run_process
+        if self._pipe_source() is not None:
+            raise FFmpegCompressorError(
+                "An input that is read from a pipe can't be used asynchronously."
+            )
+        command.append(temp_output_path)
+        on_line = None
+        if self.progress is not None:
+            command = self._with_progress_option(command)
+            parser = ProgressParser(self._get_duration())
+            def on_line(line):
+                progress = parser.feed(line)
+                if progress is not None:
+                    self.progress(progress)
+        try:
+            returncode, _ = await run_process(command, timeout, on_line)
+        except BaseException:
+            # cancelled or timed out: the output is incomplete
+            self._remove_temp_path(temp_output_path)
+            raise
+        if returncode:
+            self._remove_temp_path(temp_output_path)
+            raise FFmpegCompressorError(
+                f'FFmpeg exited with the code {returncode}.'
+            )
+        self._remove_and_rename_path(temp_output_path, self.output_path)
+        return returncode
+
+    def _run_to_sink(self, command):
+        """Runs the `command` with the output written to stdout and
+        pumps it to the sink in chunks."""
+        command = command + PIPE_FORMATS[self.sink_extention] + ['pipe:1']
+        write = self.sink.write if hasattr(self.sink, 'write') else self.sink
+        stderr, reader = None, None
+        if self.progress is not None:
+            # stdout is taken by the output
+            command = self._with_progress_option(command, 'pipe:2')
+            stderr = sp.PIPE
+        process, feeder = self._popen(command, stdout=sp.PIPE, stderr=stderr)
+        if stderr is not None:
+            reader = threading.Thread(
+                target=self._read_progress, args=(process.stderr,), daemon=True
+            )
+            reader.start()
+        try:
+            while True:
+                chunk = process.stdout.read(PIPE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                write(chunk)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+            if reader is not None:
+                reader.join()
+            if feeder is not None:
+                feeder.join()
+        if process.returncode:
+            raise FFmpegCompressorError(
+                f'FFmpeg exited with the code {process.returncode}.'
+            )
+        return sp.CompletedProcess(command, process.returncode)
+
+    def _read_progress(self, pipe):
+        parser = ProgressParser(self._get_duration())
+        with pipe:
+            for line in pipe:
+                progress = parser.feed(line.decode(errors='replace'))
+                if progress is not None:
+                    self.progress(progress)
+
     def run(self):
+        if self.sink is not None:
+            return self._run_to_sink(self._generate_common_command())
         self._run_command(
             self._generate_common_command(),
             self._choose_temp_path(self.output_path)
             )
 
     def extract_stream_run(self, stream):
+        if self.sink is not None:
+            return self._run_to_sink(
+                self._generate_command_for_extracting_stream(stream)
+            )
         self._run_command(
             self._generate_command_for_extracting_stream(stream),
             self._choose_temp_path(self.output_path)
             )
+
+    async def arun(self, timeout=None):
+        return await self._arun_command(
+            self._generate_common_command(),
+            self._choose_temp_path(self.output_path),
+            timeout,
+            )
+
+    async def aextract_stream_run(self, stream, timeout=None):
+        return await self._arun_command(
+            self._generate_command_for_extracting_stream(stream),
+            self._choose_temp_path(self.output_path),
+            timeout,
+            )
     
     def _remove_and_rename_path(self, temp_path, path):
         if temp_path != path:
-            os.remove(path)
-            os.rename(temp_path, path)    
+            # atomic, the original is never lost
+            os.replace(temp_path, path)
     
+    def _remove_temp_path(self, temp_path):
+        if os.path.isdir(temp_path):
+            shutil.rmtree(temp_path)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+
     def _choose_temp_path(self, default_path):
         if not os.path.exists(default_path):
             return default_path
@@ -187,6 +731,12 @@ class FFmpegCompressor:
         commands = []
         if input_file.is_container and input_file.default_extention == '.avi':
             commands += ['-fflags', '+genpts']
+        if self.cut is not None and self.cut.start:
+            # the inputs are seeked alike to stay in sync
+            commands += ['-ss', str(self.cut.start)]
+        for stream, path in self.attachment_dumps.items():
+            if stream.container is input_file:
+                commands += [f'-dump_attachment:{stream.index}', path]
         return commands
 
     def _generate_output_commands(self, input_file):
@@ -196,6 +746,8 @@ class FFmpegCompressor:
         else:
             streams = [input_file]
             container = None
+        if self.stream_filter is not None:
+            streams = [s for s in streams if self.stream_filter(s)]
         # stream commands
         for command_function in self.stream_commands_functions:
             for stream in streams:
@@ -213,16 +765,17 @@ class FFmpegCompressor:
     def command_codec(self, x):
         if x.is_attachment:
             return []
-        extention = self._get_output_extention()
-        option = f"-{x.type[0]}codec:{x.index}" 
-        argument = codec_if_convert_to_extention(x, extention)
-        if x.is_video and (x.with_changed_fps() or x.with_changed_frame_size()):
-            argument = x.codec
-        return [option, argument]
+        _, argument, _ = self._codec_decision(x)
+        o_s_i = self._get_output_specifier_index_for(x)
+        return [f"-codec:{o_s_i}", argument]
 
     def command_map(self, x):
         if x.is_attachment and not self._keep_attachment(x):
             return []
+        if x in self.replacements:
+            # replacements follow the input files
+            i_s_i = self._stream_mapping().replacements[x]
+            return ["-map", f"{i_s_i}:0"]
         i_s_i = self._get_input_specifier_index_for(x)
         return ["-map", f"{i_s_i}:{x.index}"]
     
@@ -233,32 +786,42 @@ class FFmpegCompressor:
             o_s_i = f':s:{self._get_output_specifier_index_for(x)}'
         else:
             o_s_i = ''
-        result = []
-        for key, value in x.metadata.items():
-            result += [f"-metadata{o_s_i}", f"{key}={value}"]
-        return result
+        metadata = x.metadata
+        if x.is_container and self.metadata:
+            metadata = {**metadata, **self.metadata}
+        return _tags_commands(metadata, o_s_i)
+    
+    def command_disposition(self, x):
+        if x.is_attachment and not self._keep_attachment(x):
+            return []
+        if not x.with_changed_disposition():
+            return []
+        o_s_i = self._get_output_specifier_index_for(x)
+        # the flags replace the ones copied from the input
+        flags = '+'.join(x.disposition) or '0'
+        return [f'-disposition:{o_s_i}', flags]
     
     def command_fps(self, x):
-        if not x.is_video:
+        if not x.is_video or x in self.replacements:
             return []
-        i_s_i = self._get_input_specifier_index_for(x)
+        o_s_i = self._get_output_specifier_index_for(x)
         if x.with_changed_fps():
-            return [f"-r:{i_s_i}:{x.index}", x.fps]
+            return [f"-r:{o_s_i}", str(x.frame_rate)]
         else:
             return []
     
     def command_frame_size(self, x):
-        if not x.is_video:
+        if not x.is_video or x in self.replacements:
             return []
-        i_s_i = self._get_input_specifier_index_for(x)
+        o_s_i = self._get_output_specifier_index_for(x)
         if x.with_changed_frame_size():
-            return [f'-s:{i_s_i}:{x.index}', f"{x.width}x{x.height}"]
+            return [f'-s:{o_s_i}', f"{x.width}x{x.height}"]
         else:
             return []
     
     def command_crf(self):
         if self.settings.get('crf'):
-            return ['-crf', self.settings['crf']]
+            return ['-crf', str(self.settings['crf'])]
         else:
             return []
     
@@ -268,45 +831,156 @@ class FFmpegCompressor:
         extention = self._get_output_extention()
         codec = codec_if_convert_to_extention(x, extention)
         if codec == 'copy':
-            codec = x.codec
+            is_hevc = CODEC_ALIASES.get(x.codec, x.codec) == 'hevc'
+        else:
+            is_hevc = get_capabilities().codec_of(codec) == 'hevc'
         is_m4v_or_mp4 = (extention == '.m4v' or extention == '.mp4')
-        is_hevc = codec in ['libx265', 'hevc']
         if is_hevc and is_m4v_or_mp4:
-            return ['-vtag', 'hvc1'] 
+            o_s_i = self._get_output_specifier_index_for(x)
+            return [f'-tag:{o_s_i}', 'hvc1']
         else:
             return []
-     
-    def _get_output_specifier_index_for(self, x):
-        o = 0
-        for input_file in self.input_files:
+
+    def _codec_decision(self, x):
+        """Returns `(action, codec, reason)` for the stream `x`: whether
+        it is copied or transcoded, the `-codec` argument and why."""
+        extention = self._get_output_extention()
+        if x in self.replacements:
+            return 'copy', 'copy', 'it is already encoded'
+        if x.is_video and self.cut is not None and self.cut.accurate:
+            return 'transcode', get_capabilities().encoder_for(x.codec), \
+                'the cut is frame accurate'
+        if x.is_video and x.with_changed_fps():
+            return 'transcode', get_capabilities().encoder_for(x.codec), \
+                'the frame rate is changed'
+        if x.is_video and x.with_changed_frame_size():
+            return 'transcode', get_capabilities().encoder_for(x.codec), \
+                'the frame size is changed'
+        codec = codec_if_convert_to_extention(x, extention)
+        if codec == 'copy':
+            return 'copy', codec, \
+                f"'{x.codec}' is supported by '{extention}'"
+        return 'transcode', codec, \
+            f"'{x.codec}' is not supported by '{extention}'"
+
+    def _stream_mapping(self) -> StreamMapping:
+        """The `StreamMapping` of the command. It is built once and
+        built again when the inputs or the output change."""
+        if self._mapping is None:
+            self._mapping = self._build_stream_mapping()
+        return self._mapping
+
+    def _build_stream_mapping(self):
+        extention = self._get_output_extention()
+        attachments = set()
+        inputs = {}
+        for i, input_file in enumerate(self.input_files):
             if input_file.is_container:
                 for stream in input_file.streams:
-                    if x == stream:
-                        return o
-                    o += 1
+                    if stream.container is input_file:
+                        inputs.setdefault(stream, i)
+                    if stream.is_attachment and input_file.default_extention == extention:
+                        attachments.add(stream)
             else:
-                if x == input_file:
-                    return o
-                o += 1
+                inputs.setdefault(input_file, i)
+        if self.selected_streams is not None:
+            streams = list(self.selected_streams)
+        else:
+            streams = [
+                s for input_file in self.input_files
+                for s in self._input_streams(input_file)
+                if not s.is_attachment or s in attachments
+            ]
+        replacements = {
+            stream: len(self.input_files) + k
+            for k, stream in enumerate(self.replacements)
+        }
+        outputs = {}
+        for o, stream in enumerate(streams):
+            outputs.setdefault(stream, o)
+        return StreamMapping(streams, outputs, inputs, replacements, attachments)
+
+    def _input_streams(self, input_file):
+        """The streams of the `input_file` that can go to the output."""
+        if input_file.is_container:
+            streams = [s for s in input_file.streams if s.inner]
+        else:
+            streams = [input_file]
+        if self.stream_filter is not None:
+            streams = [s for s in streams if self.stream_filter(s)]
+        return streams
+
+    def _output_streams(self):
+        """The streams in the order they are mapped to the output."""
+        return list(self._stream_mapping().streams)
+
+    def _get_output_specifier_index_for(self, x):
+        return self._stream_mapping().outputs.get(x)
 
     def _get_input_specifier_index_for(self, x):
-        for i, input_file in enumerate(self.input_files):
-            if input_file.is_container:
-                for stream in filter(lambda x: x.container is input_file, input_file.streams):
-                    if x == stream:
-                        return i
-            else:
-                if x == input_file:
-                    return i
+        return self._stream_mapping().inputs.get(x)
     
     def _get_output_extention(self):
+        if self.sink is not None:
+            return self.sink_extention
         return os.path.splitext(self.output_path)[-1]
 
     def _keep_attachment(self, x):
-        for c in (c for c in self.input_files if c.is_container):
-            if c.streams.index(x):
-                if c.default_extention == self.output_path_extention:
-                    return True
+        return x in self._stream_mapping().attachments
+
+
 
 
 
+def _tags_commands(metadata, specifier=''):
+    result = []
+    for key, value in metadata.items():
+        result += [f"-metadata{specifier}", f"{key}={value}"]
+    return result
+
+
+def _stream_layout(x, input_file):
+    """What the commands of the stream `x` depend on besides its tags."""
+    layout = (x.index, x.type, x.codec, x.inner, x.container is input_file)
+    if x.with_changed_disposition():
+        layout += (tuple(x.disposition),)
+    if x.is_video:
+        layout += (
+            x.frame_rate if x.with_changed_fps() else None,
+            (x.width, x.height) if x.with_changed_frame_size() else None,
+        )
+    return layout
+
+
+def run_outputs(compressors, progress=None, attachments=None):
+    """Runs the `compressors`, which have the same input files, as one
+    FFmpeg command with an output for each, so the inputs are read
+    once. `attachments` maps attachment streams of the inputs to the
+    paths they are dumped to. A compressor without an output path
+    writes nothing. The files are renamed only if all of them are
+    written."""
+    attachments = attachments or {}
+    paths = [c.output_path for c in compressors if c.output_path is not None]
+    paths = [os.path.abspath(p) for p in paths + list(attachments.values())]
+    if len(set(paths)) != len(paths):
+        raise FFmpegCompressorError('The output paths must be different.')
+    first = compressors[0]
+    first.add_progress(progress)
+    outputs = []
+    for stream, path in attachments.items():
+        temp_path = first._choose_temp_path(path)
+        first.add_attachment_dump(stream, temp_path)
+        outputs.append((temp_path, path))
+    command = first._generate_command()
+    for compressor in compressors:
+        if compressor is not first:
+            compressor._generate_command()
+            command += compressor.output_commands
+        if compressor.output_path is None:
+            # FFmpeg needs an output to read the inputs at all
+            command += ['-t', '0', '-f', 'null', '-']
+            continue
+        temp_path = compressor._choose_temp_path(compressor.output_path)
+        command.append(temp_path)
+        outputs.append((temp_path, compressor.output_path))
+    return first._run_outputs(command, outputs)
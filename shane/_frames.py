@@ -0,0 +1,96 @@
+import os
+import itertools
+import subprocess as sp
+
+from ._utils import FFMPEG_COMMAND, require_numpy
+
+
+# channels of a frame row by the pixel format
+PIXEL_FORMATS = {'rgb24': 3, 'gray': 1, 'yuv420p': 1}
+
+
+def frame_shape(width, height, pix_fmt) -> tuple:
+    """The `(H, W, C)` shape of a raw frame. The planes of a `yuv420p`
+    frame are stacked: `H * 3 / 2` rows of one channel."""
+    if pix_fmt not in PIXEL_FORMATS:
+        raise ValueError(
+            f"The pixel format must be one of {', '.join(PIXEL_FORMATS)}."
+        )
+    if pix_fmt == 'yuv420p':
+        if width % 2 or height % 2:
+            raise ValueError('The yuv420p frame size must be even.')
+        return (height * 3 // 2, width, 1)
+    return (height, width, PIXEL_FORMATS[pix_fmt])
+
+
+def frames_command(path, index, pix_fmt, size=None, fps=None) -> list:
+    """The FFmpeg command that writes the raw frames of the stream
+    `index` to stdout, scaled to `size` and converted to `fps`."""
+    filters = []
+    if fps is not None:
+        filters.append(f'fps={fps}')
+    if size is not None:
+        filters.append(f'scale={size[0]}:{size[1]}')
+    # the frames keep the coded size the buffers are made for, FFmpeg
+    # would turn a rotated video by default
+    command = FFMPEG_COMMAND + [
+        '-noautorotate', '-i', os.fspath(path), '-map', f'0:{index}',
+    ]
+    if filters:
+        command += ['-vf', ','.join(filters)]
+    return command + ['-f', 'rawvideo', '-pix_fmt', pix_fmt, 'pipe:1']
+
+
+def read_frames(path, index, width, height, batch=1, pix_fmt='rgb24',
+                size=None, fps=None, buffers=2):
+    """Returns a generator of `(N, H, W, C)` uint8 arrays of `batch`
+    frames, the last one may be shorter. The frames are not rotated by
+    the display matrix of the stream. The frames are read into a
+    ring of `buffers` preallocated arrays, so an array is overwritten
+    `buffers` batches later: copy it to keep it."""
+    np = require_numpy()
+    if batch < 1 or buffers < 1:
+        raise ValueError('The batch and the number of buffers must be positive.')
+    if size is not None:
+        width, height = size
+        if not all(isinstance(x, int) and x > 0 for x in size):
+            raise ValueError('The size must be two positive integers.')
+    shape = frame_shape(width, height, pix_fmt)
+    ring = [np.empty((batch,) + shape, dtype=np.uint8) for _ in range(buffers)]
+    command = frames_command(path, index, pix_fmt, size, fps)
+    return _generate_frames(command, ring)
+
+
+def _generate_frames(command, ring):
+    frame_size = ring[0][0].nbytes
+    # unbuffered: readinto goes straight into the arrays
+    process = sp.Popen(command, stdout=sp.PIPE, stdin=sp.DEVNULL, bufsize=0)
+    try:
+        for k in itertools.count():
+            buffer = ring[k % len(ring)]
+            filled = _fill(process.stdout, memoryview(buffer).cast('B'))
+            frames = filled // frame_size
+            if frames:
+                yield buffer[:frames]
+            if filled < buffer.nbytes:
+                break
+        process.stdout.close()
+        if process.wait():
+            raise sp.CalledProcessError(process.returncode, command)
+    finally:
+        if process.poll() is None:
+            # the generator is closed early
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def _fill(pipe, view) -> int:
+    """Reads into `view` until it is full or the pipe ends."""
+    filled = 0
+    while filled < len(view):
+        read = pipe.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    return filled
@@ -0,0 +1,104 @@
+import bisect
+import subprocess as sp
+from collections import namedtuple
+
+from ._utils import FFPROBE
+
+
+Packet = namedtuple('Packet', ['stream', 'time', 'size', 'key'])
+Packet.__doc__ = """A packet of the file: the index of its `stream`,
+its presentation `time` in seconds (None if unknown), its `size` in
+bytes and whether it is a `key` frame."""
+
+# the part of a size limit that is left for the container overhead
+SIZE_MARGIN = 0.02
+
+
+def read_packets(path, index=None):
+    """Yields the `Packet`s of the file at `path` in the file order,
+    or of the stream `index` only. Nothing is decoded."""
+    command = [FFPROBE, '-loglevel', 'quiet']
+    if index is not None:
+        command += ['-select_streams', str(index)]
+    command += [
+        '-show_entries', 'packet=stream_index,pts_time,size,flags',
+        '-of', 'csv=p=0', '-i', path,
+    ]
+    process = sp.Popen(
+        command, stdout=sp.PIPE, stdin=sp.DEVNULL, universal_newlines=True
+    )
+    try:
+        for line in process.stdout:
+            packet = parse_packet(line)
+            if packet is not None:
+                yield packet
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def parse_packet(line):
+    """Parses a `stream_index,pts_time,size,flags` csv line."""
+    fields = line.strip().split(',')
+    if len(fields) < 4:
+        return None
+    try:
+        stream, size = int(fields[0]), int(fields[2])
+    except ValueError:
+        return None
+    try:
+        time = float(fields[1])
+    except ValueError:
+        time = None
+    return Packet(stream, time, size, 'K' in fields[3])
+
+
+def keyframe_times(path, index) -> list:
+    """The sorted times of the keyframes of the stream `index`."""
+    return sorted(
+        p.time for p in read_packets(path, index)
+        if p.key and p.time is not None
+    )
+
+
+def keyframe_before(keyframes, time) -> float:
+    """The last keyframe at or before `time`, the first one if there
+    is none."""
+    i = bisect.bisect_right(keyframes, time + 1e-6)
+    return keyframes[max(i - 1, 0)] if keyframes else time
+
+
+def cut_points(keyframes, points) -> list:
+    """The `points` moved back to keyframes, sorted and without
+    duplicates or the start of the file."""
+    start = keyframes[0] if keyframes else 0
+    moved = {keyframe_before(keyframes, p) for p in points}
+    return sorted(p for p in moved if p > start)
+
+
+def size_points(packets, video_index, max_bytes) -> list:
+    """The keyframe times of the stream `video_index` (of any stream if
+    None) that split the `packets` into parts of at most `max_bytes`.
+    Raises `ValueError` if a part can't be that small without
+    re-encoding."""
+    budget = max_bytes * (1 - SIZE_MARGIN)
+    points = []
+    # (time, bytes before it) of the keyframes of the current part
+    keyframes = []
+    total = start_bytes = 0
+    for packet in packets:
+        is_cut = video_index is None or packet.stream == video_index
+        if is_cut and packet.key and packet.time is not None:
+            keyframes.append((packet.time, total))
+        total += packet.size
+        if total - start_bytes > budget:
+            cuts = [k for k in keyframes if k[1] > start_bytes]
+            if not cuts:
+                raise ValueError(
+                    f"A keyframe interval is larger than {max_bytes} bytes."
+                )
+            time, start_bytes = cuts[-1]
+            points.append(time)
+            keyframes = [cuts[-1]]
+    return points
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ._cache import ProbeCache
+from ._utils import Something, make_stream
+
+
+# extentions of the files that are scanned by default
+MEDIA_EXTENTIONS = [
+    ".mkv", ".mka", ".mks", ".mp4", ".m4v", ".m4a", ".mov", ".avi",
+    ".webm", ".ts", ".m2ts", ".mpg", ".wmv", ".flv",
+    ".aac", ".ac3", ".dts", ".flac", ".mp3", ".ogg", ".opus", ".wav",
+    ".srt", ".ass", ".ssa", ".vtt", ".sup",
+]
+
+FILE_COLUMNS = [
+    "path", "extention", "format_name", "size", "duration", "bit_rate",
+    "nb_streams", "title",
+]
+
+STREAM_COLUMNS = [
+    "position", "codec", "type", "language", "title", "is_default",
+    "is_forced", "width", "height", "fps", "channels", "sample_rate",
+    "duration", "bit_rate",
+]
+
+
+class LibraryError(Exception):
+    pass
+
+
+class Library:
+    """An index of the media files under `root`.
+
+    `scan()` probes the files and stores their containers and streams
+    in the SQLite database at `db` (`root/.shane.db` by default). Only
+    new and changed files are probed again, deleted files are removed
+    from the index. Queries return streams and containers built from
+    the stored probes, as they were at the last scan.
+    """
+    def __init__(self, root, db=None, extentions=MEDIA_EXTENTIONS, workers=8):
+        self.root = os.fspath(root)
+        self.db = db if db is not None else os.path.join(self.root, ".shane.db")
+        self.extentions = {e.lower() for e in extentions}
+        self.workers = workers
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.db, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE, device INTEGER, "
+            "inode INTEGER, mtime_ns INTEGER, extention TEXT, "
+            "format_name TEXT, size INTEGER, duration REAL, bit_rate INTEGER, "
+            "nb_streams INTEGER, title TEXT, probe TEXT, scanned REAL);"
+            "CREATE TABLE IF NOT EXISTS streams ("
+            "file_id INTEGER REFERENCES files (id) ON DELETE CASCADE, "
+            "position INTEGER, codec TEXT, type TEXT, language TEXT, "
+            "title TEXT, is_default INTEGER, is_forced INTEGER, "
+            "width INTEGER, height INTEGER, fps REAL, channels INTEGER, "
+            "sample_rate REAL, duration REAL, bit_rate INTEGER);"
+            "CREATE INDEX IF NOT EXISTS files_extention ON files (extention);"
+            "CREATE INDEX IF NOT EXISTS streams_file ON streams (file_id);"
+            "CREATE INDEX IF NOT EXISTS streams_codec ON streams (codec);"
+            "CREATE INDEX IF NOT EXISTS streams_language "
+            "ON streams (type, language);"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"Library(root={self.root}, files={len(self)})"
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM files"
+            ).fetchone()[0]
+
+    def paths(self) -> list:
+        """The paths of all the indexed files."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path FROM files ORDER BY path"
+            ).fetchall()
+        return [path for path, in rows]
+
+    def scan(self) -> dict:
+        """Updates the index. Returns the number of the added, updated,
+        moved, removed, unchanged and failed files. The exceptions of
+        the failed files are stored in `errors`."""
+        with self._lock:
+            known = {
+                row[0]: row[1:] for row in self._connection.execute(
+                    "SELECT path, device, inode, size, mtime_ns FROM files"
+                )
+            }
+        found = {}
+        for path in self._walk():
+            try:
+                found[path] = ProbeCache.key(path)
+            except OSError:
+                continue
+        counts = dict.fromkeys(
+            ["added", "updated", "moved", "removed", "unchanged", "failed"], 0
+        )
+        changed = [p for p, key in found.items() if known.get(p) != key]
+        counts["unchanged"] = len(found) - len(changed)
+        gone = {known[p]: p for p in known if p not in found}
+        # a moved file keeps its identity, there is no need to probe it
+        moved = {p: gone.pop(found[p]) for p in changed if found[p] in gone}
+        self.errors = {}
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for path, old_path in moved.items():
+                    self._connection.execute(
+                        "DELETE FROM files WHERE path = ?", (path,)
+                    )
+                    self._connection.execute(
+                        "UPDATE files SET path = ?, extention = ? WHERE path = ?",
+                        (path, _extention(path), old_path)
+                    )
+                self._connection.executemany(
+                    "DELETE FROM files WHERE path = ?", [(p,) for p in gone.values()]
+                )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        counts["moved"] = len(moved)
+        counts["removed"] = len(gone)
+        for path, key, probe, exception in self._probe_all(
+            [(p, found[p]) for p in changed if p not in moved]
+        ):
+            if exception is not None:
+                self.errors[path] = exception
+                counts["failed"] += 1
+                continue
+            self._store(path, key, probe)
+            counts["updated" if path in known else "added"] += 1
+        return counts
+
+    def _walk(self):
+        db = os.path.abspath(self.db)
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if _extention(path) in self.extentions and \
+                        os.path.abspath(path) != db:
+                    yield path
+
+    def _probe_all(self, paths):
+        """Yields `(path, key, probe, exception)` of the `paths`, probed
+        in a pool of threads."""
+        from ._probe import probe as probe_path
+
+        def task(path, key):
+            probe = probe_path(path)
+            # don't store a probe of a file that changed while probing
+            if ProbeCache.key(path) != key:
+                raise LibraryError(f"The file '{path}' changed while probing.")
+            return probe
+
+        if not paths:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(task, path, key): (path, key)
+                for path, key in paths
+            }
+            for future in as_completed(futures):
+                path, key = futures[future]
+                try:
+                    yield path, key, future.result(), None
+                except Exception as e:
+                    yield path, key, None, e
+
+    def _store(self, path, key, probe):
+        format = probe["format"]
+        device, inode, size, mtime_ns = key
+        tags = format.get("tags", {})
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+                file_id = self._connection.execute(
+                    "INSERT INTO files (path, device, inode, mtime_ns, "
+                    "extention, format_name, size, duration, bit_rate, "
+                    "nb_streams, title, probe, scanned) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, device, inode, mtime_ns, _extention(path),
+                    format.get("format_name"), size,
+                    _number(float, format.get("duration")),
+                    _number(int, format.get("bit_rate")),
+                    len(probe["streams"]), tags.get("title"),
+                    json.dumps(probe), time.time())
+                ).lastrowid
+                self._connection.executemany(
+                    "INSERT INTO streams VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(file_id, *_stream_row(position, raw))
+                    for position, raw in enumerate(probe["streams"])]
+                )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def find(self, has=None, lacks=None, **fields) -> list:
+        """Returns the media files whose fields (`extention`, `codec`
+        and the other `FILE_COLUMNS`) match `fields`, that have a
+        stream matching every dict in `has` and have no stream matching
+        any dict in `lacks`. The dicts map `STREAM_COLUMNS` to values.
+        A list, a tuple or a set of values matches any of them.
+
+        >>> library.find(extention=".mkv", has={"codec": "hevc"})
+        >>> library.find(has={"type": "audio"},
+        ...              lacks={"type": "audio", "language": "eng"})
+        """
+        where, params = [], []
+        for column, value in fields.items():
+            _check_column(column, FILE_COLUMNS)
+            condition, values = _condition(f"files.{column}", value)
+            where.append(condition)
+            params.extend(values)
+        for exists, conditions in (("EXISTS", has), ("NOT EXISTS", lacks)):
+            if isinstance(conditions, dict):
+                conditions = [conditions]
+            for stream in conditions or []:
+                subquery = ["streams.file_id = files.id"]
+                for column, value in stream.items():
+                    _check_column(column, STREAM_COLUMNS)
+                    condition, values = _condition(f"streams.{column}", value)
+                    subquery.append(condition)
+                    params.extend(values)
+                where.append(
+                    f"{exists} (SELECT 1 FROM streams WHERE " +
+                    " AND ".join(subquery) + ")"
+                )
+        return self.query(" AND ".join(where) or "1", params)
+
+    def query(self, where, params=()) -> list:
+        """Returns the media files that match the SQL `where` clause.
+        It can use the columns of the `files` table and subqueries on
+        the `streams` table."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT path, probe FROM files WHERE {where} ORDER BY path",
+                params
+            ).fetchall()
+        return [_media(path, json.loads(probe)) for path, probe in rows]
+
+    def close(self):
+        self._connection.close()
+
+
+def _extention(path):
+    return os.path.splitext(path)[-1].lower()
+
+
+def _number(cast, value):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _check_column(column, columns):
+    if column not in columns:
+        raise LibraryError(f"The column '{column}' is unknown.")
+
+
+def _condition(column, value):
+    if value is None:
+        return f"{column} IS NULL", []
+    if isinstance(value, (list, tuple, set, frozenset)):
+        value = list(value)
+        return f"{column} IN ({', '.join('?' * len(value))})", value
+    return f"{column} = ?", [value]
+
+
+def _stream_row(position, raw):
+    try:
+        stream = make_stream(raw)
+    except ValueError:
+        # an unknown stream type
+        return (position, raw.get("codec_name"), raw.get("codec_type")) + \
+            (None,) * (len(STREAM_COLUMNS) - 3)
+    fps = getattr(stream, "fps", None)
+    return (
+        position, stream.codec, stream.type,
+        stream.metadata.get("language"), stream.metadata.get("title"),
+        int(stream.is_default), int(stream.disposition.get("forced", 0) == 1),
+        getattr(stream, "width", None), getattr(stream, "height", None),
+        float(fps) if fps else None, getattr(stream, "channels", None),
+        getattr(stream, "sample_rate", None), stream.duration, stream.bitrate,
+    )
+
+
+def _media(path, probe):
+    """Makes a stream or a container from a stored probe, as `open`
+    does."""
+    from ._container import Container
+    probe["format"]["filename"] = path
+    if len(probe["streams"]) == 1:
+        return Something(path, probe).as_stream()
+    return Container(path=path, probe=probe)
@@ -0,0 +1,501 @@
+import os
+import mmap
+import zlib
+
+from ._ebml import (
+    EBMLError,
+    CRC32,
+    VOID,
+    children,
+    encode_element,
+    encode_id,
+    encode_size,
+    encode_string,
+    encode_uint,
+    encode_void,
+    iter_elements,
+    read_element,
+    read_string,
+    read_uint,
+)
+
+
+MATROSKA_EXTENTIONS = [".mkv", ".mka", ".mks", ".webm"]
+
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TITLE = 0x7BA9
+MUXING_APP = 0x4D80
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+FLAG_DEFAULT = 0x88
+FLAG_FORCED = 0x55AA
+DEFAULT_DURATION = 0x23E383
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+CLUSTER = 0x1F43B675
+CHAPTERS = 0x1043A770
+EDITION_ENTRY = 0x45B9
+CHAPTER_ATOM = 0xB6
+CHAPTER_TIME_START = 0x91
+CHAPTER_TIME_END = 0x92
+CHAPTER_DISPLAY = 0x80
+CHAP_STRING = 0x85
+ATTACHMENTS = 0x1941A469
+ATTACHED_FILE = 0x61A7
+FILE_NAME = 0x466E
+FILE_MIME_TYPE = 0x4660
+FILE_DATA = 0x465C
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TARGET_TYPE_VALUE = 0x68CA
+TAG_TRACK_UID = 0x63C5
+TAG_EDITION_UID = 0x63C9
+TAG_CHAPTER_UID = 0x63C4
+TAG_ATTACHMENT_UID = 0x63C6
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_STRING = 0x4487
+
+TAG_TARGET_UIDS = (TAG_TRACK_UID, TAG_EDITION_UID, TAG_CHAPTER_UID, TAG_ATTACHMENT_UID)
+
+
+class MatroskaError(Exception):
+    pass
+
+
+def open_buffer(path):
+    """Returns a read-only memory map of the file at `path`."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise MatroskaError(f"The file '{path}' is empty.")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def find_segment(buffer):
+    """Returns the Segment element after the EBML header."""
+    for i, element in enumerate(iter_elements(buffer, 0, len(buffer))):
+        if i == 0 and element.id != EBML:
+            raise MatroskaError('Not a Matroska file.')
+        if element.id == SEGMENT:
+            return element
+    raise MatroskaError('The Segment is not found.')
+
+
+def find_level1(buffer, segment) -> dict:
+    """Returns the first Info, Tracks, Chapters, Attachments and Tags
+    elements of the `segment` by their IDs. The elements before the
+    first Cluster are read directly, the others are found through the
+    SeekHead, so the clusters are never read."""
+    found = {}
+    seek_heads = []
+    for element in iter_elements(buffer, segment.data_start, segment.end):
+        if element.id == CLUSTER:
+            break
+        if element.id == SEEK_HEAD:
+            seek_heads.append(element)
+        found.setdefault(element.id, element)
+    while seek_heads:
+        seek_head = seek_heads.pop()
+        for seek in children(buffer, seek_head):
+            if seek.id != SEEK:
+                continue
+            seek_id = position = None
+            for child in children(buffer, seek):
+                if child.id == SEEK_ID:
+                    seek_id = read_uint(buffer, child)
+                elif child.id == SEEK_POSITION:
+                    position = segment.data_start + read_uint(buffer, child)
+            if seek_id is None or position is None or seek_id in found:
+                continue
+            if seek_id == CLUSTER or position >= segment.end:
+                continue
+            element = read_element(buffer, position, segment.end)
+            if element.id != seek_id:
+                continue
+            found[seek_id] = element
+            if seek_id == SEEK_HEAD:
+                seek_heads.append(element)
+    return found
+
+
+# IN-PLACE EDITING
+
+KEEP = object()
+
+# track fields that can be changed in place: name -> (ID, default)
+TRACK_FIELDS = {
+    'language': (LANGUAGE, None),
+    'title': (NAME, None),
+    'default': (FLAG_DEFAULT, 1),
+    'forced': (FLAG_FORCED, 0),
+}
+
+
+def edit_in_place(path, title=KEEP, tracks=None, tags=None) -> bool:
+    """Changes the Matroska file at `path` without rewriting it.
+
+    `title` is the new segment title, `tracks` maps the position of a
+    track to the dict of its new 'language', 'title', 'default' and
+    'forced' values, `tags` maps the position of a track (or None for
+    global tags) to the dict of the new tag values (None removes a
+    tag). The changed elements are rewritten in their own space and the
+    Void element after them. If some of them doesn't fit, nothing is
+    written and False is returned.
+    """
+    buffer = open_buffer(path)
+    try:
+        writes = _plan_writes(buffer, title, tracks or {}, tags or {})
+    except EBMLError as e:
+        raise MatroskaError(str(e))
+    finally:
+        buffer.close()
+    if writes is None:
+        return False
+    with open(path, 'r+b') as f:
+        for offset, data in writes:
+            f.seek(offset)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def track_entries(buffer, level1):
+    tracks = level1.get(TRACKS)
+    if tracks is None:
+        return []
+    return [e for e in children(buffer, tracks) if e.id == TRACK_ENTRY]
+
+
+def _plan_writes(buffer, title, tracks, tags):
+    segment = find_segment(buffer)
+    level1 = find_level1(buffer, segment)
+    entries = track_entries(buffer, level1)
+    if any(position >= len(entries) for position in tracks):
+        return None
+    new_elements = []
+    if title is not KEEP:
+        info = level1.get(INFO)
+        if info is None:
+            return None
+        new_elements.append((info, _rebuild_info(buffer, info, title)))
+    if tracks:
+        new_elements.append((
+            level1[TRACKS],
+            _rebuild_tracks(buffer, level1[TRACKS], entries, tracks),
+        ))
+    if tags:
+        uids = {}
+        for position, entry in enumerate(entries):
+            for child in children(buffer, entry):
+                if child.id == TRACK_UID:
+                    uids[position] = read_uint(buffer, child)
+        if any(t is not None and t not in uids for t in tags):
+            return None
+        targets = {uids[t] if t is not None else None: v for t, v in tags.items()}
+        element = level1.get(TAGS)
+        if element is None:
+            return None
+        new_elements.append((element, _rebuild_tags(buffer, element, targets)))
+    writes = []
+    for element, data in new_elements:
+        data = _fit(buffer, segment, element, data)
+        if data is None:
+            return None
+        writes.append((element.start, data))
+    return writes
+
+
+def _fit(buffer, segment, element, data):
+    """Returns the bytes that replace the `element` and the Void after
+    it, or None if the new `data` of the element doesn't fit."""
+    available = element.end - element.start
+    if element.end < segment.end:
+        following = read_element(buffer, element.end, segment.end)
+        if following.id == VOID:
+            available = following.end - element.start
+    header = encode_id(element.id)
+    new = header + encode_size(len(data)) + data
+    if len(new) == available:
+        return new
+    if len(new) + 1 == available:
+        # a Void can't be 1 byte long, use a longer size instead
+        size_length = len(new) - len(header) - len(data) + 1
+        return header + encode_size(len(data), size_length) + data
+    if len(new) + 2 <= available:
+        return new + encode_void(available - len(new))
+    return None
+
+
+def _master_data(parts, had_crc):
+    data = b''.join(parts)
+    if had_crc:
+        crc = zlib.crc32(data).to_bytes(4, 'little')
+        data = encode_element(CRC32, crc) + data
+    return data
+
+
+def _raw(buffer, element):
+    return bytes(buffer[element.start:element.end])
+
+
+def _rebuild_info(buffer, info, title):
+    parts, had_crc = [], False
+    for child in children(buffer, info):
+        if child.id == CRC32:
+            had_crc = True
+        elif child.id == TITLE or child.id == VOID:
+            continue
+        else:
+            parts.append(_raw(buffer, child))
+    if title:
+        parts.append(encode_string(TITLE, title))
+    return _master_data(parts, had_crc)
+
+
+def _rebuild_tracks(buffer, tracks, entries, changes):
+    parts, had_crc = [], False
+    positions = {entry.start: i for i, entry in enumerate(entries)}
+    for child in children(buffer, tracks):
+        if child.id == CRC32:
+            had_crc = True
+        elif child.id == VOID:
+            continue
+        elif child.start in positions and positions[child.start] in changes:
+            data = _rebuild_track_entry(
+                buffer, child, changes[positions[child.start]]
+            )
+            parts.append(encode_element(TRACK_ENTRY, data))
+        else:
+            parts.append(_raw(buffer, child))
+    return _master_data(parts, had_crc)
+
+
+def _rebuild_track_entry(buffer, entry, changes):
+    ids = {TRACK_FIELDS[field][0]: field for field in changes}
+    parts, had_crc, existing = [], False, set()
+    for child in children(buffer, entry):
+        if child.id == CRC32:
+            had_crc = True
+        elif child.id == VOID:
+            continue
+        elif child.id == LANGUAGE_BCP47 and 'language' in changes:
+            # it overrides Language, so it can't be kept
+            continue
+        elif child.id in ids:
+            existing.add(ids[child.id])
+        else:
+            parts.append(_raw(buffer, child))
+    for field, value in changes.items():
+        element_id, default = TRACK_FIELDS[field]
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        if value == default and field not in existing:
+            continue
+        if isinstance(value, int):
+            parts.append(encode_uint(element_id, value))
+        else:
+            parts.append(encode_string(element_id, value))
+    return _master_data(parts, had_crc)
+
+
+def _tag_target(buffer, tag):
+    """Returns the track UID of the `tag`, None for global tags and
+    False for other targets."""
+    for child in children(buffer, tag):
+        if child.id != TARGETS:
+            continue
+        uid = None
+        for target in children(buffer, child):
+            if target.id == TAG_TRACK_UID and uid is None:
+                uid = read_uint(buffer, target)
+            elif target.id in TAG_TARGET_UIDS:
+                return False
+            elif target.id == TARGET_TYPE_VALUE and uid is None:
+                if read_uint(buffer, target) != 50:
+                    return False
+        return uid
+    return None
+
+
+def _rebuild_tags(buffer, tags, targets):
+    changes = {t: {k.upper(): (k, v) for k, v in values.items()}
+               for t, values in targets.items()}
+    written = {t: set() for t in targets}
+    parts, had_crc = [], False
+    tag_elements = []
+    for child in children(buffer, tags):
+        if child.id == CRC32:
+            had_crc = True
+        elif child.id == VOID:
+            continue
+        else:
+            tag_elements.append(child)
+    first_tags = {}
+    for tag in tag_elements:
+        if tag.id == TAG:
+            first_tags.setdefault(_tag_target(buffer, tag), tag.start)
+    for tag in tag_elements:
+        target = _tag_target(buffer, tag) if tag.id == TAG else False
+        if target is False or target not in changes:
+            parts.append(_raw(buffer, tag))
+            continue
+        tag_parts = []
+        for child in children(buffer, tag):
+            if child.id == SIMPLE_TAG:
+                name = _simple_tag_name(buffer, child)
+                if name is not None and name.upper() in changes[target]:
+                    written[target].add(name.upper())
+                    key, value = changes[target][name.upper()]
+                    if value is not None:
+                        tag_parts.append(_simple_tag(name, value))
+                    continue
+            if child.id not in (CRC32, VOID):
+                tag_parts.append(_raw(buffer, child))
+        if first_tags.get(target) == tag.start:
+            tag_parts += _missing_simple_tags(changes[target], written[target])
+        parts.append(encode_element(TAG, b''.join(tag_parts)))
+    for target in changes:
+        if target not in first_tags:
+            simple_tags = _missing_simple_tags(changes[target], written[target])
+            if simple_tags:
+                if target is None:
+                    targets_data = encode_uint(TARGET_TYPE_VALUE, 50)
+                else:
+                    targets_data = encode_uint(TAG_TRACK_UID, target)
+                parts.append(encode_element(TAG, b''.join(
+                    [encode_element(TARGETS, targets_data)] + simple_tags
+                )))
+    return _master_data(parts, had_crc)
+
+
+def _simple_tag_name(buffer, simple_tag):
+    for child in children(buffer, simple_tag):
+        if child.id == TAG_NAME:
+            return read_string(buffer, child)
+    return None
+
+
+def _simple_tag(name, value):
+    return encode_element(SIMPLE_TAG,
+        encode_string(TAG_NAME, name) + encode_string(TAG_STRING, str(value))
+    )
+
+
+def _missing_simple_tags(changes, written):
+    return [
+        _simple_tag(key.upper(), value)
+        for upper, (key, value) in changes.items()
+        if upper not in written and value is not None
+    ]
+
+
+# CONTAINERS
+
+# container tags that FFmpeg takes from other elements than Tags
+UNTAGGED_KEYS = ['encoder', 'creation_time']
+
+
+def save_in_place(container) -> bool:
+    """Saves the changes of the Matroska `container` without rewriting
+    the file, if only titles, languages, tags and default or forced
+    flags are changed and the new values fit in the file. Returns
+    whether the container was saved."""
+    if container.path is None or container.path != container.default_path:
+        return False
+    if container.extention not in MATROSKA_EXTENTIONS:
+        return False
+    # the streams of a lazy container that were never read are unchanged
+    streams = container.streams if container.is_loaded else ()
+    if container.is_loaded and tuple(streams) != container._default_streams:
+        return False
+    changes = _container_changes(container)
+    if changes is None:
+        return False
+    # a removed title is None or '', so the keys are checked
+    if 'title' not in changes and not changes['tracks'] and not changes['tags']:
+        return True
+    tracks_count = len([s for s in streams if not s.is_attachment])
+    title = changes.pop('title') if 'title' in changes else KEEP
+    try:
+        buffer = open_buffer(container.path)
+        try:
+            level1 = find_level1(buffer, find_segment(buffer))
+            if streams and len(track_entries(buffer, level1)) != tracks_count:
+                return False
+        finally:
+            buffer.close()
+        return edit_in_place(container.path, title, **changes)
+    except (EBMLError, MatroskaError):
+        # let FFmpeg deal with the file
+        return False
+
+
+def _changed(current, default):
+    """Returns the changed keys of two dicts with their new values (None
+    for removed keys)."""
+    changed = {k: v for k, v in current.items() if default.get(k) != v}
+    changed.update({k: None for k in default if k not in current})
+    return changed
+
+
+def _container_changes(container):
+    tracks, tags = {}, {}
+    result = {'tracks': tracks, 'tags': tags}
+    changed = _changed(container.metadata, container._defaults.get('tags', {}))
+    for key, value in changed.items():
+        if key in UNTAGGED_KEYS:
+            return None
+        elif key == 'title':
+            result['title'] = value
+        else:
+            tags.setdefault(None, {})[key] = value
+    position = 0
+    for stream in container.streams if container.is_loaded else ():
+        if any(name != 'disposition' for name in stream._changes or ()):
+            return None
+        metadata = _changed(stream.metadata, stream.default_metadata)
+        current, default = stream.disposition, stream.default_disposition
+        disposition = {
+            key: current.get(key, 0) for key in {**current, **default}
+            if current.get(key, 0) != default.get(key, 0)
+        }
+        if stream.is_attachment:
+            if metadata or disposition:
+                return None
+            continue
+        for key, value in metadata.items():
+            if key == 'language' and value is None:
+                return None
+            if key in ('language', 'title'):
+                tracks.setdefault(position, {})[key] = value
+            else:
+                tags.setdefault(position, {})[key] = value
+        for key, value in disposition.items():
+            if key not in ('default', 'forced') or value is None:
+                return None
+            tracks.setdefault(position, {})[key] = bool(value)
+        position += 1
+    return result
@@ -0,0 +1,551 @@
+import os
+import struct
+from fractions import Fraction
+
+from ._ebml import (
+    EBMLError,
+    children,
+    read_float,
+    read_string,
+    read_uint,
+)
+from ._matroska import (
+    MatroskaError,
+    open_buffer,
+    find_segment,
+    find_level1,
+    track_entries,
+    INFO, TIMECODE_SCALE, DURATION, TITLE, MUXING_APP,
+    TRACK_UID, TRACK_TYPE, FLAG_DEFAULT, FLAG_FORCED, DEFAULT_DURATION,
+    NAME, LANGUAGE, LANGUAGE_BCP47, CODEC_ID, VIDEO, PIXEL_WIDTH,
+    PIXEL_HEIGHT, AUDIO, SAMPLING_FREQUENCY, CHANNELS,
+    CHAPTERS, EDITION_ENTRY, CHAPTER_ATOM, CHAPTER_TIME_START,
+    CHAPTER_TIME_END, CHAPTER_DISPLAY, CHAP_STRING,
+    ATTACHMENTS, ATTACHED_FILE, FILE_NAME, FILE_MIME_TYPE,
+    TAGS, TAG, TARGETS, TAG_TRACK_UID, SIMPLE_TAG, TAG_NAME, TAG_STRING,
+    TAG_TARGET_UIDS,
+)
+
+
+class UnsupportedFile(Exception):
+    """The file can't be probed without ffprobe."""
+
+
+DISPOSITIONS = [
+    'default', 'dub', 'original', 'comment', 'lyrics', 'karaoke',
+    'forced', 'hearing_impaired', 'visual_impaired', 'clean_effects',
+    'attached_pic', 'timed_thumbnails',
+]
+
+MATROSKA_CODECS = {
+    'V_MPEG4/ISO/AVC': 'h264',
+    'V_MPEGH/ISO/HEVC': 'hevc',
+    'V_MPEG4/ISO/SP': 'mpeg4',
+    'V_MPEG4/ISO/ASP': 'mpeg4',
+    'V_MPEG2': 'mpeg2video',
+    'V_VP8': 'vp8',
+    'V_VP9': 'vp9',
+    'V_AV1': 'av1',
+    'V_THEORA': 'theora',
+    'A_AAC': 'aac',
+    'A_AC3': 'ac3',
+    'A_EAC3': 'eac3',
+    'A_DTS': 'dts',
+    'A_FLAC': 'flac',
+    'A_OPUS': 'opus',
+    'A_VORBIS': 'vorbis',
+    'A_MPEG/L3': 'mp3',
+    'A_MPEG/L2': 'mp2',
+    'A_TRUEHD': 'truehd',
+    'A_ALAC': 'alac',
+    'S_TEXT/UTF8': 'subrip',
+    'S_TEXT/ASS': 'ass',
+    'S_TEXT/SSA': 'ass',
+    'S_ASS': 'ass',
+    'S_SSA': 'ass',
+    'S_TEXT/WEBVTT': 'webvtt',
+    'S_HDMV/PGS': 'hdmv_pgs_subtitle',
+    'S_VOBSUB': 'dvd_subtitle',
+}
+
+ATTACHMENT_CODECS = {
+    'application/x-truetype-font': 'ttf',
+    'application/x-font-ttf': 'ttf',
+    'font/ttf': 'ttf',
+    'application/vnd.ms-opentype': 'otf',
+    'application/x-font-opentype': 'otf',
+    'font/otf': 'otf',
+}
+
+MATROSKA_TRACK_TYPES = {1: 'video', 2: 'audio', 17: 'subtitle'}
+
+MP4_CODECS = {
+    b'avc1': 'h264',
+    b'avc3': 'h264',
+    b'hvc1': 'hevc',
+    b'hev1': 'hevc',
+    b'mp4v': 'mpeg4',
+    b'av01': 'av1',
+    b'vp09': 'vp9',
+    b'mp4a': 'aac',
+    b'ac-3': 'ac3',
+    b'ec-3': 'eac3',
+    b'alac': 'alac',
+    b'fLaC': 'flac',
+    b'Opus': 'opus',
+    b'tx3g': 'mov_text',
+    b'wvtt': 'webvtt',
+}
+
+MP4_HANDLERS = {
+    b'vide': 'video',
+    b'soun': 'audio',
+    b'sbtl': 'subtitle',
+    b'text': 'subtitle',
+    b'subt': 'subtitle',
+}
+
+# the objectTypeIndication values of `mp4a` streams that are not AAC
+MP4A_OBJECT_TYPES = {0x69: 'mp3', 0x6B: 'mp3', 0xA5: 'ac3', 0xA6: 'eac3'}
+
+MP4_TOP_LEVEL = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pdin')
+
+
+def probe_native(path) -> dict:
+    """Returns the same `format`, `streams` and `chapters` as
+    `call_ffprobe`, reading only the headers of Matroska and MP4 files.
+    Raises `UnsupportedFile` for everything else."""
+    try:
+        buffer = open_buffer(path)
+    except (MatroskaError, ValueError, OSError) as e:
+        raise UnsupportedFile(str(e))
+    try:
+        size = len(buffer)
+        if buffer[:4] == b'\x1a\x45\xdf\xa3':
+            result = _probe_matroska(buffer)
+        elif size >= 8 and buffer[4:8] in MP4_TOP_LEVEL:
+            result = _probe_mp4(buffer)
+        else:
+            raise UnsupportedFile(f"The format of '{path}' is unknown.")
+    except (EBMLError, MatroskaError, struct.error, IndexError, KeyError) as e:
+        raise UnsupportedFile(str(e))
+    finally:
+        buffer.close()
+    format = result['format']
+    format['filename'] = os.fspath(path)
+    format['nb_streams'] = len(result['streams'])
+    format['size'] = str(size)
+    duration = float(format.get('duration') or 0)
+    if duration > 0:
+        format['bit_rate'] = str(int(size * 8 / duration))
+    return result
+
+
+def _disposition(**flags):
+    return {name: int(bool(flags.get(name))) for name in DISPOSITIONS}
+
+
+def _frame_rate(value) -> str:
+    return f"{value.numerator}/{value.denominator}"
+
+
+# MATROSKA
+
+def _probe_matroska(buffer):
+    segment = find_segment(buffer)
+    level1 = find_level1(buffer, segment)
+    format = {'format_name': 'matroska,webm', 'tags': {}}
+    timecode_scale = 1000000
+    if INFO in level1:
+        duration = None
+        for child in children(buffer, level1[INFO]):
+            if child.id == TIMECODE_SCALE:
+                timecode_scale = read_uint(buffer, child)
+            elif child.id == DURATION:
+                duration = read_float(buffer, child)
+            elif child.id == TITLE:
+                format['tags']['title'] = read_string(buffer, child)
+            elif child.id == MUXING_APP:
+                format['tags']['encoder'] = read_string(buffer, child)
+        if duration is not None:
+            format['duration'] = f"{duration * timecode_scale / 1e9:.6f}"
+    tags = _matroska_tags(buffer, level1)
+    format['tags'].update(tags.get(None, {}))
+
+    streams = []
+    for entry in track_entries(buffer, level1):
+        stream = _matroska_track(buffer, entry, tags)
+        stream['index'] = len(streams)
+        streams.append(stream)
+    for attachment in _matroska_attachments(buffer, level1):
+        attachment['index'] = len(streams)
+        streams.append(attachment)
+    duration = float(format.get('duration', 0))
+    chapters = _matroska_chapters(buffer, level1, duration)
+    return {'format': format, 'streams': streams, 'chapters': chapters}
+
+
+def _matroska_track(buffer, entry, tags):
+    values = {
+        'type': None, 'codec': None, 'uid': None, 'default': 1, 'forced': 0,
+        'language': 'eng', 'language_bcp47': None, 'name': None,
+        'default_duration': None, 'width': None, 'height': None,
+        'channels': 1, 'sample_rate': 8000.0,
+    }
+    for child in children(buffer, entry):
+        if child.id == TRACK_TYPE:
+            values['type'] = read_uint(buffer, child)
+        elif child.id == CODEC_ID:
+            values['codec'] = read_string(buffer, child)
+        elif child.id == TRACK_UID:
+            values['uid'] = read_uint(buffer, child)
+        elif child.id == FLAG_DEFAULT:
+            values['default'] = read_uint(buffer, child)
+        elif child.id == FLAG_FORCED:
+            values['forced'] = read_uint(buffer, child)
+        elif child.id == LANGUAGE:
+            values['language'] = read_string(buffer, child)
+        elif child.id == LANGUAGE_BCP47:
+            values['language_bcp47'] = read_string(buffer, child)
+        elif child.id == NAME:
+            values['name'] = read_string(buffer, child)
+        elif child.id == DEFAULT_DURATION:
+            values['default_duration'] = read_uint(buffer, child)
+        elif child.id == VIDEO:
+            for video in children(buffer, child):
+                if video.id == PIXEL_WIDTH:
+                    values['width'] = read_uint(buffer, video)
+                elif video.id == PIXEL_HEIGHT:
+                    values['height'] = read_uint(buffer, video)
+        elif child.id == AUDIO:
+            for audio in children(buffer, child):
+                if audio.id == SAMPLING_FREQUENCY:
+                    values['sample_rate'] = read_float(buffer, audio)
+                elif audio.id == CHANNELS:
+                    values['channels'] = read_uint(buffer, audio)
+    codec_type = MATROSKA_TRACK_TYPES.get(values['type'])
+    codec_name = MATROSKA_CODECS.get(values['codec'])
+    if codec_type is None or codec_name is None:
+        raise UnsupportedFile(f"The track '{values['codec']}' is unknown.")
+    stream_tags = {}
+    language = values['language_bcp47'] or values['language']
+    if language:
+        stream_tags['language'] = language
+    if values['name'] is not None:
+        stream_tags['title'] = values['name']
+    stream_tags.update(tags.get(values['uid'], {}))
+    stream = {
+        'codec_name': codec_name,
+        'codec_type': codec_type,
+        'disposition': _disposition(
+            default=values['default'], forced=values['forced']
+        ),
+        'tags': stream_tags,
+    }
+    if codec_type == 'video':
+        if not values['width'] or not values['height']:
+            raise UnsupportedFile('The frame size is unknown.')
+        stream['width'] = values['width']
+        stream['height'] = values['height']
+        if values['default_duration']:
+            fps = Fraction(10 ** 9, values['default_duration'])
+            stream['avg_frame_rate'] = _frame_rate(fps.limit_denominator(1001))
+        else:
+            stream['avg_frame_rate'] = '0/0'
+    elif codec_type == 'audio':
+        stream['channels'] = values['channels']
+        stream['sample_rate'] = str(int(values['sample_rate']))
+    return stream
+
+
+def _matroska_tags(buffer, level1) -> dict:
+    """Returns the tags by the track UIDs, None for global tags."""
+    result = {}
+    if TAGS not in level1:
+        return result
+    for tag in children(buffer, level1[TAGS]):
+        if tag.id != TAG:
+            continue
+        target, simple_tags = None, {}
+        for child in children(buffer, tag):
+            if child.id == TARGETS:
+                for uid in children(buffer, child):
+                    if uid.id == TAG_TRACK_UID:
+                        target = read_uint(buffer, uid)
+                    elif uid.id in TAG_TARGET_UIDS:
+                        target = False
+            elif child.id == SIMPLE_TAG:
+                name = value = None
+                for field in children(buffer, child):
+                    if field.id == TAG_NAME:
+                        name = read_string(buffer, field)
+                    elif field.id == TAG_STRING:
+                        value = read_string(buffer, field)
+                if name is not None and value is not None:
+                    simple_tags[name] = value
+        if target is not False:
+            result.setdefault(target, {}).update(simple_tags)
+    return result
+
+
+def _matroska_attachments(buffer, level1):
+    if ATTACHMENTS not in level1:
+        return
+    for attached_file in children(buffer, level1[ATTACHMENTS]):
+        if attached_file.id != ATTACHED_FILE:
+            continue
+        tags = {}
+        for child in children(buffer, attached_file):
+            if child.id == FILE_NAME:
+                tags['filename'] = read_string(buffer, child)
+            elif child.id == FILE_MIME_TYPE:
+                tags['mimetype'] = read_string(buffer, child)
+        codec_name = ATTACHMENT_CODECS.get(tags.get('mimetype'))
+        if codec_name is None:
+            raise UnsupportedFile(f"The attachment '{tags.get('mimetype')}' is unknown.")
+        yield {
+            'codec_name': codec_name,
+            'codec_type': 'attachment',
+            'disposition': _disposition(),
+            'tags': tags,
+        }
+
+
+def _matroska_chapters(buffer, level1, duration):
+    if CHAPTERS not in level1:
+        return []
+    edition = next(
+        (e for e in children(buffer, level1[CHAPTERS]) if e.id == EDITION_ENTRY),
+        None
+    )
+    if edition is None:
+        return []
+    atoms = []
+    for atom in children(buffer, edition):
+        if atom.id != CHAPTER_ATOM:
+            continue
+        start = end = title = None
+        for child in children(buffer, atom):
+            if child.id == CHAPTER_TIME_START:
+                start = read_uint(buffer, child) / 1e9
+            elif child.id == CHAPTER_TIME_END:
+                end = read_uint(buffer, child) / 1e9
+            elif child.id == CHAPTER_DISPLAY and title is None:
+                for display in children(buffer, child):
+                    if display.id == CHAP_STRING:
+                        title = read_string(buffer, display)
+        atoms.append([start or 0.0, end, title])
+    atoms.sort(key=lambda atom: atom[0])
+    for atom, following in zip(atoms, atoms[1:] + [None]):
+        if atom[1] is None:
+            atom[1] = following[0] if following else duration
+    return [{'title': title, 'start': start, 'end': end} for start, end, title in atoms]
+
+
+# MP4
+
+def _boxes(buffer, start, end):
+    """Yields `(type, data_start, end)` of the boxes between `start`
+    and `end`."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buffer, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buffer, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise UnsupportedFile(f"The box '{box_type}' at {pos} is broken.")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _child_boxes(buffer, start, end) -> dict:
+    result = {}
+    for box_type, data_start, box_end in _boxes(buffer, start, end):
+        result.setdefault(box_type, []).append((data_start, box_end))
+    return result
+
+
+def _box(boxes, box_type) -> tuple:
+    """The `(start, end)` of the first `box_type` child box."""
+    if box_type not in boxes:
+        raise UnsupportedFile(f"The {box_type.decode('latin-1')} box is not found.")
+    return boxes[box_type][0]
+
+
+def _probe_mp4(buffer):
+    top = _child_boxes(buffer, 0, len(buffer))
+    if b'moov' not in top:
+        raise UnsupportedFile('The moov box is not found.')
+    moov = _child_boxes(buffer, *top[b'moov'][0])
+    if b'mvex' in moov:
+        # the duration of a fragmented file is in its fragments
+        raise UnsupportedFile('Fragmented MP4 files are not supported.')
+    timescale, duration = _mp4_header(buffer, _box(moov, b'mvhd')[0])
+    if not timescale or not duration:
+        raise UnsupportedFile('The duration is unknown.')
+    format = {
+        'format_name': 'mov,mp4,m4a,3gp,3g2,mj2',
+        'duration': f"{duration / timescale:.6f}",
+        'tags': {},
+    }
+    if b'udta' in moov:
+        if b'chpl' in _child_boxes(buffer, *moov[b'udta'][0]):
+            raise UnsupportedFile('Nero chapters are not supported.')
+        title = _mp4_title(buffer, *moov[b'udta'][0])
+        if title is not None:
+            format['tags']['title'] = title
+    streams = []
+    for trak in moov.get(b'trak', []):
+        stream = _mp4_track(buffer, *trak)
+        stream['index'] = len(streams)
+        streams.append(stream)
+    return {'format': format, 'streams': streams, 'chapters': []}
+
+
+def _mp4_header(buffer, pos) -> tuple:
+    """Returns the timescale and the duration of mvhd or mdhd box."""
+    version = buffer[pos]
+    if version == 1:
+        timescale, duration = struct.unpack_from('>IQ', buffer, pos + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', buffer, pos + 12)
+    return timescale, duration
+
+
+def _mp4_language(buffer, pos) -> str:
+    version = buffer[pos]
+    offset = pos + (32 if version == 1 else 20)
+    code = struct.unpack_from('>H', buffer, offset)[0]
+    if code < 0x400:
+        # a Macintosh language code
+        return 'und'
+    return ''.join(chr(((code >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+
+
+def _mp4_track(buffer, start, end):
+    trak = _child_boxes(buffer, start, end)
+    if b'tref' in trak and b'chap' in _child_boxes(buffer, *trak[b'tref'][0]):
+        raise UnsupportedFile('QuickTime chapters are not supported.')
+    tkhd = _box(trak, b'tkhd')[0]
+    enabled = struct.unpack_from('>I', buffer, tkhd)[0] & 0x1
+    mdia = _child_boxes(buffer, *_box(trak, b'mdia'))
+    mdhd = _box(mdia, b'mdhd')[0]
+    timescale, duration = _mp4_header(buffer, mdhd)
+    hdlr, hdlr_end = _box(mdia, b'hdlr')
+    handler = bytes(buffer[hdlr + 8:hdlr + 12])
+    handler_name = bytes(buffer[hdlr + 24:hdlr_end])
+    handler_name = handler_name.split(b'\0', 1)[0].decode('utf-8', 'replace')
+    codec_type = MP4_HANDLERS.get(handler)
+    if codec_type is None:
+        raise UnsupportedFile(f"The handler '{handler}' is unknown.")
+    minf = _child_boxes(buffer, *_box(mdia, b'minf'))
+    stbl = _child_boxes(buffer, *_box(minf, b'stbl'))
+    stsd_start, stsd_end = _box(stbl, b'stsd')
+    entry = stsd_start + 8
+    entry_end = entry + struct.unpack_from('>I', buffer, entry)[0]
+    fourcc = bytes(buffer[entry + 4:entry + 8])
+    codec_name = MP4_CODECS.get(fourcc)
+    if codec_name is None:
+        raise UnsupportedFile(f"The codec '{fourcc}' is unknown.")
+    if codec_type == 'audio':
+        # QuickTime sound descriptions have more fields before boxes
+        version = struct.unpack_from('>H', buffer, entry + 16)[0]
+        if version > 1:
+            raise UnsupportedFile('The sound description is not supported.')
+        boxes_start = entry + 36 + (16 if version == 1 else 0)
+        if fourcc == b'mp4a':
+            codec_name = _mp4a_codec(buffer, boxes_start, min(entry_end, stsd_end))
+    tags = {'language': _mp4_language(buffer, mdhd)}
+    if handler_name:
+        tags['handler_name'] = handler_name
+    stream = {
+        'codec_name': codec_name,
+        'codec_type': codec_type,
+        'disposition': _disposition(default=enabled),
+        'tags': tags,
+    }
+    if timescale and duration:
+        stream['duration'] = f"{duration / timescale:.6f}"
+    if codec_type == 'video':
+        stream['width'], stream['height'] = \
+            struct.unpack_from('>HH', buffer, entry + 32)
+        stream['avg_frame_rate'] = _mp4_frame_rate(buffer, stbl, timescale)
+    elif codec_type == 'audio':
+        stream['channels'] = struct.unpack_from('>H', buffer, entry + 24)[0]
+        stream['sample_rate'] = str(struct.unpack_from('>I', buffer, entry + 32)[0] >> 16)
+    return stream
+
+
+def _mp4_frame_rate(buffer, stbl, timescale) -> str:
+    if b'stts' not in stbl or not timescale:
+        return '0/0'
+    pos = stbl[b'stts'][0][0]
+    count = struct.unpack_from('>I', buffer, pos + 4)[0]
+    frames = ticks = 0
+    for i in range(count):
+        sample_count, sample_delta = struct.unpack_from('>II', buffer, pos + 8 + 8 * i)
+        frames += sample_count
+        ticks += sample_count * sample_delta
+    if not frames or not ticks:
+        return '0/0'
+    return _frame_rate(Fraction(frames * timescale, ticks))
+
+
+def _mp4a_codec(buffer, start, end) -> str:
+    """Returns the codec of the `mp4a` sample entry by the object type
+    in its esds box."""
+    for box_type, data_start, box_end in _boxes(buffer, start, end):
+        if box_type != b'esds':
+            continue
+        data = bytes(buffer[data_start + 4:box_end])
+        tag, pos = _descriptor(data, 0)
+        if tag != 0x03:  # ES_Descriptor
+            break
+        flags = data[pos + 2]
+        pos += 3
+        if flags & 0x80:
+            pos += 2
+        if flags & 0x40:
+            pos += 1 + data[pos]
+        if flags & 0x20:
+            pos += 2
+        tag, pos = _descriptor(data, pos)
+        if tag != 0x04:  # DecoderConfigDescriptor
+            break
+        return MP4A_OBJECT_TYPES.get(data[pos], 'aac')
+    return 'aac'
+
+
+def _descriptor(data, pos) -> tuple:
+    """Returns the tag of the MPEG-4 descriptor at `pos` and the offset
+    of its content."""
+    tag = data[pos]
+    pos += 1
+    for _ in range(4):
+        pos += 1
+        if not data[pos - 1] & 0x80:
+            break
+    return tag, pos
+
+
+def _mp4_title(buffer, start, end):
+    udta = _child_boxes(buffer, start, end)
+    if b'meta' not in udta:
+        return None
+    meta_start, meta_end = udta[b'meta'][0]
+    # meta is a full box: skip version and flags
+    meta = _child_boxes(buffer, meta_start + 4, meta_end)
+    if b'ilst' not in meta:
+        return None
+    ilst = _child_boxes(buffer, *meta[b'ilst'][0])
+    if b'\xa9nam' not in ilst:
+        return None
+    item = _child_boxes(buffer, *ilst[b'\xa9nam'][0])
+    if b'data' not in item:
+        return None
+    data_start, data_end = item[b'data'][0]
+    return bytes(buffer[data_start + 8:data_end]).decode('utf-8', 'replace')
@@ -0,0 +1,316 @@
+import os
+import math
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from ._capabilities import get_capabilities
+from ._ffmpeg import FFmpegCompressor
+from ._utils import FFMPEG_COMMAND, IMAGES_CODECS
+
+
+class PackagingError(Exception):
+    pass
+
+
+# codecs that are copied into the segments, by the segment format
+COPY_VCODECS = {
+    'mpegts': {'h264', 'hevc'},
+    'fmp4': {'h264', 'hevc'},
+    'dash': {'h264', 'hevc', 'vp9', 'av1'},
+}
+COPY_ACODECS = {
+    'mpegts': {'aac', 'ac3', 'eac3', 'mp3'},
+    'fmp4': {'aac', 'ac3', 'eac3', 'mp3', 'flac', 'opus'},
+    'dash': {'aac', 'ac3', 'eac3', 'flac', 'opus'},
+}
+# subtitles that can be converted to WebVTT, bitmaps can't
+TEXT_SUBTITLE_CODECS = {'subrip', 'srt', 'ass', 'ssa', 'webvtt', 'mov_text', 'text'}
+
+SEGMENT_EXTENTIONS = {'fmp4': '.m4s', 'mpegts': '.ts'}
+MASTER_PLAYLIST = 'master.m3u8'
+DASH_MANIFEST = 'manifest.mpd'
+AUDIO_GROUP = 'audio'
+SUBTITLE_GROUP = 'subtitles'
+DASH_NAMESPACE = 'urn:mpeg:dash:schema:mpd:2011'
+
+Rendition = namedtuple('Rendition', ['name', 'type', 'stream', 'codec', 'language'])
+Rendition.__doc__ = """A stream of the package: its `name` (the
+directory or the file it is written to), its `type`, the `stream` of
+the container, the `codec` argument (`copy` if it is not re-encoded)
+and its `language`."""
+
+Package = namedtuple('Package', ['directory', 'hls', 'dash', 'renditions'])
+Package.__doc__ = """The written package: the paths of the HLS master
+playlist and the DASH manifest (None if they are not made) and the
+`Rendition`s."""
+
+
+def package(container, directory, formats=('hls',), segment_type='fmp4',
+            segment_duration=6, progress=None, **settings) -> Package:
+    """Packages the `container` for streaming into the `directory`
+    with one FFmpeg run. `formats` are 'hls' and/or 'dash'.
+
+    The first video stream is a variant, every audio language is a
+    rendition of its audio group and every text subtitle is a WebVTT
+    rendition. The streams are copied if the segments can keep their
+    codecs, so the segments start at the keyframes of the source;
+    the others are encoded with keyframes at every segment."""
+    formats = tuple(formats)
+    if not formats or set(formats) - {'hls', 'dash'}:
+        raise ValueError("The formats must be 'hls' and/or 'dash'.")
+    if segment_type not in SEGMENT_EXTENTIONS:
+        raise ValueError("The segment type must be 'fmp4' or 'mpegts'.")
+    directory = os.fspath(directory)
+    if os.path.isdir(directory) and os.listdir(directory):
+        raise PackagingError(f"The directory '{directory}' is not empty.")
+    renditions = choose_renditions(container, formats, segment_type)
+    if not any(r.type in ('video', 'audio') for r in renditions):
+        raise PackagingError('There are no video or audio streams to package.')
+    _check_muxers(formats, renditions)
+
+    inputs = container._get_all_input_files()
+    compressor = FFmpegCompressor()
+    compressor.add_input_files(*inputs)
+    compressor.add_progress(progress)
+    temp_directory = compressor._choose_temp_path(directory)
+    media = [r for r in renditions if r.type != 'subtitle']
+    os.makedirs(temp_directory, exist_ok=True)
+    if 'hls' in formats:
+        for rendition in media:
+            os.makedirs(os.path.join(temp_directory, rendition.name), exist_ok=True)
+
+    command = list(FFMPEG_COMMAND)
+    for input_file in inputs:
+        command += ['-i', input_file.default_path]
+    if 'hls' in formats:
+        command += _media_commands(inputs, media, segment_duration, settings)
+        command += hls_commands(media, temp_directory, segment_type, segment_duration)
+    if 'dash' in formats:
+        command += _media_commands(inputs, media, segment_duration, settings)
+        command += dash_commands(media, temp_directory, segment_duration)
+    subtitles = [r for r in renditions if r.type == 'subtitle']
+    for rendition in subtitles:
+        command += [
+            '-map', _map(inputs, rendition.stream), '-codec:0', 'webvtt',
+            '-f', 'webvtt', os.path.join(temp_directory, rendition.name + '.vtt'),
+        ]
+    compressor._run_outputs(command, [(temp_directory, directory)])
+
+    hls = dash = None
+    if 'hls' in formats:
+        hls = os.path.join(directory, MASTER_PLAYLIST)
+        if subtitles:
+            duration = container.duration or 0
+            for rendition in subtitles:
+                _write_text(
+                    os.path.join(directory, rendition.name + '.m3u8'),
+                    subtitle_playlist(rendition.name + '.vtt', duration),
+                )
+            _write_text(hls, add_hls_subtitles(_read_text(hls), subtitles))
+    if 'dash' in formats:
+        dash = os.path.join(directory, DASH_MANIFEST)
+        if subtitles:
+            _write_text(dash, add_dash_subtitles(_read_text(dash), subtitles))
+    return Package(directory, hls, dash, renditions)
+
+
+def choose_renditions(container, formats, segment_type='fmp4') -> list:
+    """The `Rendition`s of the `container`: the first video stream,
+    the first audio stream of every language and the text subtitles."""
+    groups = [segment_type if f == 'hls' else f for f in formats]
+    copy_vcodecs = set.intersection(*(COPY_VCODECS[g] for g in groups))
+    copy_acodecs = set.intersection(*(COPY_ACODECS[g] for g in groups))
+    renditions, names = [], set()
+
+    def add(stream, prefix, codec):
+        language = stream.metadata.get('language', 'und')
+        name = f'{prefix}_{language}' if prefix != 'video' else prefix
+        unique, i = name, 1
+        while unique in names:
+            i += 1
+            unique = f'{name}_{i}'
+        names.add(unique)
+        renditions.append(Rendition(unique, stream.type, stream, codec, language))
+
+    videos = [s for s in container.videos if s.codec not in IMAGES_CODECS]
+    if videos:
+        video = videos[0]
+        changed = video.with_changed_fps() or video.with_changed_frame_size()
+        if video.codec in copy_vcodecs and not changed:
+            codec = 'copy'
+        else:
+            codec = get_capabilities().encoder_for('h264')
+        add(video, 'video', codec)
+    languages = set()
+    for audio in container.audios:
+        language = audio.metadata.get('language', 'und')
+        if language in languages:
+            continue
+        languages.add(language)
+        if audio.codec in copy_acodecs:
+            codec = 'copy'
+        else:
+            codec = get_capabilities().encoder_for('aac')
+        add(audio, 'audio', codec)
+    for subtitle in container.subtitles:
+        if subtitle.codec in TEXT_SUBTITLE_CODECS:
+            add(subtitle, 'subtitles', 'webvtt')
+    return renditions
+
+
+def hls_commands(media, directory, segment_type, segment_duration) -> list:
+    """The options of the HLS output of the `media` renditions, which
+    are mapped in their order."""
+    has_video = any(r.type == 'video' for r in media)
+    variants = []
+    audio_index = 0
+    for rendition in media:
+        if rendition.type == 'video':
+            entry = f'v:0,agroup:{AUDIO_GROUP}' if len(media) > 1 else 'v:0'
+        else:
+            entry = f'a:{audio_index},language:{rendition.language}'
+            if has_video:
+                entry += f',agroup:{AUDIO_GROUP}'
+                entry += ',default:yes' if audio_index == 0 else ''
+            audio_index += 1
+        variants.append(f'{entry},name:{rendition.name}')
+    segment = 'segment_%05d' + SEGMENT_EXTENTIONS[segment_type]
+    commands = [
+        '-f', 'hls',
+        '-hls_time', str(segment_duration),
+        '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_type', segment_type,
+        '-hls_segment_filename', os.path.join(directory, '%v', segment),
+        '-master_pl_name', MASTER_PLAYLIST,
+        '-var_stream_map', ' '.join(variants),
+    ]
+    if segment_type == 'fmp4':
+        commands += ['-hls_fmp4_init_filename', 'init.mp4']
+    return commands + [os.path.join(directory, '%v', 'index.m3u8')]
+
+
+def dash_commands(media, directory, segment_duration) -> list:
+    """The options of the DASH output, an adaptation set for the video
+    and one for every audio language."""
+    sets = [f'id={i},streams={i}' for i in range(len(media))]
+    return [
+        '-f', 'dash',
+        '-seg_duration', str(segment_duration),
+        '-use_template', '1',
+        '-use_timeline', '1',
+        '-init_seg_name', 'dash-init-$RepresentationID$.m4s',
+        '-media_seg_name', 'dash-$RepresentationID$-$Number%05d$.m4s',
+        '-adaptation_sets', ' '.join(sets),
+        os.path.join(directory, DASH_MANIFEST),
+    ]
+
+
+def subtitle_playlist(uri, duration) -> str:
+    """A media playlist with the whole WebVTT file as one segment."""
+    return '\n'.join([
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{max(math.ceil(duration), 1)}',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        f'#EXTINF:{duration:.3f},',
+        uri,
+        '#EXT-X-ENDLIST',
+        '',
+    ])
+
+
+def add_hls_subtitles(master, subtitles) -> str:
+    """Adds the `subtitles` renditions to the text of a master
+    playlist and their group to its variants."""
+    media = [
+        f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="{SUBTITLE_GROUP}",'
+        f'NAME="{r.name}",LANGUAGE="{r.language}",AUTOSELECT=YES,'
+        f'DEFAULT=NO,URI="{r.name}.m3u8"'
+        for r in subtitles
+    ]
+    lines = []
+    for line in master.splitlines():
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            lines += media
+            media = []
+            line += f',SUBTITLES="{SUBTITLE_GROUP}"'
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def add_dash_subtitles(manifest, subtitles) -> str:
+    """Adds an adaptation set for every WebVTT file of the `subtitles`
+    to the first period of a DASH manifest."""
+    ElementTree.register_namespace('', DASH_NAMESPACE)
+    root = ElementTree.fromstring(manifest)
+    period = root.find(f'{{{DASH_NAMESPACE}}}Period')
+    if period is None:
+        raise PackagingError('The DASH manifest has no period.')
+    for rendition in subtitles:
+        adaptation = ElementTree.SubElement(period, f'{{{DASH_NAMESPACE}}}AdaptationSet', {
+            'contentType': 'text', 'mimeType': 'text/vtt', 'lang': rendition.language,
+        })
+        representation = ElementTree.SubElement(
+            adaptation, f'{{{DASH_NAMESPACE}}}Representation',
+            {'id': rendition.name, 'bandwidth': '256'},
+        )
+        ElementTree.SubElement(
+            representation, f'{{{DASH_NAMESPACE}}}BaseURL'
+        ).text = rendition.name + '.vtt'
+    return ElementTree.tostring(root, encoding='unicode', xml_declaration=True)
+
+
+def _media_commands(inputs, media, segment_duration, settings):
+    """The maps and the codecs of one packaged output."""
+    commands = []
+    for rendition in media:
+        commands += ['-map', _map(inputs, rendition.stream)]
+    for o, rendition in enumerate(media):
+        commands += [f'-codec:{o}', rendition.codec]
+        if rendition.type != 'video' or rendition.codec == 'copy':
+            continue
+        # the encoded video starts a segment at every segment time
+        commands += [
+            f'-force_key_frames:{o}', f'expr:gte(t,n_forced*{segment_duration})'
+        ]
+        stream = rendition.stream
+        if stream.with_changed_fps():
+            commands += [f'-r:{o}', str(stream.frame_rate)]
+        if stream.with_changed_frame_size():
+            commands += [f'-s:{o}', f'{stream.width}x{stream.height}']
+        if settings.get('crf'):
+            commands += ['-crf', str(settings['crf'])]
+    return commands
+
+
+def _map(inputs, stream):
+    for i, input_file in enumerate(inputs):
+        if stream.inner and stream.container is input_file:
+            return f'{i}:{stream.index}'
+        if input_file is stream:
+            return f'{i}:0'
+    raise PackagingError(f'The stream {stream} is not in the inputs.')
+
+
+def _check_muxers(formats, renditions):
+    capabilities = get_capabilities()
+    if not capabilities.muxers:
+        # nothing is known, FFmpeg will tell
+        return
+    needed = list(formats)
+    if any(r.type == 'subtitle' for r in renditions):
+        needed.append('webvtt')
+    for muxer in needed:
+        if not capabilities.has_muxer(muxer):
+            raise PackagingError(f"FFmpeg has no '{muxer}' muxer.")
+
+
+def _read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
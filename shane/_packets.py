@@ -0,0 +1,226 @@
+import os
+import time
+import math
+from array import array
+import subprocess as sp
+
+from ._utils import FFPROBE, require_numpy
+
+
+# ffprobe prints the entries in its own order, not in the asked one
+PACKET_ENTRIES = ('pts_time', 'dts_time', 'duration_time', 'size', 'flags')
+CHUNK_SIZE = 1024 ** 2
+
+
+class PacketIndex:
+    """The packets of a stream as NumPy arrays: `pts`, `dts` and
+    `duration` in seconds (NaN if unknown), `size` in bytes and `key`
+    flags, in the file order."""
+    def __init__(self, pts, dts, duration, size, key):
+        self.pts = pts
+        self.dts = dts
+        self.duration = duration
+        self.size = size
+        self.key = key
+
+    def __repr__(self):
+        return f"PacketIndex(packets={len(self)})"
+
+    def __len__(self):
+        return len(self.size)
+
+    def keyframe_times(self):
+        """The presentation times of the keyframes."""
+        return self.pts[self.key]
+
+    def bitrate(self, window=1.0):
+        """The bitrate in bits per second of every `window` seconds:
+        `(start times, bitrates)`."""
+        np = require_numpy()
+        valid = ~np.isnan(self.pts)
+        pts = self.pts[valid] - np.nanmin(self.pts) if valid.any() else self.pts[valid]
+        bins = (pts // window).astype(np.int64)
+        bits = np.bincount(bins, weights=self.size[valid] * 8.0)
+        return np.arange(len(bits)) * window, bits / window
+
+    def peak_bitrate(self, window=1.0) -> float:
+        """The highest bitrate in bits per second over any `window`
+        seconds that start at a packet."""
+        np = require_numpy()
+        order = np.argsort(self.pts, kind='stable')
+        pts, size = self.pts[order], self.size[order]
+        valid = ~np.isnan(pts)
+        pts, size = pts[valid], size[valid]
+        if not len(pts):
+            return 0.0
+        total = np.concatenate(([0], np.cumsum(size, dtype=np.int64)))
+        ends = np.searchsorted(pts, pts + window, side='left')
+        return float((total[ends] - total[:-1]).max() * 8 / window)
+
+    def gop_lengths(self):
+        """The number of packets from every keyframe to the next one.
+        The last GOP is left out, it may be cut."""
+        np = require_numpy()
+        return np.diff(np.flatnonzero(self.key))
+
+    def gop_distribution(self) -> dict:
+        """How many GOPs have each length."""
+        np = require_numpy()
+        lengths, counts = np.unique(self.gop_lengths(), return_counts=True)
+        return dict(zip(lengths.tolist(), counts.tolist()))
+
+    def save(self, path):
+        np = require_numpy()
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temp_path, pts=self.pts, dts=self.dts,
+                 duration=self.duration, size=self.size, key=self.key)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path) -> 'PacketIndex':
+        np = require_numpy()
+        with np.load(path) as data:
+            return cls(data['pts'], data['dts'], data['duration'],
+                       data['size'], data['key'])
+
+
+class PacketColumns:
+    """Parses ffprobe's csv packet lines into compact arrays, chunk by
+    chunk, without a Python object per packet."""
+    def __init__(self):
+        self.pts = array('d')
+        self.dts = array('d')
+        self.duration = array('d')
+        self.size = array('q')
+        self.key = array('b')
+        self._tail = b''
+
+    def feed(self, chunk):
+        lines = (self._tail + chunk).split(b'\n')
+        self._tail = lines.pop()
+        for line in lines:
+            self._parse(line)
+
+    def close(self):
+        if self._tail:
+            self._parse(self._tail)
+            self._tail = b''
+
+    def _parse(self, line):
+        fields = line.strip().split(b',')
+        if len(fields) < 5:
+            return
+        try:
+            size = int(fields[3])
+        except ValueError:
+            return
+        self.pts.append(_seconds(fields[0]))
+        self.dts.append(_seconds(fields[1]))
+        self.duration.append(_seconds(fields[2]))
+        self.size.append(size)
+        self.key.append(b'K' in fields[4])
+
+    def as_index(self) -> PacketIndex:
+        np = require_numpy()
+        return PacketIndex(
+            np.frombuffer(self.pts, dtype=np.float64),
+            np.frombuffer(self.dts, dtype=np.float64),
+            np.frombuffer(self.duration, dtype=np.float64),
+            np.frombuffer(self.size, dtype=np.int64),
+            np.frombuffer(self.key, dtype=np.int8).astype(bool),
+        )
+
+
+def _seconds(field):
+    try:
+        return float(field)
+    except ValueError:
+        return math.nan
+
+
+def read_packet_index(path, index, cache=None) -> PacketIndex:
+    """Reads the `PacketIndex` of the stream `index` of the file at
+    `path` with one ffprobe run. If a `ProbeCache` is passed, the index
+    is kept next to it until the file changes."""
+    require_numpy()
+    cached = _cache_path(cache, path, index) if cache is not None else None
+    if cached is not None and os.path.exists(cached):
+        try:
+            packet_index = PacketIndex.load(cached)
+            # the least recently used indexes are trimmed first
+            os.utime(cached)
+            return packet_index
+        except (OSError, ValueError, KeyError):
+            pass
+    command = [
+        FFPROBE, '-loglevel', 'quiet', '-select_streams', str(index),
+        '-show_entries', 'packet=' + ','.join(PACKET_ENTRIES),
+        '-of', 'csv=p=0', '-i', os.fspath(path),
+    ]
+    columns = PacketColumns()
+    process = sp.Popen(command, stdout=sp.PIPE, stdin=sp.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            columns.feed(chunk)
+        columns.close()
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode:
+        raise sp.CalledProcessError(process.returncode, command)
+    packet_index = columns.as_index()
+    if cached is not None:
+        _store(cache, cached, packet_index)
+    return packet_index
+
+
+def _cache_path(cache, path, index):
+    try:
+        key = cache.key(path)
+    except OSError:
+        return None
+    name = '-'.join(map(str, key)) + f'-{index}.npz'
+    return os.path.join(f'{cache.path}.packets', name)
+
+
+def _store(cache, path, packet_index):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packet_index.save(path)
+        trim_packet_indexes(os.path.dirname(path), cache.max_size, cache.max_age)
+    except OSError:
+        pass
+
+
+def trim_packet_indexes(directory, max_size=None, max_age=None) -> int:
+    """Removes the indexes in `directory` that were not used for
+    `max_age` seconds and the least recently used ones above
+    `max_size` bytes, as `ProbeCache.evict` does with the probes.
+    Returns the number of removed files."""
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort(reverse=True)
+    expired = time.time() - max_age if max_age is not None else None
+    removed = total = 0
+    for mtime, size, path in entries:
+        total += size
+        too_old = expired is not None and mtime < expired
+        too_big = max_size is not None and total > max_size
+        if too_old or too_big:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,168 @@
+import io
+import os
+import struct
+import tempfile
+import subprocess as sp
+
+from ._utils import ffprobe_command, parse_ffprobe
+
+
+PIPE_PATH = "pipe:0"
+
+# the part of the data that is kept in memory for probing
+HEAD_SIZE = 8 * 1024 ** 2
+CHUNK_SIZE = 1024 ** 2
+
+MP4_TOP_LEVEL_BOXES = [
+    b'ftyp', b'styp', b'free', b'skip', b'wide', b'pdin', b'uuid',
+    b'moov', b'mdat', b'moof', b'sidx',
+]
+
+
+class PipeError(Exception):
+    pass
+
+
+class PipeSource:
+    """Media data that is fed to FFprobe and FFmpeg over `pipe:0`:
+    bytes or a readable binary file object.
+
+    The head of the data is kept in memory for probing. A file object
+    that can't seek is read only once, the first time FFmpeg runs.
+    """
+    def __init__(self, data):
+        self.consumed = False
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.data = bytes(data)
+            self.fileobj = None
+            self.seekable = True
+            self.head = self.data[:HEAD_SIZE]
+        elif hasattr(data, 'read'):
+            self.data = None
+            self.fileobj = data
+            self.seekable = _seekable(data)
+            self.start = data.tell() if self.seekable else None
+            self.head = _read(data, HEAD_SIZE)
+        else:
+            raise TypeError(
+                f"Expected bytes or a binary file object, got {type(data).__name__}."
+            )
+
+    def __repr__(self):
+        return f"PipeSource(size={self.size}, seekable={self.seekable})"
+
+    @property
+    def size(self) -> int:
+        """The size of the data or None if it is unknown."""
+        if self.data is not None:
+            return len(self.data)
+        if self.seekable:
+            position = self.fileobj.tell()
+            end = self.fileobj.seek(0, io.SEEK_END)
+            self.fileobj.seek(position)
+            return end - self.start
+        return None
+
+    def check(self):
+        """Raises `PipeError` if the data can't be read again."""
+        if self.consumed:
+            raise PipeError("The data was already read from a pipe.")
+
+    def chunks(self):
+        """Yields the data from the start in chunks."""
+        self.check()
+        if self.data is not None:
+            view = memoryview(self.data)
+            for start in range(0, len(view), CHUNK_SIZE):
+                yield view[start:start + CHUNK_SIZE]
+            return
+        if self.seekable:
+            self.fileobj.seek(self.start)
+        else:
+            self.consumed = True
+            yield self.head
+        while True:
+            chunk = self.fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def feed(self, pipe):
+        """Writes the data to the `pipe` and closes it."""
+        try:
+            for chunk in self.chunks():
+                pipe.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg stopped reading, its exit code tells why
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def needs_seeking(self) -> bool:
+        """Whether the data can't be read from a pipe: MP4 files with
+        the media data before the header."""
+        head, pos = self.head, 0
+        while pos + 8 <= len(head):
+            size, kind = struct.unpack('>I4s', head[pos:pos + 8])
+            if kind not in MP4_TOP_LEVEL_BOXES:
+                return False
+            if kind == b'moov':
+                return False
+            if kind == b'mdat':
+                return True
+            if size == 1 and pos + 16 <= len(head):
+                size = struct.unpack('>Q', head[pos + 8:pos + 16])[0]
+            if size < 8:
+                return False
+            pos += size
+        # an MP4 file without a header in the head is not streamable
+        return pos > 0
+
+    def probe(self) -> dict:
+        """Returns the parsed format, streams and chapters of the head."""
+        command = ffprobe_command(PIPE_PATH)
+        response = sp.run(command, input=self.head, stdout=sp.PIPE)
+        if response.returncode:
+            raise sp.CalledProcessError(response.returncode, command)
+        probe = parse_ffprobe(response.stdout)
+        probe["format"]["filename"] = PIPE_PATH
+        size = self.size
+        if size is not None:
+            probe["format"]["size"] = str(size)
+        return probe
+
+    def spool(self, suffix=None) -> str:
+        """Writes the data to a temporary file and returns its path."""
+        f = tempfile.NamedTemporaryFile(
+            prefix='shane-', suffix=suffix, delete=False
+        )
+        try:
+            with f:
+                for chunk in self.chunks():
+                    f.write(chunk)
+        except BaseException:
+            os.remove(f.name)
+            raise
+        return f.name
+
+
+def _seekable(fileobj):
+    try:
+        return fileobj.seekable()
+    except (AttributeError, OSError):
+        return False
+
+
+def _read(fileobj, size):
+    """Reads `size` bytes or less at the end of the data."""
+    chunks = []
+    while size > 0:
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
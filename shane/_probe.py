@@ -0,0 +1,88 @@
+import os
+from ._cache import ProbeCache
+from ._utils import call_ffprobe, PROBE_SECTIONS
+from ._aio import acall_ffprobe
+from ._native import probe_native, UnsupportedFile
+
+
+__all__ = ['set_probe_cache', 'get_probe_cache', 'set_probe_backend']
+
+PROBE_BACKENDS = ["ffprobe", "native"]
+
+_probe_cache = None
+if os.getenv("SHANE_PROBE_CACHE"):
+    _probe_cache = ProbeCache(os.getenv("SHANE_PROBE_CACHE"))
+
+_probe_backend = os.getenv("SHANE_PROBE_BACKEND", "ffprobe")
+
+
+def set_probe_backend(backend):
+    """Sets how files are probed: "ffprobe" or "native". The native
+    backend reads the headers of Matroska and MP4 files without
+    spawning ffprobe and falls back to ffprobe for other files."""
+    global _probe_backend
+    if backend not in PROBE_BACKENDS:
+        raise ValueError(f"The probe backend '{backend}' is unknown.")
+    _probe_backend = backend
+
+
+def _probe_native(path):
+    if _probe_backend != "native":
+        return None
+    try:
+        return probe_native(path)
+    except UnsupportedFile:
+        return None
+
+
+def set_probe_cache(cache):
+    """Sets the cache that is used by `shane.open` and by containers
+    and streams when they reread their files. `cache` is a `ProbeCache`,
+    a path to the cache database or None to disable caching."""
+    global _probe_cache
+    if cache is not None and not isinstance(cache, ProbeCache):
+        cache = ProbeCache(cache)
+    _probe_cache = cache
+
+
+def get_probe_cache():
+    """Returns the current `ProbeCache` or None."""
+    return _probe_cache
+
+
+def probe(path, sections=PROBE_SECTIONS) -> dict:
+    """Returns the parsed `sections` of the `path`: its `format`, its
+    `streams` and its `chapters` by default. It is the only place where
+    shane looks into a file.
+
+    The result may have more sections than asked for when they are
+    already known. Only complete probes are stored in the cache."""
+    cache = _probe_cache
+    if cache is None:
+        return _probe_native(path) or call_ffprobe(path, sections)
+    key = cache.key(path)
+    result = cache.get(path, key)
+    if result is None:
+        result = _probe_native(path) or call_ffprobe(path, sections)
+        # Don't store the probe of a file that changed while probing.
+        if _is_complete(result) and cache.key(path) == key:
+            cache.put(path, result, key)
+    return result
+
+
+async def aprobe(path, timeout=None, sections=PROBE_SECTIONS) -> dict:
+    """An awaitable version of `probe`."""
+    cache = _probe_cache
+    if cache is None:
+        return _probe_native(path) or await acall_ffprobe(path, timeout, sections)
+    key = cache.key(path)
+    result = cache.get(path, key)
+    if result is None:
+        result = _probe_native(path) or await acall_ffprobe(path, timeout, sections)
+        if _is_complete(result) and cache.key(path) == key:
+            cache.put(path, result, key)
+    return result
+
+
+def _is_complete(probe):
+    return all(section in probe for section in PROBE_SECTIONS)
@@ -0,0 +1,289 @@
+import os
+import time
+import shutil
+import itertools
+import threading
+
+
+class SchedulerError(Exception):
+    pass
+
+
+class Job:
+    """A job of the `Scheduler`. Use `result()` to wait for it."""
+    def __init__(self, function, name, priority, paths, output_path, expected_size):
+        self.function = function
+        self.name = name
+        self.priority = priority
+        self.paths = paths
+        self.output_path = output_path
+        self.expected_size = expected_size
+        self.state = 'queued'
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._result = None
+        self._exception = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return f"Job(name={self.name}, priority={self.priority}, state={self.state})"
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds the job spent in the queue."""
+        end = self.started_at or self.finished_at or time.time()
+        return end - self.queued_at
+
+    @property
+    def run_time(self) -> float:
+        """Seconds the job is running or was running."""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the job and returns its result or raises its
+        exception."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"The job '{self.name}' is not finished.")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class Scheduler:
+    """Runs save, extract and convert jobs in several threads.
+
+    At most `workers` jobs (the number of cores by default) run at the
+    same time and at most `per_device` of them read from or write to
+    the same filesystem. A job starts only if the filesystem of its
+    output has enough free space for it. Jobs with a higher `priority`
+    start first.
+    """
+    def __init__(self, workers=None, per_device=2, space_margin=1.05):
+        self.workers = workers or os.cpu_count() or 1
+        self.per_device = per_device
+        self.space_margin = space_margin
+        self.jobs = []
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = 0
+        self._device_jobs = {}    # device -> number of running jobs
+        self._device_space = {}   # device -> bytes reserved by running jobs
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def __repr__(self):
+        return (f"Scheduler(workers={self.workers}, " +
+            f"queue_depth={self.queue_depth}, running={self.running})")
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of jobs waiting to start."""
+        return len(self._queue)
+
+    @property
+    def running(self) -> int:
+        """The number of running jobs."""
+        return self._running
+
+    def submit(self, function, name=None, priority=0, paths=(), output_path=None, expected_size=0) -> Job:
+        """Schedules `function()`. `paths` are the input files, the job
+        writes about `expected_size` bytes to `output_path`."""
+        job = Job(
+            function, name or getattr(function, '__name__', 'job'), priority,
+            [p for p in paths if p], output_path, expected_size,
+        )
+        with self._condition:
+            if self._closed:
+                raise SchedulerError('The scheduler is shut down.')
+            self.jobs.append(job)
+            self._queue.append((-priority, next(self._counter), job))
+            self._queue.sort(key=lambda item: item[:2])
+            self._condition.notify()
+        return job
+
+    def save(self, media, priority=0, **settings) -> Job:
+        """Schedules `media.save(**settings)` of a container or an outer
+        stream."""
+        if media.is_container:
+            inputs = media._get_all_input_files()
+        else:
+            inputs = [media]
+        paths = [i.default_path for i in inputs]
+        return self.submit(
+            lambda: media.save(**settings), name=f'save {media.path}',
+            priority=priority, paths=paths, output_path=media.path,
+            expected_size=sum(_file_size(p) for p in paths),
+        )
+
+    def convert(self, media, extention, priority=0, **settings) -> Job:
+        """Schedules changing the extention of `media` and saving it."""
+        media.extention = extention
+        return self.save(media, priority, **settings)
+
+    def extract(self, stream, path, priority=0, **settings) -> Job:
+        """Schedules `stream.extract(path, **settings)`."""
+        return self.submit(
+            lambda: stream.extract(path, **settings), name=f'extract {path}',
+            priority=priority, paths=[stream.container.default_path],
+            output_path=path, expected_size=_stream_size(stream),
+        )
+
+    def join(self):
+        """Waits until all the submitted jobs are finished."""
+        for job in list(self.jobs):
+            job._done.wait()
+
+    def shutdown(self, wait=True, cancel=False):
+        """Stops the workers after the queued jobs are finished. If
+        `cancel` is true, the queued jobs are cancelled instead."""
+        with self._condition:
+            self._closed = True
+            if cancel:
+                for *_, job in self._queue:
+                    self._finish(job, exception=SchedulerError(
+                        f"The job '{job.name}' was cancelled."
+                    ))
+                    job.state = 'cancelled'
+                self._queue.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._take_job()
+                while job is None:
+                    if self._closed and not self._queue:
+                        return
+                    self._condition.wait()
+                    job = self._take_job()
+            self._run(job)
+
+    def _take_job(self):
+        """Returns the first job that can start now. It must be called
+        with the condition acquired."""
+        for item in self._queue:
+            job = item[-1]
+            try:
+                devices = _devices(job)
+                if any(self._device_jobs.get(d, 0) >= self.per_device for d in devices):
+                    continue
+                output_device = _device(job.output_path) if job.output_path else None
+                if output_device is not None:
+                    free = shutil.disk_usage(_existing_dir(job.output_path)).free
+            except OSError as e:
+                # a path can't be checked, the job fails like a job
+                # that raised
+                return self._drop(item, e)
+            if output_device is not None:
+                need = job.expected_size * self.space_margin
+                reserved = self._device_space.get(output_device, 0)
+                if free - reserved < need:
+                    if self._device_jobs.get(output_device, 0) > 0:
+                        # wait for running jobs to finish
+                        continue
+                    return self._drop(item, SchedulerError(
+                        f"Not enough free space for '{job.output_path}': " +
+                        f"{free} bytes free, {int(need)} bytes needed."
+                    ))
+                self._device_space[output_device] = reserved + need
+            for d in devices:
+                self._device_jobs[d] = self._device_jobs.get(d, 0) + 1
+            self._queue.remove(item)
+            self._running += 1
+            job.state = 'running'
+            job.started_at = time.time()
+            job._devices = devices
+            job._output_device = output_device
+            return job
+        return None
+
+    def _drop(self, item, exception):
+        """Fails the queued job of `item` with `exception` and returns
+        the next job that can start now."""
+        self._queue.remove(item)
+        self._finish(item[-1], exception=exception)
+        return self._take_job()
+
+    def _run(self, job):
+        try:
+            result = job.function()
+        except BaseException as e:
+            exception, result = e, None
+        else:
+            exception = None
+        with self._condition:
+            self._running -= 1
+            for d in job._devices:
+                self._device_jobs[d] -= 1
+            if job._output_device is not None:
+                self._device_space[job._output_device] -= \
+                    job.expected_size * self.space_margin
+            self._finish(job, result, exception)
+            self._condition.notify_all()
+
+    def _finish(self, job, result=None, exception=None):
+        job.state = 'failed' if exception is not None else 'done'
+        job.finished_at = time.time()
+        job._result = result
+        job._exception = exception
+        job._done.set()
+
+
+
+def _existing_dir(path):
+    path = os.path.dirname(os.path.abspath(path))
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _device(path):
+    return os.stat(_existing_dir(path)).st_dev
+
+
+def _devices(job):
+    devices = {_device(p) for p in job.paths}
+    if job.output_path:
+        devices.add(_device(job.output_path))
+    return devices
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _stream_size(stream):
+    """The expected size of the extracted `stream`."""
+    tags = stream.metadata
+    for key in ('NUMBER_OF_BYTES', 'NUMBER_OF_BYTES-eng'):
+        if tags.get(key, '').isdigit():
+            return int(tags[key])
+    bit_rate = stream.bitrate
+    duration = stream.container.duration
+    if bit_rate and duration:
+        return int(bit_rate * duration / 8)
+    return _file_size(stream.container.default_path)
@@ -0,0 +1,128 @@
+import os
+import glob
+import shutil
+import tempfile
+import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor
+
+from ._utils import FFMPEG_COMMAND
+from ._ffmpeg import FFmpegCompressorError
+
+
+class SegmentedEncoder:
+    """Encodes the transcoded video streams of a `FFmpegCompressor` in
+    `segments` parts at once.
+
+    Every video stream is split at keyframes without re-encoding, the
+    parts are encoded by `workers` FFmpeg processes (`segments` by
+    default) and joined without re-encoding again. The compressor then
+    copies the joined video instead of encoding it. The temporary files
+    are kept next to the output and removed on exit.
+    """
+    def __init__(self, compressor, segments, workers=None):
+        self.compressor = compressor
+        self.segments = segments
+        self.workers = workers or segments
+        self.directory = None
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(
+            prefix='.shane-segments-',
+            dir=os.path.dirname(os.path.abspath(self.compressor.output_path)),
+        )
+        try:
+            for number, stream in enumerate(self.streams()):
+                path = self.encode(stream, os.path.join(self.directory, str(number)))
+                self.compressor.add_replacement(stream, path)
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def streams(self) -> list:
+        """The video streams that are transcoded and can be split."""
+        if self.compressor._pipe_source() is not None:
+            # the input can't be read twice
+            return []
+        return [
+            x for x in self.compressor._output_streams()
+            if x.is_video and x.duration
+            and self.compressor._codec_decision(x)[0] == 'transcode'
+        ]
+
+    def encode(self, stream, directory) -> str:
+        """Encodes the `stream` in segments and returns the path of the
+        joined video."""
+        os.mkdir(directory)
+        parts = self.split(stream, directory)
+        encoded = [
+            os.path.join(directory, f'encoded{i:04}.mkv')
+            for i in range(len(parts))
+        ]
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # list() raises the first error
+            list(executor.map(
+                lambda part, output: _run(self.encode_command(stream, part, output, threads)),
+                parts, encoded
+            ))
+        return self.join(encoded, directory)
+
+    def split(self, stream, directory) -> list:
+        """Splits the `stream` at keyframes without re-encoding and
+        returns the sorted paths of the parts."""
+        path = stream.container.default_path if stream.inner else stream.default_path
+        _run(FFMPEG_COMMAND + [
+            '-i', path,
+            '-map', f'0:{stream.index}',
+            '-codec', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(stream.duration / self.segments),
+            '-reset_timestamps', '1',
+            os.path.join(directory, 'part%04d.mkv'),
+        ])
+        parts = sorted(glob.glob(os.path.join(glob.escape(directory), 'part*.mkv')))
+        if not parts:
+            raise FFmpegCompressorError(f"FFmpeg didn't split '{path}'.")
+        return parts
+
+    def encode_command(self, stream, part, output, threads) -> list:
+        _, codec, _ = self.compressor._codec_decision(stream)
+        command = FFMPEG_COMMAND + [
+            '-i', part, '-map', '0:0', '-codec:0', codec,
+            '-threads', str(threads),
+        ]
+        if stream.with_changed_fps():
+            command += ['-r:0', str(stream.frame_rate)]
+        if stream.with_changed_frame_size():
+            command += ['-s:0', f'{stream.width}x{stream.height}']
+        command += self.compressor.command_crf()
+        return command + [output]
+
+    def join(self, parts, directory) -> str:
+        """Joins the `parts` without re-encoding."""
+        listing = os.path.join(directory, 'parts.txt')
+        with open(listing, 'w', encoding='utf-8') as f:
+            for part in parts:
+                escaped = part.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        output = os.path.join(directory, 'joined.mkv')
+        _run(FFMPEG_COMMAND + [
+            '-f', 'concat', '-safe', '0', '-i', listing,
+            '-codec', 'copy', output,
+        ])
+        return output
+
+
+def _run(command):
+    response = sp.run(command)
+    if response.returncode:
+        raise FFmpegCompressorError(
+            f'FFmpeg exited with the code {response.returncode}.'
+        )
+    return response
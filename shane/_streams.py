@@ -1,7 +1,12 @@
 import os
+from fractions import Fraction
 import subprocess as sp
 
 from ._ffmpeg import FFmpegCompressor
+from ._probe import aprobe, get_probe_cache
+from ._keyframes import keyframe_times
+from ._packets import read_packet_index
+from ._frames import read_frames
 from ._utils import (
     IMAGES_CODECS, 
     
@@ -17,22 +22,236 @@ class StreamError(Exception):
     pass
 
 
-class Stream:
-    """A base class of the streams."""
-    def __init__(self, ffprobe: dict):
-        self._ffprobe = ffprobe
-        self._init_from_ffprobe(ffprobe)
+_MISSING = object()
+
+
+class Tags(dict):
+    """The tags of a stream. It remembers the original values of the
+    changed keys instead of keeping a copy of all the tags."""
+    __slots__ = ("_original",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._original = None
+
+    def _remember(self, key):
+        if self._original is None:
+            self._original = {}
+        if key not in self._original:
+            self._original[key] = dict.get(self, key, _MISSING)
+
+    def __setitem__(self, key, value):
+        self._remember(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._remember(key)
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, key, *default):
+        if key in self:
+            self._remember(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __reduce__(self):
+        # copy and pickle would set the items one by one and remember
+        # all of them as added
+        if self._original is None:
+            return (_rebuild_tags, (dict(self), None, []))
+        added = [k for k, v in self._original.items() if v is _MISSING]
+        changed = {k: v for k, v in self._original.items() if v is not _MISSING}
+        return (_rebuild_tags, (dict(self), changed, added))
+
+    def __copy__(self):
+        tags = Tags(self)
+        if self._original is not None:
+            tags._original = dict(self._original)
+        return tags
+
+    def original(self) -> dict:
+        """Returns the tags as they were before the changes."""
+        result = dict(self)
+        for key, value in (self._original or {}).items():
+            if value is _MISSING:
+                result.pop(key, None)
+            else:
+                result[key] = value
+        return result
+
+
+def _rebuild_tags(items, changed, added):
+    tags = Tags(items)
+    if changed is not None:
+        tags._original = dict(changed)
+        tags._original.update(dict.fromkeys(added, _MISSING))
+    return tags
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _str(value):
+    return value
 
-    def _reinit(self, path):
-        something = Something(path)
-        self._ffprobe = something.reinit_stream()
-        self._init_from_ffprobe(self._ffprobe)
 
-    def _init_from_ffprobe(self, ffprobe):
-        self.metadata = ffprobe.get("tags", {})
-        self._defaults = ffprobe.copy()
+def _fraction(value):
+    try:
+        return Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return Fraction(0)
+
+
+def _ratio(value):
+    return f"{value.numerator}/{value.denominator}" if value else "0/0"
+
+
+def _seconds(value):
+    return f"{value:.6f}"
+
+
+def _integer_string(value):
+    return str(int(value))
+
+
+class Stream:
+    """A base class of the streams.
+
+    The fields of the ffprobe dict are parsed once into slots. Changed
+    values are kept apart from the probed ones, so both are known
+    without a copy. The ffprobe dict itself is dropped unless
+    `keep_raw` is true.
+    """
+    __slots__ = (
+        "container", "_metadata", "_disposition", "_changes", "_raw",
+        "_source", "__weakref__",
+        "_index", "_codec", "_type", "_path", "_duration", "_bitrate",
+    )
+
+    # (field, ffprobe key, parse, dump)
+    FIELDS = (
+        ("index", "index", _int, _str),
+        ("codec", "codec_name", _str, _str),
+        ("type", "codec_type", _str, _str),
+        ("path", "filename", _str, _str),
+        ("duration", "duration", _float, _seconds),
+        ("bitrate", "bit_rate", _int, str),
+    )
+
+    def __init__(self, ffprobe: dict, keep_raw=False):
+        self._init_from_ffprobe(ffprobe, keep_raw)
+
+    def _reinit(self, path, probe=None):
+        something = Something(path, probe)
+        self._init_from_ffprobe(something.reinit_stream(), self._raw is not None)
+
+    def _init_from_ffprobe(self, ffprobe, keep_raw=False):
+        for name, key, parse, _ in self.FIELDS:
+            setattr(self, "_" + name, parse(ffprobe.get(key)))
+        self._disposition = {
+            k: v for k, v in ffprobe.get("disposition", {}).items() if v
+        }
+        self._metadata = Tags(ffprobe.get("tags", {}))
+        self._changes = None
+        self._raw = ffprobe if keep_raw else None
+        # the PipeSource of a stream that is read from a pipe
+        self._source = None
         self.container = None
 
+    def _get(self, name):
+        if self._changes is not None and name in self._changes:
+            return self._changes[name]
+        return getattr(self, "_" + name)
+
+    def _set(self, name, value):
+        if value == getattr(self, "_" + name):
+            if self._changes is not None:
+                self._changes.pop(name, None)
+        else:
+            if self._changes is None:
+                self._changes = {}
+            self._changes[name] = value
+
+    def _set_flag(self, flag, value):
+        disposition = dict(self.disposition)
+        if value:
+            disposition[flag] = 1
+        else:
+            disposition.pop(flag, None)
+        self._set("disposition", disposition)
+
+    def _as_ffprobe(self) -> dict:
+        """Rebuilds the ffprobe dict of the probed values. Disposition
+        flags that are not set are left out."""
+        ffprobe = {}
+        for name, key, _, dump in self.FIELDS:
+            value = getattr(self, "_" + name)
+            if value is not None:
+                ffprobe[key] = dump(value)
+        ffprobe["disposition"] = dict(self._disposition)
+        ffprobe["tags"] = self._metadata.original()
+        return ffprobe
+
+    @property
+    def raw(self) -> dict:
+        """The ffprobe dict of the stream. It is rebuilt from the fields
+        unless the stream was created with `keep_raw`."""
+        return self._raw if self._raw is not None else self._as_ffprobe()
+
+    @property
+    def metadata(self) -> dict:
+        """The stream tags."""
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, tags: dict):
+        """Property setter for self.metadata."""
+        self._metadata.clear()
+        self._metadata.update(tags)
+
+    @property
+    def default_metadata(self) -> dict:
+        return self._metadata.original()
+
+    @property
+    def disposition(self) -> dict:
+        """The disposition flags that are set."""
+        return self._get("disposition")
+
+    @property
+    def default_disposition(self) -> dict:
+        return self._disposition
+
+    def with_changed_disposition(self):
+        return self.default_disposition != self.disposition
+
     @property
     def is_container(self) -> bool:
         return not isinstance(self, Stream)
@@ -44,7 +263,7 @@ class Stream:
     @property
     def path(self) -> str:
         """The path to the file, if the stream is not inner."""
-        return self._ffprobe.get("filename")
+        return self._get("path")
 
     @property
     def extention(self):
@@ -57,7 +276,7 @@ class Stream:
     @property
     def index(self) -> int:
         """The stream index in the container."""
-        return self._ffprobe["index"]
+        return self._index
 
     @property
     def inner(self) -> bool:
@@ -67,12 +286,12 @@ class Stream:
     @property
     def codec(self) -> str:
         """The stream codec."""
-        return self._ffprobe["codec_name"]
+        return self._get("codec")
 
     @property
     def type(self) -> str:
         """The common type of the stream."""
-        return self._ffprobe["codec_type"]
+        return self._type
     
     @property
     def is_video(self) -> bool:
@@ -101,16 +320,31 @@ class Stream:
     @property
     def is_default(self) -> bool:
         """Specifies whether the stream is the default stream"""
-        return self._ffprobe["disposition"]["default"] == 1
+        return self.disposition.get("default", 0) == 1
+
+    @property
+    def duration(self) -> float:
+        """The duration in seconds"""
+        if self._duration:
+            return self._duration
+        elif self.container is not None:
+            return self.container.duration
+        else:
+            return None
+
+    @property
+    def bitrate(self) -> int:
+        """The number of bits processed per second"""
+        return self._bitrate
 
     @property
     def default_codec(self):    
-        return self._defaults["codec_name"]
+        return self._codec
     
     @property
     def default_path(self):
         """The path to the file, if the stream is not inner."""
-        return self._defaults.get("filename")
+        return self._path
 
     @property
     def default_extention(self):
@@ -127,10 +361,10 @@ class Stream:
             raise AttributeError("An inner stream can not have a path")
         if os.path.exists(path):
             raise ValueError(f"The path '{path}' already exists")
-        self._ffprobe["filename"] = path
+        self._set("path", path)
 
     @extention.setter
-    def extention(self, ext):
+    def extention(self, extention):
         """Property setter for self.extention."""
         if self.inner == True:
             raise AttributeError("An inner stream can not have an extention")
@@ -154,17 +388,17 @@ class Stream:
         error = f"The codec '{value}' is not supported."
         if self.is_video:
             if value in SUPPORTED_VIDEO_CODECS:
-                self._ffprobe["codec_name"] = value
+                self._set("codec", value)
             else:
                 raise ValueError(error)
         elif self.is_audio:
             if value in SUPPORTED_AUDIO_CODECS:
-                self._ffprobe["codec_name"] = value
+                self._set("codec", value)
             else:
                 raise ValueError(error)
         elif self.is_subtitle:
             if value in SUPPORTED_SUBTITLE_CODECS:
-                self._ffprobe["codec_name"] = value
+                self._set("codec", value)
             else:
                 raise ValueError(error)
         else:
@@ -173,10 +407,12 @@ class Stream:
     @is_default.setter
     def is_default(self, value: bool):
         """Property setter for self.is_default."""
-        return bool(self._ffprobe["disposition"]["default"])
+        self._set_flag("default", value)
 
-    def save(self, **settings):
-        """Saves all the changes. Only for outer streams"""
+    def save(self, progress=None, **settings):
+        """Saves all the changes. Only for outer streams. If `progress`
+        is passed, it is called with `shane.Progress` tuples while
+        FFmpeg runs."""
         if self.inner:
             raise StreamError(
                 'You can not save an inner stream. You can only extract it.'
@@ -185,11 +421,12 @@ class Stream:
         compressor.add_input_files(self)
         compressor.add_output_path(self.path)
         compressor.add_settings(**settings)
+        compressor.add_progress(progress)
         response = compressor.run()
         self._reinit(self.path)
         return response
 
-    def extract(self, path=None, **settings):
+    def extract(self, path=None, progress=None, **settings):
         """Extreacts the stream and saves it to the `path`. Returns 
          the extracted stream"""
         if not self.inner:
@@ -200,72 +437,142 @@ class Stream:
         compressor.add_input_files(self.container)
         compressor.add_output_path(path)
         compressor.add_settings(**settings)
+        compressor.add_progress(progress)
         compressor.extract_stream_run(self)
         something = Something(path)
         return something.as_stream()
 
+    def extract_to(self, sink, extention=".mkv", progress=None, **settings):
+        """Extracts the stream to `sink`, a writable binary file object
+        or a callable that takes bytes, without a file on disk. The
+        format is chosen by the `extention`."""
+        if not self.inner:
+            raise StreamError(
+                'You can not extract an outer stream. You can only save it.'
+            )
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(self.container)
+        compressor.add_output_sink(sink, extention)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        return compressor.extract_stream_run(self)
+
+    def packet_index(self, cache=True):
+        """Returns a `PacketIndex` of the stream: its packets as NumPy
+        arrays. The packets are read with one ffprobe run and kept next
+        to the probe cache if there is one. Requires NumPy."""
+        path = self.container.default_path if self.inner else self.default_path
+        probe_cache = get_probe_cache() if cache else None
+        return read_packet_index(path, self.index, probe_cache)
+
+    async def asave(self, timeout=None, progress=None, **settings):
+        """An awaitable version of `save`. FFmpeg is killed and the
+        incomplete output is removed if the call is cancelled or takes
+        more than `timeout` seconds."""
+        if self.inner:
+            raise StreamError(
+                'You can not save an inner stream. You can only extract it.'
+            )
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(self)
+        compressor.add_output_path(self.path)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        response = await compressor.arun(timeout)
+        self._reinit(self.path, await aprobe(self.path, timeout))
+        return response
+
+    async def aextract(self, path=None, timeout=None, progress=None, **settings):
+        """An awaitable version of `extract`."""
+        if not self.inner:
+            raise StreamError(
+                'You can not extract an outer stream. You can only save it.'
+            )
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(self.container)
+        compressor.add_output_path(path)
+        compressor.add_settings(**settings)
+        compressor.add_progress(progress)
+        await compressor.aextract_stream_run(self, timeout)
+        something = Something(path, await aprobe(path, timeout))
+        return something.as_stream()
+
 
 
 class VideoStream(Stream):
     """A video stream."""    
-    def _init_from_ffprobe(self, ffprobe):
-        Stream._init_from_ffprobe(self, ffprobe)
-        fps = self._defaults.get("avg_frame_rate")
-        if fps is not None and fps != '0/0':
-            self._defaults["avg_frame_rate"] = \
-            self._ffprobe["avg_frame_rate"] = \
-            eval(self._defaults["avg_frame_rate"])
-        else:
-            self._defaults["avg_frame_rate"] = 0
-            self._ffprobe["avg_frame_rate"] = 0
-    
-    # @property
-    # def bitrate(self) -> int: # TODO
-    #     """The number of bits processed per second."""
-    #     raise NotImplementedError
+    __slots__ = ("_fps", "_width", "_height", "_pix_fmt")
+
+    FIELDS = Stream.FIELDS + (
+        ("fps", "avg_frame_rate", _fraction, _ratio),
+        ("width", "width", _int, _str),
+        ("height", "height", _int, _str),
+        ("pix_fmt", "pix_fmt", _str, _str),
+    )
 
     @property
-    def fps(self) -> int:
+    def fps(self) -> float:
         """A number of frames per second."""
-        return self._ffprobe["avg_frame_rate"]
+        return float(self.frame_rate)
+
+    @property
+    def frame_rate(self) -> Fraction:
+        """The exact number of frames per second, 0 if it is unknown."""
+        return self._get("fps")
 
     @property
     def width(self) -> int:
         """The width of the the video."""
-        return self._ffprobe["width"]
+        return self._get("width")
 
     @property
     def height(self) -> int:
         """The height of the the video."""
-        return self._ffprobe["height"]
+        return self._get("height")
+
+    @property
+    def pix_fmt(self) -> str:
+        """The pixel format of the video."""
+        return self._pix_fmt
 
     @fps.setter
     def fps(self, value: float): 
         """Property setter for self.fps."""
-        if isinstance(value, float) or isinstance(value, int):
-            self._ffprobe["avg_frame_rate"] = value
+        self.frame_rate = value
+
+    @frame_rate.setter
+    def frame_rate(self, value: Fraction):
+        """Property setter for self.frame_rate."""
+        if isinstance(value, float):
+            self._set("fps", Fraction(str(value)))
+        elif isinstance(value, (int, Fraction)):
+            self._set("fps", Fraction(value))
         else:
             raise TypeError("The fps value must be a number.")
 
     @property
-    def default_fps(self):
-        return self._defaults["avg_frame_rate"]
+    def default_fps(self) -> float:
+        return float(self._fps)
+
+    @property
+    def default_frame_rate(self) -> Fraction:
+        return self._fps
     
     @property
     def default_width(self) -> int:
         """The default width of the the video."""
-        return self._defaults["width"]
+        return self._width
 
     @property
     def default_height(self) -> int:
         """The default height of the the video."""
-        return self._defaults["height"]
+        return self._height
 
     @width.setter
     def width(self, value: int):
         """Property setter for self.width."""
         if isinstance(value, int):
-            self._ffprobe["width"] = value
+            self._set("width", value)
         else:
             raise TypeError("The width value must be an integer.")
 
@@ -273,20 +580,39 @@ class VideoStream(Stream):
     def height(self, value: int):
         """Property setter for self.height."""
         if isinstance(value, int):
-            self._ffprobe["height"] = value
+            self._set("height", value)
         else:
             raise TypeError("The height value must be an integer.")
     
+    def keyframes(self) -> list:
+        """The sorted times of the keyframes in seconds. The packets of
+        the stream are read, nothing is decoded."""
+        path = self.container.default_path if self.inner else self.default_path
+        return keyframe_times(path, self.index)
+
+    def frames(self, batch=1, pix_fmt='rgb24', size=None, fps=None, buffers=2):
+        """Decodes the stream and yields `(N, H, W, C)` NumPy arrays of
+        `batch` frames. `pix_fmt` is 'rgb24', 'gray' or 'yuv420p'.
+        FFmpeg scales the frames to `size`, a `(width, height)` tuple,
+        and converts them to `fps`. The frames are not rotated, they
+        have the coded size. The arrays are reused, see `read_frames`.
+        Requires NumPy."""
+        path = self.container.default_path if self.inner else self.default_path
+        return read_frames(
+            path, self.index, self.default_width, self.default_height,
+            batch, pix_fmt, size, fps, buffers,
+        )
+
     def with_changed_fps(self):
-        return self._defaults["avg_frame_rate"] != self._ffprobe["avg_frame_rate"]
+        return self.default_frame_rate != self.frame_rate
 
     def with_changed_frame_size(self):
-        return self._defaults["height"] != self._ffprobe["height"] or \
-        self._defaults["width"] != self._ffprobe["width"]
+        return self.default_height != self.height or \
+        self.default_width != self.width
 
     def __repr__(self):
         return (self.__class__.__name__ + "("
-            f"path={self.path}, codec={self.codec}, fps={self.fps}, " + 
+            f"path={self.path}, codec={self.codec}, fps={self.frame_rate}, " + 
             f"width={self.width}, height={self.height}, " +
             f"language={self.metadata.get('language')}" +
             ")"
@@ -296,15 +622,22 @@ class VideoStream(Stream):
 
 class AudioStream(Stream):
     """An audio stream."""
+    __slots__ = ("_channels", "_sample_rate")
+
+    FIELDS = Stream.FIELDS + (
+        ("channels", "channels", _int, _str),
+        ("sample_rate", "sample_rate", _float, _integer_string),
+    )
+
     @property
     def channels(self) -> int:
         """The number of channels."""
-        return int(self._ffprobe["channels"])
+        return self._channels
 
     @property
     def sample_rate(self) -> float:
         """The audio sample rate."""
-        return float(self._ffprobe["sample_rate"])
+        return self._sample_rate
 
     # TODO @sample_rate.setter
     # TODO @channels.setter
@@ -321,16 +654,17 @@ class AudioStream(Stream):
 
 class SubtitleStream(Stream):
     """A subtitle stream."""
+    __slots__ = ()
 
     @property
     def is_forced(self) -> bool:
         """Specifies whether subtitles are forced or not."""
-        return self._ffprobe["disposition"]["forced"] == 1
+        return self.disposition.get("forced", 0) == 1
 
     @is_forced.setter
     def is_forced(self, value: bool):
         """Property setter for self.is_forced."""
-        self._ffprobe["disposition"]["forced"] = 1 if value is True else 0 
+        self._set_flag("forced", value is True)
 
     def __repr__(self):
         return (self.__class__.__name__ + "("
@@ -342,6 +676,8 @@ class SubtitleStream(Stream):
 
 
 class DataStream(Stream): # ?
+    __slots__ = ()
+
     def __repr__(self):
         return (self.__class__.__name__ + "("
             f"path={self.path}, codec={self.codec}, " + 
@@ -351,6 +687,8 @@ class DataStream(Stream): # ?
 
 
 class ImageStream(Stream): # ?
+    __slots__ = ()
+
     def __repr__(self):
         return (self.__class__.__name__ + "("
             f"path={self.path}, codec={self.codec}, " + 
@@ -360,6 +698,8 @@ class ImageStream(Stream): # ?
 
 
 class AttachmentStream(Stream): # ?
+    __slots__ = ()
+
     def __repr__(self):
         return (self.__class__.__name__ + "("
             f"path={self.path}, codec={self.codec}, " + 
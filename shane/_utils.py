@@ -19,10 +19,10 @@ FFMPEG_COMMAND = [
 
 # valid output extentions
 SUPPORTED_VIDEO_EXTENTIONS = [".mkv", ".m4v", ".mp4"]
-SUPPORTED_AUDIO_EXTENTIONS = [".aac", ".ac3"]
-SUPPORTED_SUBTITLE_EXTENTIONS = [".srt"]
+SUPPORTED_AUDIO_EXTENTIONS = [".aac", ".ac3", ".mka"]
+SUPPORTED_SUBTITLE_EXTENTIONS = [".srt", ".ass", ".vtt", ".sup"]
 
-SUPPORTED_VIDEO_CODECS = ['h264', 'h265']
+SUPPORTED_VIDEO_CODECS = ['h264', 'h265', 'hevc']
 SUPPORTED_AUDIO_CODECS = ["aac", "ac3", "flac"]
 SUPPORTED_SUBTITLE_CODECS = ["mov_text", "subrip", "srt",]
 
@@ -32,9 +32,9 @@ IMAGES_CODECS = [
 ]
 
 CONTAINERS_VCODECS = {
-    ".mkv": ["h264", 'h265', 'theora', 'vp8', 'vp9', "h261", "h262", "h263", "mpeg4", "vc1"], 
-    ".m4v": ["h264", 'h265', "h261", "h262", "h263", "mpeg4"], 
-    ".mp4": ["h264", 'h265', "h261", "h262", "h263", "mpeg4"],
+    ".mkv": ["h264", 'h265', 'hevc', 'theora', 'vp8', 'vp9', "h261", "h262", "h263", "mpeg4", "vc1"], 
+    ".m4v": ["h264", 'h265', 'hevc', "h261", "h262", "h263", "mpeg4"], 
+    ".mp4": ["h264", 'h265', 'hevc', "h261", "h262", "h263", "mpeg4"],
 }
 
 CONTAINERS_ACODECS = {
@@ -50,6 +50,9 @@ CONTAINERS_ACODECS = {
 CONTAINERS_SCODECS = {
     ".mkv": ["subrip", "srt", "ass", "ssa", "dvd_subtitle", "vobsub", "hdmv_pgs_subtitle", 'text', 'webvtt'],
     ".srt": ["subrip", "srt"],
+    ".ass": ["ass", "ssa"],
+    ".vtt": ["webvtt"],
+    ".sup": ["hdmv_pgs_subtitle"],
     # FFmpeg's MP4 muxer does not support sub formats other than mov_text.
     ".m4v": ["mov_text"],
     ".mp4": ["mov_text"],
@@ -57,7 +60,7 @@ CONTAINERS_SCODECS = {
 
 
 
-def make_stream(raw):
+def make_stream(raw, keep_raw=False):
     from ._streams import (
         VideoStream, 
         AudioStream, 
@@ -68,67 +71,88 @@ def make_stream(raw):
     )
     if raw["codec_type"] == "video":
         if raw['codec_name'] in IMAGES_CODECS:
-            return ImageStream(raw)
-        return VideoStream(raw)
+            return ImageStream(raw, keep_raw)
+        return VideoStream(raw, keep_raw)
     elif raw["codec_type"] == "audio":
-        return AudioStream(raw)
+        return AudioStream(raw, keep_raw)
     elif raw["codec_type"] == "subtitle":
-        return SubtitleStream(raw)
+        return SubtitleStream(raw, keep_raw)
     elif raw["codec_type"] == "data":
-        return DataStream(raw)
+        return DataStream(raw, keep_raw)
     elif raw["codec_type"] == "attachment":
-        return AttachmentStream(raw)
+        return AttachmentStream(raw, keep_raw)
     else:
         raise ValueError("Invalid Stream")
 
 
-def call_streams(path):
-    return _call_ffprobe("streams", path)
+PROBE_SECTIONS = ("format", "streams", "chapters")
 
 
-def call_format(path):
-    return _call_ffprobe("format", path)
+def call_ffprobe(path, sections=PROBE_SECTIONS) -> dict:
+    """Returns the `sections` (the format, the streams and the chapters
+    by default) of the `path` using a single ffprobe call."""
+    response = sp.check_output(ffprobe_command(path, sections))
+    return parse_ffprobe(response, sections)
 
 
-def call_chapters(path):
-    response = _call_ffprobe("chapters", path)
-    for chapter in response:
+def ffprobe_command(path, sections=PROBE_SECTIONS) -> list:
+    return FFPROBE_COMMAND + [
+        f"-show_{section}" for section in sections
+    ] + ["-i", path]
+
+
+def parse_ffprobe(response, sections=PROBE_SECTIONS) -> dict:
+    """Parses the JSON output of ffprobe into the dict with a key for
+    each of the `sections`."""
+    response = json.loads(response) if response else {}
+    result = {}
+    if "format" in sections:
+        result["format"] = response.get("format", {})
+    if "streams" in sections:
+        result["streams"] = response.get("streams", [])
+    if "chapters" in sections:
+        result["chapters"] = list(parse_chapters(response.get("chapters", [])))
+    return result
+
+
+def parse_chapters(chapters):
+    for chapter in chapters or []:
         yield {
-            "title": chapter.get("title"),
+            "title": chapter.get("tags", {}).get("title", chapter.get("title")),
             "start": float(chapter.get("start_time")),
             "end": float(chapter.get("end_time")),
         }
 
 
-def _call_ffprobe(show_what, path):
-    if show_what == "streams":
-        command = "-show_streams"
-        key = "streams"
-    elif show_what == "format":
-        command = "-show_format"
-        key = "format"
-    else:
-        command = "-show_chapters"
-        key = "chapters"
-    response = sp.check_output(FFPROBE_COMMAND + [command, "-i", path])
-    return json.loads(response).get(key)
+def check_ffmpeg():
+    """Raises `FileNotFoundError` if FFmpeg is not installed. FFmpeg
+    is asked only once, see `get_capabilities`."""
+    from ._capabilities import get_capabilities
+    get_capabilities()
 
 
-def check_ffmpeg():
+def require_numpy():
+    """Returns the `numpy` module or raises `ImportError` if it is not
+    installed. It is only needed for the array helpers."""
     try:
-        sp.run([FFMPEG, '-loglevel', 'quiet'])
-    except FileNotFoundError:
-        raise FileNotFoundError("Shane requires FFmpeg installed.")
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "This requires NumPy, install it with `pip install shane[numpy]`."
+        ) from None
+    return numpy
 
 
 class Something:
     """It is either a stream or the container. You can not find out 
     by looking at its `path`."""
-    def __init__(self, path):
+    def __init__(self, path, probe=None):
+        from ._probe import probe as probe_path
         self.path = path
-        self.format = call_format(path)
-        self.streams = call_streams(path)
-        self.chapters = call_chapters(path)
+        self.probe = probe if probe is not None else probe_path(path)
+        self.format = self.probe["format"]
+        self.streams = self.probe["streams"]
+        self.chapters = self.probe["chapters"]
         self.first_stream = self.streams[0]
     
     @property
@@ -139,14 +163,14 @@ class Something:
     def is_container(self):
         return len(self.streams) > 1
 
-    def as_stream(self):
+    def as_stream(self, keep_raw=False):
         self.first_stream.update(self.format)
-        return make_stream(self.first_stream)
+        return make_stream(self.first_stream, keep_raw)
     
     def reinit_stream(self) -> dict:
         self.first_stream.update(self.format)
         return self.first_stream
     
-    def as_container(self):
+    def as_container(self, keep_raw=False):
         from ._container import Container
-        return Container(path=self.path)
\ No newline at end of file
+        return Container(path=self.path, probe=self.probe, keep_raw=keep_raw)
\ No newline at end of file
@@ -1,3 +1,5 @@
+from ._packaging import package
+
 
 def mkv(container):
     """Changes the `container` format to the MKV format."""
@@ -11,3 +13,27 @@ def m4v(container):
     container.save()
     return container
 
+
+def hls(container, directory, segment_type='fmp4', segment_duration=6,
+        progress=None, **settings):
+    """Packages the `container` to HLS in the `directory`: a master
+    playlist, a variant for the video, an audio rendition for every
+    language and WebVTT subtitles. `segment_type` is 'fmp4' or
+    'mpegts'. Returns a `Package`."""
+    return package(container, directory, ('hls',), segment_type,
+                   segment_duration, progress, **settings)
+
+
+def dash(container, directory, segment_duration=6, progress=None, **settings):
+    """Packages the `container` to DASH in the `directory`. Returns a
+    `Package`."""
+    return package(container, directory, ('dash',), 'fmp4',
+                   segment_duration, progress, **settings)
+
+
+def hls_and_dash(container, directory, segment_duration=6, progress=None, **settings):
+    """Packages the `container` to HLS and DASH with one read of the
+    input. The fMP4 segments of HLS and DASH are written separately.
+    Returns a `Package`."""
+    return package(container, directory, ('hls', 'dash'), 'fmp4',
+                   segment_duration, progress, **settings)
@@ -0,0 +1,4 @@
+import shane
+
+# the commands in the tests don't depend on the installed FFmpeg
+shane.set_capabilities(shane.Capabilities())
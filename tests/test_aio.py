@@ -0,0 +1,68 @@
+import sys
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _probe
+from shane._ffmpeg import FFmpegCompressor, FFmpegCompressorError
+
+from .test_probe import FFPROBE_RESPONSE
+
+
+SLEEP = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+
+class TestAsyncRun(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.output = Path(self.dir.name) / "output.mkv"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_command(self, command, timeout=None):
+        compressor = FFmpegCompressor()
+        compressor.add_output_path(str(self.output))
+        # pretend that FFmpeg already wrote a part of the output
+        self.output.write_bytes(b"partial")
+        return compressor._arun_command(command, str(self.output), timeout)
+
+    def test_timeout_kills_and_removes_output(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.run_command(list(SLEEP), timeout=0.2))
+        self.assertFalse(self.output.exists())
+
+    def test_cancel_kills_and_removes_output(self):
+        async def cancel():
+            task = asyncio.ensure_future(self.run_command(list(SLEEP)))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel())
+        self.assertFalse(self.output.exists())
+
+    def test_failed_command_raises(self):
+        command = [sys.executable, "-c", "raise SystemExit(3)"]
+        with self.assertRaises(FFmpegCompressorError):
+            asyncio.run(self.run_command(command))
+        self.assertFalse(self.output.exists())
+
+
+class TestAsyncOpen(unittest.TestCase):
+    def test_aopen(self):
+        async def acall_ffprobe(path, timeout=None, sections=None):
+            from shane._utils import parse_ffprobe
+            return parse_ffprobe(FFPROBE_RESPONSE)
+        with mock.patch.object(_probe, "acall_ffprobe", acall_ffprobe), \
+             mock.patch("os.path.exists", return_value=True):
+            container = asyncio.run(shane.aopen("movie.mkv"))
+        self.assertIsInstance(container, shane.Container)
+        self.assertEqual(len(container.streams), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
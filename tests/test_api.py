@@ -0,0 +1,53 @@
+import time
+import unittest
+from unittest import mock
+
+import shane
+from shane import _api
+
+
+def fake_open(path, lazy=True, keep_raw=False):
+    if path.startswith("missing"):
+        raise FileNotFoundError(path)
+    time.sleep(0.01 * (5 - int(path[-1])))
+    return path.upper()
+
+
+class TestOpenMany(unittest.TestCase):
+    def test_ordered(self):
+        paths = [f"file{i}" for i in range(5)]
+        with mock.patch.object(_api, "open", fake_open):
+            result = list(shane.open_many(paths, workers=4, ordered=True))
+        self.assertEqual(result, [(p, p.upper()) for p in paths])
+
+    def test_unordered_yields_all(self):
+        paths = [f"file{i}" for i in range(5)]
+        with mock.patch.object(_api, "open", fake_open):
+            result = dict(shane.open_many(paths, workers=4))
+        self.assertEqual(result, {p: p.upper() for p in paths})
+
+    def test_options_are_passed(self):
+        with mock.patch.object(_api, "open", return_value="media") as open_:
+            list(shane.open_many(["file1"], lazy=False, keep_raw=True))
+        open_.assert_called_once_with("file1", False, True)
+
+    def test_errors_are_collected(self):
+        errors = {}
+        paths = ["file1", "missing2", "file3"]
+        with mock.patch.object(_api, "open", fake_open):
+            result = dict(shane.open_many(paths, errors=errors))
+        self.assertEqual(set(result), {"file1", "file3"})
+        self.assertIsInstance(errors["missing2"], FileNotFoundError)
+
+    def test_errors_are_raised_at_the_end(self):
+        yielded = []
+        with mock.patch.object(_api, "open", fake_open):
+            with self.assertRaises(shane.OpenManyError) as cm:
+                for path, media in shane.open_many(["missing1", "file2"]):
+                    yielded.append(path)
+        self.assertEqual(yielded, ["file2"])
+        self.assertIn("missing1", cm.exception.errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
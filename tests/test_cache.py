@@ -0,0 +1,99 @@
+import os
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from shane import _probe
+from shane._cache import ProbeCache
+
+
+def make_probe(filename):
+    return {
+        "format": {"filename": filename, "size": "4"},
+        "streams": [],
+        "chapters": [],
+    }
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.dir.name)
+        self.file = self.base / "movie.mkv"
+        self.file.write_bytes(b"1234")
+        self.cache = ProbeCache(str(self.base / "cache.db"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.dir.cleanup()
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get(self.file))
+        self.cache.put(self.file, make_probe(str(self.file)))
+        self.assertEqual(self.cache.get(self.file), make_probe(str(self.file)))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file_is_invalidated(self):
+        self.cache.put(self.file, make_probe(str(self.file)))
+        self.file.write_bytes(b"123456")
+        self.assertIsNone(self.cache.get(self.file))
+        self.cache.put(self.file, make_probe(str(self.file)))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_renamed_file_has_new_filename(self):
+        self.cache.put(self.file, make_probe(str(self.file)))
+        renamed = self.base / "renamed.mkv"
+        os.rename(self.file, renamed)
+        probe = self.cache.get(renamed)
+        self.assertEqual(probe["format"]["filename"], str(renamed))
+
+    def test_eviction_by_age(self):
+        self.cache.put(self.file, make_probe(str(self.file)))
+        self.cache.max_age = 60
+        with mock.patch("time.time", return_value=time.time() + 120):
+            self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_eviction_by_size(self):
+        other = self.base / "other.mkv"
+        other.write_bytes(b"12345678")
+        self.cache.put(self.file, make_probe(str(self.file)))
+        self.cache.put(other, make_probe(str(other)))
+        self.cache.max_size = self.cache.stats()["size"] - 1
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertIsNotNone(self.cache.get(other))
+
+    def test_access_times_are_batched(self):
+        other = self.base / "other.mkv"
+        other.write_bytes(b"12345678")
+        now = time.time()
+        with mock.patch("time.time", return_value=now - 100):
+            self.cache.put(self.file, make_probe(str(self.file)))
+            self.cache.put(other, make_probe(str(other)))
+        def accessed():
+            return dict(self.cache._connection.execute(
+                "SELECT path, accessed FROM probes"
+            ).fetchall())
+        with mock.patch("time.time", return_value=now):
+            self.cache.get(self.file)
+        # not written on the hit, but before an eviction pass
+        self.assertEqual(accessed()[str(self.file)], now - 100)
+        self.cache.max_size = self.cache.stats()["size"] - 1
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(accessed(), {str(self.file): now})
+
+    def test_probe_uses_cache(self):
+        _probe.set_probe_cache(self.cache)
+        self.addCleanup(_probe.set_probe_cache, None)
+        with mock.patch.object(_probe, "call_ffprobe",
+                               return_value=make_probe(str(self.file))) as call:
+            _probe.probe(self.file)
+            _probe.probe(self.file)
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
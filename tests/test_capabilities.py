@@ -0,0 +1,138 @@
+import os
+import json
+import tempfile
+import unittest
+import subprocess as sp
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _capabilities
+from shane._capabilities import Capabilities
+
+from .test_plan import make_probe, VIDEO, DTS
+
+
+ENCODERS = """Encoders:
+ V..... = Video
+ A..... = Audio
+ S..... = Subtitle
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC (codec h264)
+ V....D h264_nvenc           NVIDIA NVENC H.264 encoder (codec h264)
+ V....D libx265              libx265 H.265 / HEVC (codec hevc)
+ A....D aac                  AAC (Advanced Audio Coding)
+ A....D libfdk_aac           Fraunhofer FDK AAC (codec aac)
+ S..... mov_text             3GPP Timed Text subtitle
+"""
+
+MUXERS = """File formats:
+ D. = Demuxing supported
+ .E = Muxing supported
+ ---
+  E hls             Apple HTTP Live Streaming
+ DE matroska        Matroska
+ D  mpegts          MPEG-TS (MPEG-2 Transport Stream)
+"""
+
+BSFS = """Bitstream filters:
+aac_adtstoasc
+h264_mp4toannexb
+"""
+
+OUTPUTS = {
+    "-version": "ffmpeg version 6.1.1 Copyright (c) 2000-2023\n",
+    "-encoders": ENCODERS,
+    "-muxers": MUXERS,
+    "-bsfs": BSFS,
+}
+
+
+class TestCapabilities(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.binary = self.root / "ffmpeg"
+        self.binary.write_text("#!/bin/sh\n")
+        self.binary.chmod(0o755)
+        self.cache = str(self.root / "cache" / "capabilities.json")
+        self.commands = []
+        self.addCleanup(shane.set_capabilities, shane.get_capabilities())
+
+    def fake_run(self, command, **kwargs):
+        self.commands.append(command)
+        return sp.CompletedProcess(command, 0, OUTPUTS[command[-1]])
+
+    def load(self):
+        with mock.patch.object(_capabilities, "FFMPEG", str(self.binary)), \
+             mock.patch.object(_capabilities, "FFPROBE", str(self.root / "none")), \
+             mock.patch.object(_capabilities.sp, "run", side_effect=self.fake_run):
+            return _capabilities.load_capabilities(self.cache)
+
+    def test_parse(self):
+        capabilities = self.load()
+        self.assertEqual(capabilities.version, "6.1.1")
+        self.assertIsNone(capabilities.ffprobe_version)
+        self.assertEqual(capabilities.encoders["libfdk_aac"], "aac")
+        self.assertEqual(capabilities.encoders["mov_text"], "mov_text")
+        self.assertTrue(capabilities.has_muxer("hls"))
+        self.assertTrue(capabilities.has_muxer("matroska"))
+        self.assertFalse(capabilities.has_muxer("mpegts"))
+        self.assertTrue(capabilities.has_bsf("aac_adtstoasc"))
+
+    def test_cached_by_binary(self):
+        first = self.load()
+        self.assertEqual(len(self.commands), 4)
+        with open(self.cache, encoding="utf-8") as f:
+            self.assertIn(os.path.realpath(self.binary), json.load(f))
+        second = self.load()
+        self.assertEqual(len(self.commands), 4)
+        self.assertEqual(second.encoders, first.encoders)
+        # an upgraded binary is asked again
+        stat = self.binary.stat()
+        os.utime(self.binary, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.load()
+        self.assertEqual(len(self.commands), 8)
+
+    def test_missing_ffmpeg(self):
+        with mock.patch.object(_capabilities, "FFMPEG", str(self.root / "none")), \
+             self.assertRaises(FileNotFoundError):
+            _capabilities.load_capabilities(self.cache)
+
+    def test_fastest_encoder(self):
+        capabilities = self.load()
+        self.assertEqual(capabilities.encoder_for("aac"), "libfdk_aac")
+        self.assertEqual(capabilities.encoder_for("h265"), "libx265")
+        self.assertEqual(capabilities.encoder_for("mov_text"), "mov_text")
+        self.assertEqual(capabilities.encoder_for("h264"), "libx264")
+        capabilities.hardware = True
+        self.assertEqual(capabilities.encoder_for("h264"), "h264_nvenc")
+        self.assertEqual(capabilities.codec_of("h264_nvenc"), "h264")
+        # nothing is known
+        self.assertEqual(Capabilities().encoder_for("aac"), "aac")
+
+    def test_commands_use_the_registry(self):
+        shane.set_capabilities(self.load())
+        container = shane.Container(path="movie.mkv", probe=make_probe(VIDEO, DTS))
+        container.extention = ".m4v"
+        self.assertEqual(container.plan().streams[1].codec, "libfdk_aac")
+        container.videos[0].fps = 25
+        self.assertEqual(container.plan().streams[0].codec, "libx264")
+
+    def test_remux_plan_does_not_read_them(self):
+        shane.set_capabilities(None)
+        loaded = Capabilities(encoders={"libfdk_aac": "aac"})
+        with mock.patch.object(_capabilities, "load_capabilities",
+                               return_value=loaded) as load:
+            container = shane.Container(path="movie.mkv", probe=make_probe(VIDEO, DTS))
+            self.assertEqual(container.plan().cost, "remux")
+            load.assert_not_called()
+            # DTS is encoded for MP4
+            container.extention = ".mp4"
+            self.assertEqual(container.plan().streams[1].codec, "libfdk_aac")
+            load.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
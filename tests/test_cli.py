@@ -0,0 +1,135 @@
+import io
+import sys
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+from shane import _cli, _probe
+from shane._container import Container
+from shane._ffmpeg import FFmpegCompressor, FFmpegCompressorError
+
+from .test_matroska import make_mkv
+
+
+class TestRemux(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.movie = self.root / "movie.mkv"
+        self.movie.write_bytes(make_mkv())
+        self.journal = self.root / _cli.JOURNAL_NAME
+        _probe.set_probe_backend("native")
+        self.addCleanup(_probe.set_probe_backend, "ffprobe")
+        self.saved = []
+
+    def fake_save(self, container, progress=None, **settings):
+        self.saved.append(container.path)
+        Path(container.path).write_bytes(b"remuxed")
+
+    def run_cli(self, *args, save=None):
+        save = save or (lambda container, **_: self.fake_save(container))
+        with mock.patch.object(Container, "save", autospec=True, side_effect=save), \
+             redirect_stdout(io.StringIO()):
+            return _cli.main(["remux", str(self.root), "-j", "2", *args])
+
+    def entries(self):
+        journal = _cli.Journal(str(self.journal))
+        journal.close()
+        return journal.entries
+
+    def test_remux_and_resume(self):
+        self.assertEqual(self.run_cli("--to", "m4v"), 0)
+        output = str(self.root / "movie.m4v")
+        self.assertEqual(self.saved, [output])
+        entry = self.entries()[str(self.movie)]
+        self.assertEqual(entry["state"], "done")
+        self.assertEqual(entry["output"], output)
+        self.assertGreaterEqual(entry["elapsed"], 0)
+        # finished files are not done again
+        self.assertEqual(self.run_cli("--to", "m4v"), 0)
+        self.assertEqual(self.saved, [output])
+
+    def test_killed_run_leftovers_are_removed(self):
+        output = self.root / "movie.m4v"
+        temp = self.root / "movie (temp 1).m4v"
+        output.write_bytes(b"incomplete")
+        temp.write_bytes(b"incomplete")
+        record = {"path": str(self.movie), "state": "running",
+                  "output": str(output)}
+        self.journal.write_text(json.dumps(record) + "\n" + '{"path": "cut')
+        self.assertEqual(self.run_cli("--to", ".m4v"), 0)
+        self.assertFalse(temp.exists())
+        self.assertEqual(output.read_bytes(), b"remuxed")
+        self.assertEqual(self.entries()[str(self.movie)]["state"], "done")
+
+    def test_killed_while_removing_the_source(self):
+        def kill(path):
+            raise KeyboardInterrupt
+        journal = _cli.Journal(str(self.journal))
+        self.addCleanup(journal.close)
+        with mock.patch.object(Container, "save", autospec=True,
+                               side_effect=lambda c, **_: self.fake_save(c)), \
+             mock.patch.object(_cli.os, "remove", side_effect=kill), \
+             self.assertRaises(KeyboardInterrupt):
+            _cli.remux(str(self.movie), journal, ".m4v", remove_source=True)
+        output = self.root / "movie.m4v"
+        # the output is recorded before the source is touched
+        self.assertEqual(self.entries()[str(self.movie)]["state"], "done")
+        self.assertTrue(output.exists())
+
+    def test_missing_source_keeps_the_output(self):
+        output = self.root / "movie.m4v"
+        output.write_bytes(b"remuxed")
+        self.movie.unlink()
+        record = {"path": str(self.movie), "state": "running",
+                  "output": str(output)}
+        self.journal.write_text(json.dumps(record) + "\n")
+        self.assertEqual(self.run_cli("--to", ".m4v"), 0)
+        self.assertEqual(output.read_bytes(), b"remuxed")
+        self.assertEqual(self.entries()[str(self.movie)]["state"], "done")
+
+    def test_failed_files_are_retried_on_demand(self):
+        def fail(container, **_):
+            raise OSError("disk error")
+        self.assertEqual(self.run_cli("--to", ".mp4", save=fail), 1)
+        entry = self.entries()[str(self.movie)]
+        self.assertEqual(entry["state"], "failed")
+        self.assertIn("disk error", entry["error"])
+        self.assertEqual(self.run_cli("--to", ".mp4"), 1)
+        self.assertEqual(self.saved, [])
+        self.assertEqual(self.run_cli("--to", ".mp4", "--retry-failed"), 0)
+        self.assertEqual(len(self.saved), 1)
+
+    def test_nothing_to_change(self):
+        self.assertEqual(self.run_cli("--drop-audio-not", "eng"), 0)
+        self.assertEqual(self.saved, [])
+        self.assertEqual(self.entries()[str(self.movie)]["state"], "skipped")
+
+    def test_unsupported_extention(self):
+        with self.assertRaises(SystemExit), \
+             mock.patch("sys.stderr", io.StringIO()):
+            _cli.main(["remux", str(self.root), "--to", ".avi"])
+
+
+class TestRunCommand(unittest.TestCase):
+    def test_failed_command_keeps_the_original(self):
+        with tempfile.TemporaryDirectory() as directory:
+            original = Path(directory) / "movie.mkv"
+            temp = Path(directory) / "movie (temp 1).mkv"
+            original.write_bytes(b"original")
+            compressor = FFmpegCompressor()
+            compressor.add_output_path(str(original))
+            command = [sys.executable, "-c",
+                       f"open({str(temp)!r}, 'w').write('partial'); exit(1)"]
+            with self.assertRaises(FFmpegCompressorError):
+                compressor._run_command(command, str(temp))
+            self.assertFalse(temp.exists())
+            self.assertEqual(original.read_bytes(), b"original")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import tempfile
+import unittest
+import subprocess as sp
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _ffmpeg, _probe
+from shane._ffmpeg import FFmpegCompressorError
+
+from .test_plan import make_probe, VIDEO, DTS, ASS, FONT
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        path = str(self.root / "movie.mkv")
+        self.container = shane.Container(
+            path=path, probe=make_probe(VIDEO, DTS, ASS, FONT, filename=path)
+        )
+        self.commands = []
+
+    def fake_run(self, command, returncode=0):
+        self.commands.append(command)
+        for name in self.outputs(command):
+            (self.root / name).write_bytes(b"output")
+        return sp.CompletedProcess(command, returncode)
+
+    def export(self, outputs, returncode=0):
+        with mock.patch.object(_ffmpeg.sp, "run",
+                               side_effect=lambda c: self.fake_run(c, returncode)):
+            return self.container.export(outputs)
+
+    def outputs(self, command):
+        """Splits the output part of the `command` by the output paths."""
+        outputs, current = {}, []
+        for argument in command[command.index("-i") + 2:]:
+            if argument.startswith(str(self.root)):
+                outputs[os.path.basename(argument)] = current
+                current = []
+            else:
+                current.append(argument)
+        return outputs
+
+    def test_outputs_share_one_run(self):
+        self.export({
+            self.root / "archive.mkv": None,
+            self.root / "play.m4v": {"crf": 20},
+            self.root / "audio.mka": {
+                "streams": lambda s: s.is_audio,
+                "metadata": {"title": "Audio"},
+            },
+        })
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.commands[0].count("-i"), 1)
+        outputs = self.outputs(self.commands[0])
+        self.assertEqual(list(outputs), ["archive.mkv", "play.m4v", "audio.mka"])
+        archive, play, audio = outputs.values()
+        self.assertEqual(archive.count("-map"), 4)
+        # the codecs are chosen for every output
+        self.assertEqual(play[play.index("-codec:1") + 1], "aac")
+        self.assertEqual(play[play.index("-codec:2") + 1], "mov_text")
+        self.assertEqual(play[play.index("-crf") + 1], "20")
+        self.assertNotIn("0:3", play)
+        self.assertEqual(audio[audio.index("-map") + 1], "0:1")
+        self.assertEqual(audio.count("-map"), 1)
+        self.assertEqual(audio[audio.index("-metadata") + 1], "title=Audio")
+        self.assertNotIn("-crf", audio)
+        for name in ("archive.mkv", "play.m4v", "audio.mka"):
+            self.assertTrue((self.root / name).exists())
+
+    def test_failure_removes_all_outputs(self):
+        existing = self.root / "play.m4v"
+        existing.write_bytes(b"old")
+        with self.assertRaises(FFmpegCompressorError):
+            self.export({
+                self.root / "archive.mkv": None,
+                existing: None,
+            }, returncode=1)
+        self.assertEqual(os.listdir(self.root), ["play.m4v"])
+        self.assertEqual(existing.read_bytes(), b"old")
+
+    def test_same_path_twice(self):
+        with self.assertRaises(FFmpegCompressorError):
+            self.export({
+                str(self.root / "a.mkv"): None,
+                os.path.join(self.root, ".", "a.mkv"): None,
+            })
+
+    def test_video_in_audio_format(self):
+        with self.assertRaises(ValueError):
+            self.export({self.root / "audio.mka": None})
+
+
+class TestExtractStreams(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        path = str(self.root / "movie.mkv")
+        self.container = shane.Container(
+            path=path, probe=make_probe(VIDEO, DTS, ASS, FONT, filename=path)
+        )
+        self.commands = []
+
+    def fake_run(self, command):
+        self.commands.append(command)
+        for i, argument in enumerate(command):
+            if argument.startswith(str(self.root)) and command[i - 1] != "-i":
+                Path(argument).write_bytes(b"output")
+        return sp.CompletedProcess(command, 0)
+
+    def fake_probe(self, path, *args):
+        stream = ASS if path.endswith(".ass") else DTS
+        return make_probe(stream, filename=path)
+
+    def extract(self, selector, template):
+        with mock.patch.object(_ffmpeg.sp, "run", side_effect=self.fake_run), \
+             mock.patch.object(_probe, "probe", side_effect=self.fake_probe):
+            return self.container.extract_streams(selector, template)
+
+    def test_one_pass(self):
+        template = str(self.root / "{name}.{index}.{language}{ext}")
+        streams = self.extract(lambda s: not s.is_video, template)
+        self.assertEqual(len(self.commands), 1)
+        command = self.commands[0]
+        self.assertEqual(command.count("-i"), 1)
+        # attachments are input options
+        dump = command.index("-dump_attachment:3")
+        self.assertLess(dump, command.index("-i"))
+        self.assertEqual(command[dump + 1], str(self.root / "movie.3.und.ttf"))
+        self.assertEqual(command[-1], str(self.root / "movie.2.eng.ass"))
+        self.assertIn(str(self.root / "movie.1.fre.mka"), command)
+        self.assertEqual([s.type for s in streams],
+                         ["audio", "subtitle", "attachment"])
+        self.assertEqual(streams[2].path, str(self.root / "movie.3.und.ttf"))
+        self.assertFalse(any(s.inner for s in streams[:2]))
+
+    def test_only_attachments(self):
+        streams = self.extract(lambda s: s.is_attachment,
+                               str(self.root / "{filename}"))
+        command = self.commands[0]
+        self.assertEqual(command[-3:], ["-f", "null", "-"])
+        self.assertNotIn("-map", command)
+        self.assertEqual(streams[0].path, str(self.root / "font.ttf"))
+        self.assertTrue((self.root / "font.ttf").exists())
+
+    def test_nothing_selected(self):
+        self.assertEqual(self.extract(lambda s: False, "{index}{ext}"), [])
+        self.assertEqual(self.commands, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import unittest
+import subprocess as sp
+from unittest import mock
+
+import shane
+from shane import _frames
+from shane._frames import frame_shape, frames_command
+
+from .test_plan import make_probe, VIDEO, AAC
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeProcess:
+    def __init__(self, output, returncode=0):
+        self.stdout = io.BytesIO(output)
+        self.returncode = None
+        self._returncode = returncode
+        self.killed = False
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self.returncode = -9 if self.killed else self._returncode
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+
+
+class TestFrameCommand(unittest.TestCase):
+    def test_shapes(self):
+        self.assertEqual(frame_shape(640, 360, "rgb24"), (360, 640, 3))
+        self.assertEqual(frame_shape(640, 360, "gray"), (360, 640, 1))
+        self.assertEqual(frame_shape(640, 360, "yuv420p"), (540, 640, 1))
+        with self.assertRaises(ValueError):
+            frame_shape(641, 360, "yuv420p")
+        with self.assertRaises(ValueError):
+            frame_shape(640, 360, "bgr48")
+
+    def test_scaled_in_ffmpeg(self):
+        command = frames_command("movie.mkv", 0, "gray", size=(224, 224), fps=5)
+        self.assertEqual(command[command.index("-vf") + 1], "fps=5,scale=224:224")
+        self.assertEqual(command[command.index("-map") + 1], "0:0")
+        self.assertEqual(command[-5:], ["-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"])
+        self.assertNotIn("-vf", frames_command("movie.mkv", 0, "rgb24"))
+        # the buffers have the coded size of a rotated video
+        self.assertLess(command.index("-noautorotate"), command.index("-i"))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestFrames(unittest.TestCase):
+    def setUp(self):
+        probe = make_probe(AAC, dict(VIDEO, width=4, height=2))
+        self.video = shane.Container(path="movie.mkv", probe=probe).videos[0]
+        self.processes = []
+        # 5 gray frames of 4x2, every pixel is the frame number
+        self.output = b"".join(bytes([i]) * 8 for i in range(5))
+
+    def fake_popen(self, command, **kwargs):
+        self.command = command
+        process = FakeProcess(self.output)
+        self.processes.append(process)
+        return process
+
+    def frames(self, **kwargs):
+        with mock.patch.object(_frames.sp, "Popen", side_effect=self.fake_popen):
+            return list(self.video.frames(**kwargs))
+
+    def test_batches(self):
+        seen = []
+        with mock.patch.object(_frames.sp, "Popen", side_effect=self.fake_popen):
+            for frames in self.video.frames(batch=2, pix_fmt="gray", buffers=3):
+                seen.append((frames.shape, frames[:, 0, 0, 0].tolist()))
+        self.assertEqual(seen, [((2, 2, 4, 1), [0, 1]), ((2, 2, 4, 1), [2, 3]),
+                                ((1, 2, 4, 1), [4])])
+        self.assertEqual(self.command[self.command.index("-map") + 1], "0:1")
+
+    def test_buffers_are_reused(self):
+        batches = self.frames(batch=2, pix_fmt="gray", buffers=2)
+        # the third batch is read into the buffer of the first one
+        self.assertTrue(numpy.shares_memory(batches[0], batches[2]))
+        self.assertFalse(numpy.shares_memory(batches[0], batches[1]))
+        self.assertEqual(batches[0].dtype, numpy.uint8)
+
+    def test_size(self):
+        self.output = bytes(range(12)) * 2
+        first, = self.frames(batch=4, pix_fmt="rgb24", size=(2, 2))
+        self.assertEqual(first.shape, (2, 2, 2, 3))
+        self.assertEqual(first[0, 0, 1].tolist(), [3, 4, 5])
+
+    def test_wrong_size(self):
+        for size in [(224, -1), (-2, 224), (0, 10)]:
+            with self.assertRaises(ValueError):
+                self.video.frames(size=size)
+
+    def test_closed_early(self):
+        with mock.patch.object(_frames.sp, "Popen", side_effect=self.fake_popen):
+            frames = self.video.frames(pix_fmt="gray")
+            next(frames)
+            frames.close()
+        self.assertTrue(self.processes[0].killed)
+
+    def test_ffmpeg_fails(self):
+        def failing_popen(command, **kwargs):
+            return FakeProcess(b"", returncode=1)
+        with mock.patch.object(_frames.sp, "Popen", side_effect=failing_popen), \
+             self.assertRaises(sp.CalledProcessError):
+            list(self.video.frames())
+
+
+@unittest.skipIf(numpy is not None, "NumPy is installed")
+class TestWithoutNumpy(unittest.TestCase):
+    def test_numpy_is_required(self):
+        video = shane.Container(path="movie.mkv", probe=make_probe(VIDEO)).videos[0]
+        with self.assertRaisesRegex(ImportError, r"shane\[numpy\]"):
+            video.frames()
+
+
+if __name__ == "__main__":
+    unittest.main()
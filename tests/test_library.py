@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _probe
+
+from .test_matroska import make_mkv
+
+
+class TestLibrary(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        (self.root / "shows").mkdir()
+        (self.root / "movie.mkv").write_bytes(make_mkv())
+        (self.root / "shows" / "french.mkv").write_bytes(
+            make_mkv().replace(b"eng", b"fre"))
+        (self.root / "notes.txt").write_text("not a media file")
+        _probe.set_probe_backend("native")
+        self.addCleanup(_probe.set_probe_backend, "ffprobe")
+        self.library = shane.Library(self.root)
+        self.addCleanup(self.library.close)
+
+    def scan(self):
+        with mock.patch.object(_probe, "probe_native",
+                               wraps=_probe.probe_native) as probe:
+            counts = self.library.scan()
+        self.probed = probe.call_count
+        return counts
+
+    def test_scan(self):
+        counts = self.scan()
+        self.assertEqual(counts["added"], 2)
+        self.assertEqual(self.probed, 2)
+        self.assertEqual(len(self.library), 2)
+        self.assertNotIn(".shane.db", " ".join(self.library.paths()))
+
+    def test_rescan_is_incremental(self):
+        self.scan()
+        counts = self.scan()
+        self.assertEqual(counts["unchanged"], 2)
+        self.assertEqual(self.probed, 0)
+
+        os.remove(self.root / "movie.mkv")
+        os.rename(self.root / "shows" / "french.mkv", self.root / "french.mkv")
+        (self.root / "new.mkv").write_bytes(make_mkv(tags=False))
+        counts = self.scan()
+        self.assertEqual(
+            (counts["added"], counts["moved"], counts["removed"]), (1, 1, 1))
+        self.assertEqual(self.probed, 1)
+        self.assertEqual(self.library.paths(), [
+            str(self.root / "french.mkv"), str(self.root / "new.mkv")])
+
+    def test_find(self):
+        self.scan()
+        result = self.library.find(extention=".mkv", has={"codec": "h264"})
+        self.assertEqual(len(result), 2)
+        not_english = self.library.find(
+            has={"type": "audio"}, lacks={"type": "audio", "language": "eng"})
+        self.assertEqual([c.path for c in not_english],
+                         [str(self.root / "shows" / "french.mkv")])
+        self.assertEqual(self.library.find(has={"codec": ["hevc", "vp9"]}), [])
+        with self.assertRaises(shane.LibraryError):
+            self.library.find(has={"codec; DROP TABLE files": 1})
+
+    def test_found_containers_are_not_probed(self):
+        self.scan()
+        with mock.patch.object(_probe, "probe", side_effect=AssertionError):
+            container, _ = self.library.find(has={"height": 720})
+            self.assertIsInstance(container, shane.Container)
+            self.assertEqual(len(container.audios), 1)
+            self.assertEqual(container.videos[0].width, 1280)
+
+    def test_query(self):
+        self.scan()
+        result = self.library.query(
+            "EXISTS (SELECT 1 FROM streams WHERE file_id = files.id "
+            "AND fps > ?)", (23.9,))
+        self.assertEqual(len(result), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+import shane
+from shane import _ebml, _matroska as mkv
+from shane._ebml import encode_element as element, encode_uint as uint, \
+    encode_string as string
+
+
+def make_mkv(void=64, tags=True):
+    """A small Matroska file with a video and an audio track."""
+    header = element(mkv.EBML, string(0x4282, "matroska"))
+    info = element(mkv.INFO, b"".join([
+        uint(mkv.TIMECODE_SCALE, 1000000),
+        element(mkv.DURATION, struct.pack(">d", 60000.0)),
+        string(mkv.TITLE, "Movie"),
+        string(mkv.MUXING_APP, "test"),
+    ]))
+    video = element(mkv.TRACK_ENTRY, b"".join([
+        uint(mkv.TRACK_NUMBER, 1),
+        uint(mkv.TRACK_UID, 11),
+        uint(mkv.TRACK_TYPE, 1),
+        string(mkv.CODEC_ID, "V_MPEG4/ISO/AVC"),
+        string(mkv.LANGUAGE, "und"),
+        uint(mkv.DEFAULT_DURATION, 41708333),
+        element(mkv.VIDEO, uint(mkv.PIXEL_WIDTH, 1280) + uint(mkv.PIXEL_HEIGHT, 720)),
+    ]))
+    audio = element(mkv.TRACK_ENTRY, b"".join([
+        uint(mkv.TRACK_NUMBER, 2),
+        uint(mkv.TRACK_UID, 22),
+        uint(mkv.TRACK_TYPE, 2),
+        string(mkv.CODEC_ID, "A_AAC"),
+        string(mkv.LANGUAGE, "eng"),
+        string(mkv.NAME, "Stereo"),
+        uint(mkv.FLAG_DEFAULT, 1),
+        element(mkv.AUDIO, element(mkv.SAMPLING_FREQUENCY, struct.pack(">d", 48000.0))
+                + uint(mkv.CHANNELS, 2)),
+    ]))
+    tracks = element(mkv.TRACKS, video + audio)
+    chapters = element(mkv.CHAPTERS, element(mkv.EDITION_ENTRY, b"".join(
+        element(mkv.CHAPTER_ATOM, b"".join([
+            uint(mkv.CHAPTER_TIME_START, start * 10 ** 9),
+            uint(mkv.CHAPTER_TIME_END, (start + 30) * 10 ** 9),
+            element(mkv.CHAPTER_DISPLAY, string(mkv.CHAP_STRING, f"Chapter {i}")),
+        ]))
+        for i, start in enumerate([0, 30], 1)
+    )))
+    body = info + tracks + (_ebml.encode_void(void) if void else b"") + chapters
+    if tags:
+        body += element(mkv.TAGS, b"".join([
+            element(mkv.TAG, element(mkv.TARGETS, uint(mkv.TARGET_TYPE_VALUE, 50))
+                    + element(mkv.SIMPLE_TAG, string(mkv.TAG_NAME, "COMMENT")
+                              + string(mkv.TAG_STRING, "old"))),
+            element(mkv.TAG, element(mkv.TARGETS, uint(mkv.TAG_TRACK_UID, 22))
+                    + element(mkv.SIMPLE_TAG, string(mkv.TAG_NAME, "BPS")
+                              + string(mkv.TAG_STRING, "128000"))),
+        ]))
+        body += _ebml.encode_void(32)
+    body += element(mkv.CLUSTER, b"\0" * 256)
+    return header + element(mkv.SEGMENT, body)
+
+
+def read_layout(path):
+    buffer = Path(path).read_bytes()
+    segment = mkv.find_segment(buffer)
+    return buffer, mkv.find_level1(buffer, segment)
+
+
+def track_values(path):
+    buffer, level1 = read_layout(path)
+    result = []
+    for entry in mkv.track_entries(buffer, level1):
+        values = {}
+        for child in _ebml.children(buffer, entry):
+            if child.id == mkv.LANGUAGE:
+                values["language"] = _ebml.read_string(buffer, child)
+            elif child.id == mkv.NAME:
+                values["title"] = _ebml.read_string(buffer, child)
+            elif child.id == mkv.FLAG_FORCED:
+                values["forced"] = _ebml.read_uint(buffer, child)
+        result.append(values)
+    return result
+
+
+class TestEditInPlace(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "movie.mkv"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_tracks_fit_in_void(self):
+        self.path.write_bytes(make_mkv())
+        size = self.path.stat().st_size
+        chapters = read_layout(self.path)[1][mkv.CHAPTERS]
+        changed = mkv.edit_in_place(self.path, tracks={
+            0: {"language": "jpn", "title": "Main video"},
+            1: {"forced": True},
+        })
+        self.assertTrue(changed)
+        self.assertEqual(self.path.stat().st_size, size)
+        self.assertEqual(track_values(self.path), [
+            {"language": "jpn", "title": "Main video"},
+            {"language": "eng", "title": "Stereo", "forced": 1},
+        ])
+        # the elements after the tracks are not moved
+        self.assertEqual(read_layout(self.path)[1][mkv.CHAPTERS], chapters)
+
+    def test_does_not_fit(self):
+        data = make_mkv(void=0)
+        self.path.write_bytes(data)
+        changed = mkv.edit_in_place(self.path, tracks={0: {"title": "x" * 100}})
+        self.assertFalse(changed)
+        self.assertEqual(self.path.read_bytes(), data)
+
+    def test_same_size_without_void(self):
+        self.path.write_bytes(make_mkv(void=0))
+        self.assertTrue(mkv.edit_in_place(self.path, tracks={1: {"language": "fre"}}))
+        self.assertEqual(track_values(self.path)[1]["language"], "fre")
+
+    def test_title_and_tags(self):
+        self.path.write_bytes(make_mkv())
+        changed = mkv.edit_in_place(self.path, title="New", tags={
+            None: {"comment": "new", "ARTIST": "me"}, 1: {"BPS": None},
+        })
+        self.assertTrue(changed)
+        buffer, level1 = read_layout(self.path)
+        titles = [_ebml.read_string(buffer, c)
+                  for c in _ebml.children(buffer, level1[mkv.INFO]) if c.id == mkv.TITLE]
+        self.assertEqual(titles, ["New"])
+        self.assertIn(b"new", buffer)
+        self.assertIn(b"ARTIST", buffer)
+        self.assertNotIn(b"BPS", buffer)
+
+
+class TestSaveInPlace(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "movie.mkv"
+        self.path.write_bytes(make_mkv())
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def make_container(self):
+        probe = {
+            "format": {"filename": str(self.path), "tags": {"title": "Movie"}},
+            "streams": [
+                {"index": 0, "codec_type": "video", "codec_name": "h264",
+                 "width": 1280, "height": 720, "avg_frame_rate": "24/1",
+                 "disposition": {"default": 1, "forced": 0},
+                 "tags": {"language": "und"}},
+                {"index": 1, "codec_type": "audio", "codec_name": "aac",
+                 "channels": 2, "sample_rate": "48000",
+                 "disposition": {"default": 1, "forced": 0},
+                 "tags": {"language": "eng", "title": "Stereo"}},
+            ],
+            "chapters": [],
+        }
+        return shane.Container(path=str(self.path), probe=probe)
+
+    def test_changes(self):
+        container = self.make_container()
+        container.audios[0].metadata["language"] = "rus"
+        container.audios[0].is_default = False
+        changes = mkv._container_changes(container)
+        self.assertEqual(changes["tracks"], {1: {"language": "rus", "default": False}})
+        self.assertTrue(mkv.save_in_place(container))
+        self.assertEqual(track_values(self.path)[1]["language"], "rus")
+
+    def test_title_is_removed(self):
+        for title in (None, ""):
+            self.path.write_bytes(make_mkv())
+            container = self.make_container()
+            if title is None:
+                del container.metadata["title"]
+            else:
+                container.metadata["title"] = title
+            self.assertTrue(mkv.save_in_place(container))
+            buffer, level1 = read_layout(self.path)
+            titles = [c for c in _ebml.children(buffer, level1[mkv.INFO])
+                      if c.id == mkv.TITLE]
+            self.assertEqual(titles, [])
+
+    def test_other_changes_need_remux(self):
+        container = self.make_container()
+        container.videos[0].width = 640
+        self.assertFalse(mkv.save_in_place(container))
+        container = self.make_container()
+        container.remove_streams(lambda s: s.is_audio)
+        self.assertFalse(mkv.save_in_place(container))
+
+    def test_remux_keeps_flags(self):
+        container = self.make_container()
+        container.videos[0].width = 640
+        container.audios[0].is_default = False
+        self.assertFalse(mkv.save_in_place(container))
+        command = container.plan().command
+        self.assertEqual(command[command.index("-disposition:1") + 1], "0")
+        self.assertNotIn("-disposition:0", command)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from shane import _probe
+from shane._native import probe_native, UnsupportedFile
+
+from .test_matroska import make_mkv
+
+
+def box(box_type, data):
+    return struct.pack(">I4s", 8 + len(data), box_type) + data
+
+
+def full_box(box_type, data, version=0, flags=0):
+    return box(box_type, struct.pack(">I", (version << 24) | flags) + data)
+
+
+def language(code):
+    value = 0
+    for char in code:
+        value = (value << 5) | (ord(char) - 0x60)
+    return value
+
+
+def make_track(handler, entry, timescale, duration, lang, stts=b""):
+    tkhd = full_box(b"tkhd", bytes(80), flags=1)
+    mdhd = full_box(b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, duration,
+                                         language(lang), 0))
+    hdlr = full_box(b"hdlr", struct.pack(">I4s12x", 0, handler) + b"Handler\0")
+    stsd = full_box(b"stsd", struct.pack(">I", 1) + entry)
+    stbl = box(b"stbl", stsd + stts)
+    minf = box(b"minf", stbl)
+    return box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + minf))
+
+
+def make_mp4(chapters=b""):
+    avc1 = box(b"avc1", bytes(6) + struct.pack(">H16xHH", 1, 1920, 1080) + bytes(50))
+    stts = full_box(b"stts", struct.pack(">III", 1, 1440, 1001))
+    video = make_track(b"vide", avc1, 24000, 1441440, "und", stts)
+    esds = full_box(b"esds", bytes([0x03, 0x19, 0, 1, 0, 0x04, 0x11, 0x40]) + bytes(20))
+    mp4a = box(b"mp4a", bytes(6) + struct.pack(">H8xHHHHI", 1, 6, 16, 0, 0, 48000 << 16) + esds)
+    audio = make_track(b"soun", mp4a, 48000, 2880000, "fra")
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 60060) + bytes(80))
+    title = box(b"\xa9nam", box(b"data", struct.pack(">II", 1, 0) + b"Movie"))
+    udta = box(b"udta", full_box(b"meta", box(b"ilst", title)) + chapters)
+    moov = box(b"moov", mvhd + video + audio + udta)
+    return box(b"ftyp", b"isom\0\0\0\0isom") + box(b"mdat", bytes(1000)) + moov
+
+
+class TestNativeProbe(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, data):
+        path = self.base / name
+        path.write_bytes(data)
+        return path
+
+    def test_matroska(self):
+        path = self.write("movie.mkv", make_mkv())
+        probe = probe_native(path)
+        format = probe["format"]
+        self.assertEqual(format["duration"], "60.000000")
+        self.assertEqual(format["nb_streams"], 2)
+        self.assertEqual(format["tags"], {"title": "Movie", "encoder": "test",
+                                          "COMMENT": "old"})
+        video, audio = probe["streams"]
+        self.assertEqual(video["codec_name"], "h264")
+        self.assertEqual((video["width"], video["height"]), (1280, 720))
+        self.assertEqual(video["avg_frame_rate"], "24000/1001")
+        self.assertEqual(video["tags"], {"language": "und"})
+        self.assertEqual(audio["codec_name"], "aac")
+        self.assertEqual(audio["index"], 1)
+        self.assertEqual((audio["channels"], audio["sample_rate"]), (2, "48000"))
+        self.assertEqual(audio["tags"], {"language": "eng", "title": "Stereo",
+                                         "BPS": "128000"})
+        self.assertEqual(audio["disposition"]["default"], 1)
+        self.assertEqual(probe["chapters"], [
+            {"title": "Chapter 1", "start": 0.0, "end": 30.0},
+            {"title": "Chapter 2", "start": 30.0, "end": 60.0},
+        ])
+
+    def test_mp4(self):
+        path = self.write("movie.mp4", make_mp4())
+        probe = probe_native(path)
+        self.assertEqual(probe["format"]["duration"], "60.060000")
+        self.assertEqual(probe["format"]["tags"], {"title": "Movie"})
+        video, audio = probe["streams"]
+        self.assertEqual(video["codec_name"], "h264")
+        self.assertEqual((video["width"], video["height"]), (1920, 1080))
+        self.assertEqual(video["avg_frame_rate"], "24000/1001")
+        self.assertEqual(video["disposition"]["default"], 1)
+        self.assertEqual(audio["codec_name"], "aac")
+        self.assertEqual((audio["channels"], audio["sample_rate"]), (6, "48000"))
+        self.assertEqual(audio["tags"]["language"], "fra")
+
+    def test_unsupported(self):
+        path = self.write("movie.avi", b"RIFF" + bytes(100))
+        with self.assertRaises(UnsupportedFile):
+            probe_native(path)
+        path = self.write("empty.mkv", b"")
+        with self.assertRaises(UnsupportedFile):
+            probe_native(path)
+
+    def test_mp4_without_boxes(self):
+        ftyp = box(b"ftyp", b"isom\0\0\0\0isom")
+        no_mvhd = ftyp + box(b"moov", box(b"trak", b""))
+        mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 60060) + bytes(80))
+        tkhd = full_box(b"tkhd", bytes(80), flags=1)
+        mdhd = full_box(b"mdhd", struct.pack(">IIIIHH", 0, 0, 1000, 1000, 0, 0))
+        hdlr = full_box(b"hdlr", struct.pack(">I4s12x", 0, b"vide") + b"\0")
+        no_stbl = ftyp + box(b"moov", mvhd + box(
+            b"trak", tkhd + box(b"mdia", mdhd + hdlr + box(b"minf", b""))
+        ))
+        _probe.set_probe_backend("native")
+        self.addCleanup(_probe.set_probe_backend, "ffprobe")
+        for name, data in [("no-mvhd.mp4", no_mvhd), ("no-stbl.mp4", no_stbl)]:
+            path = self.write(name, data)
+            with self.assertRaisesRegex(UnsupportedFile, "box is not found"):
+                probe_native(path)
+            with mock.patch.object(_probe, "call_ffprobe", return_value="ffprobe"):
+                self.assertEqual(_probe.probe(path), "ffprobe")
+
+    def test_mp4_with_nero_chapters(self):
+        chpl = full_box(b"chpl", struct.pack(">IBQB", 0, 1, 0, 5) + b"Intro", version=1)
+        path = self.write("chapters.mp4", make_mp4(chpl))
+        with self.assertRaisesRegex(UnsupportedFile, "chapters"):
+            probe_native(path)
+
+    def test_fallback_to_ffprobe(self):
+        path = self.write("movie.avi", b"RIFF" + bytes(100))
+        _probe.set_probe_backend("native")
+        self.addCleanup(_probe.set_probe_backend, "ffprobe")
+        with mock.patch.object(_probe, "call_ffprobe", return_value="ffprobe") as call:
+            self.assertEqual(_probe.probe(path), "ffprobe")
+            mkv = self.write("movie.mkv", make_mkv())
+            self.assertEqual(_probe.probe(mkv)["format"]["nb_streams"], 2)
+        self.assertEqual(call.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
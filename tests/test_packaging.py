@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+import subprocess as sp
+from unittest import mock
+from xml.etree import ElementTree
+
+import shane
+from shane import _ffmpeg, muxers
+from shane._packaging import PackagingError, DASH_NAMESPACE
+
+from .test_plan import make_probe, VIDEO, AAC, DTS, ASS
+
+
+AAC_COMMENTARY = dict(AAC, tags={"language": "eng", "title": "Commentary"})
+PGS = {"codec_type": "subtitle", "codec_name": "hdmv_pgs_subtitle",
+       "tags": {"language": "eng"}}
+SRT = {"codec_type": "subtitle", "codec_name": "subrip", "tags": {"language": "fre"}}
+
+MASTER = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="group_audio",NAME="audio_eng",DEFAULT=YES,LANGUAGE="eng",URI="audio_eng/index.m3u8"
+
+#EXT-X-STREAM-INF:BANDWIDTH=2000000,CODECS="avc1.64001f,mp4a.40.2",AUDIO="group_audio"
+video/index.m3u8
+"""
+
+MANIFEST = f"""<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="{DASH_NAMESPACE}" type="static">
+  <Period id="0" start="PT0.0S">
+    <AdaptationSet id="0" contentType="video" />
+  </Period>
+</MPD>
+"""
+
+
+class TestPackaging(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, "movie")
+        probe = make_probe(VIDEO, AAC, DTS, AAC_COMMENTARY, ASS, PGS, SRT)
+        self.container = shane.Container(path="movie.mkv", probe=probe)
+        self.commands = []
+        self.returncode = 0
+
+    def fake_run(self, command):
+        self.commands.append(command)
+        for i, part in enumerate(command):
+            if part.endswith("index.m3u8"):
+                directory = os.path.dirname(os.path.dirname(part))
+                with open(os.path.join(directory, "master.m3u8"), "w") as f:
+                    f.write(MASTER)
+            elif part.endswith(".mpd"):
+                with open(part, "w") as f:
+                    f.write(MANIFEST)
+        return sp.CompletedProcess(command, self.returncode)
+
+    def package(self, function, *args, **kwargs):
+        with mock.patch.object(_ffmpeg.sp, "run", side_effect=self.fake_run):
+            return function(self.container, self.directory, *args, **kwargs)
+
+    def option(self, command, name, start=0):
+        return command[command.index(name, start) + 1]
+
+    def test_renditions(self):
+        package = self.package(muxers.hls)
+        self.assertEqual(
+            [(r.name, r.codec) for r in package.renditions],
+            [("video", "copy"), ("audio_eng", "copy"), ("audio_fre", "aac"),
+             ("subtitles_eng", "webvtt"), ("subtitles_fre", "webvtt")],
+        )
+
+    def test_hls_command(self):
+        self.package(muxers.hls, segment_type="mpegts")
+        command, = self.commands
+        maps = [command[i + 1] for i, part in enumerate(command) if part == "-map"]
+        # the commentary and the bitmap subtitles are left out
+        self.assertEqual(maps, ["0:0", "0:1", "0:2", "0:4", "0:6"])
+        self.assertEqual(self.option(command, "-var_stream_map"),
+                         "v:0,agroup:audio,name:video "
+                         "a:0,language:eng,agroup:audio,default:yes,name:audio_eng "
+                         "a:1,language:fre,agroup:audio,name:audio_fre")
+        self.assertEqual(self.option(command, "-hls_segment_type"), "mpegts")
+        self.assertTrue(self.option(command, "-hls_segment_filename").endswith(".ts"))
+        self.assertEqual(self.option(command, "-codec:0"), "copy")
+        self.assertEqual(self.option(command, "-codec:2"), "aac")
+        self.assertNotIn("-force_key_frames:0", command)
+
+    def test_hls_subtitles(self):
+        package = self.package(muxers.hls)
+        self.assertEqual(package.hls, os.path.join(self.directory, "master.m3u8"))
+        with open(package.hls) as f:
+            master = f.read()
+        self.assertIn('#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subtitles",'
+                      'NAME="subtitles_fre",LANGUAGE="fre"', master)
+        self.assertIn('AUDIO="group_audio",SUBTITLES="subtitles"', master)
+        with open(os.path.join(self.directory, "subtitles_fre.m3u8")) as f:
+            playlist = f.read()
+        self.assertIn("#EXT-X-TARGETDURATION:60\n", playlist)
+        self.assertIn("subtitles_fre.vtt\n", playlist)
+
+    def test_hls_and_dash_in_one_run(self):
+        package = self.package(muxers.hls_and_dash)
+        command, = self.commands
+        self.assertEqual(command.count("-i"), 1)
+        self.assertEqual(self.option(command, "-adaptation_sets"),
+                         "id=0,streams=0 id=1,streams=1 id=2,streams=2")
+        manifest = ElementTree.parse(package.dash).getroot()
+        sets = manifest.findall(f".//{{{DASH_NAMESPACE}}}AdaptationSet")
+        self.assertEqual([s.get("lang") for s in sets], [None, "eng", "fre"])
+        self.assertEqual(sets[-1].find(f".//{{{DASH_NAMESPACE}}}BaseURL").text,
+                         "subtitles_fre.vtt")
+
+    def test_encoded_video_has_keyframes_at_segments(self):
+        self.container.videos[0].fps = 25
+        self.package(muxers.dash, segment_duration=4, crf=20)
+        command, = self.commands
+        self.assertEqual(self.option(command, "-codec:0"), "h264")
+        self.assertEqual(self.option(command, "-force_key_frames:0"),
+                         "expr:gte(t,n_forced*4)")
+        self.assertEqual(self.option(command, "-crf"), "20")
+
+    def test_failed_run_leaves_nothing(self):
+        self.returncode = 1
+        with self.assertRaises(_ffmpeg.FFmpegCompressorError):
+            self.package(muxers.hls)
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_not_empty_directory(self):
+        os.makedirs(self.directory)
+        open(os.path.join(self.directory, "file"), "w").close()
+        with self.assertRaises(PackagingError):
+            self.package(muxers.hls)
+        self.assertEqual(self.commands, [])
+
+    def test_missing_muxer(self):
+        self.addCleanup(shane.set_capabilities, shane.get_capabilities())
+        shane.set_capabilities(shane.Capabilities(muxers=["hls", "matroska"]))
+        with self.assertRaises(PackagingError):
+            self.package(muxers.dash)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import io
+import os
+import math
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _packets
+from shane._cache import ProbeCache
+from shane._packets import PacketColumns, read_packet_index, trim_packet_indexes
+from shane._utils import require_numpy
+
+from .test_plan import make_probe, VIDEO, AAC
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# pts_time,dts_time,duration_time,size,flags; 12 frames a second,
+# a keyframe every 6 frames
+LINES = b"".join(
+    b"%.6f,%.6f,0.083333,%d,%s\n" % (
+        i / 12, i / 12, 1200 if i % 6 == 0 else 300, b"K_" if i % 6 == 0 else b"__"
+    )
+    for i in range(36)
+)
+
+
+class FakeProcess:
+    def __init__(self, output):
+        self.stdout = io.BytesIO(output)
+        self.returncode = 0
+
+    def wait(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+class TestPacketColumns(unittest.TestCase):
+    def test_chunks_split_lines(self):
+        columns = PacketColumns()
+        for i in range(0, len(LINES), 7):
+            columns.feed(LINES[i:i + 7])
+        columns.close()
+        self.assertEqual(len(columns.size), 36)
+        self.assertEqual(columns.size[:2].tolist(), [1200, 300])
+        self.assertEqual(columns.key[:7].tolist(), [1, 0, 0, 0, 0, 0, 1])
+        self.assertAlmostEqual(columns.pts[6], 0.5)
+
+    def test_unknown_values(self):
+        columns = PacketColumns()
+        columns.feed(b"N/A,0.000000,N/A,512,K_\n\nbad line\n0.1,0.1,0.1,128,__")
+        columns.close()
+        self.assertEqual(columns.size.tolist(), [512, 128])
+        self.assertTrue(math.isnan(columns.pts[0]))
+        self.assertTrue(math.isnan(columns.duration[0]))
+
+    def test_trim_indexes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        base = Path(directory.name)
+        now = time.time()
+        for i, age in enumerate([0, 10, 20, 100]):
+            path = base / f"{i}.npz"
+            path.write_bytes(bytes(100))
+            os.utime(path, (now - age, now - age))
+        # no limits keep everything
+        self.assertEqual(trim_packet_indexes(str(base)), 0)
+        self.assertEqual(trim_packet_indexes(str(base), max_age=50), 1)
+        self.assertEqual(trim_packet_indexes(str(base), max_size=250), 1)
+        self.assertEqual(sorted(p.name for p in base.iterdir()), ["0.npz", "1.npz"])
+
+    @unittest.skipIf(numpy is not None, "NumPy is installed")
+    def test_numpy_is_required(self):
+        with self.assertRaisesRegex(ImportError, r"shane\[numpy\]"):
+            require_numpy()
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestPacketIndex(unittest.TestCase):
+    def setUp(self):
+        self.runs = []
+
+    def fake_popen(self, command, **kwargs):
+        self.runs.append(command)
+        return FakeProcess(LINES)
+
+    def read(self, cache=None):
+        with mock.patch.object(_packets.sp, "Popen", side_effect=self.fake_popen):
+            return read_packet_index("movie.mkv", 0, cache)
+
+    def test_arrays(self):
+        packets = self.read()
+        command, = self.runs
+        self.assertEqual(command[command.index("-select_streams") + 1], "0")
+        self.assertEqual(len(packets), 36)
+        self.assertEqual(packets.size.dtype, numpy.int64)
+        self.assertEqual(packets.key.dtype, bool)
+        numpy.testing.assert_allclose(packets.keyframe_times(), [0, 0.5, 1, 1.5, 2, 2.5])
+
+    def test_bitrate(self):
+        packets = self.read()
+        times, bitrates = packets.bitrate(window=1.0)
+        numpy.testing.assert_allclose(times, [0, 1, 2])
+        # two keyframes and ten other frames a second
+        numpy.testing.assert_allclose(bitrates, [(2 * 1200 + 10 * 300) * 8] * 3)
+        self.assertEqual(packets.peak_bitrate(window=0.25), (1200 + 2 * 300) * 8 / 0.25)
+
+    def test_gop_distribution(self):
+        packets = self.read()
+        numpy.testing.assert_array_equal(packets.gop_lengths(), [6] * 5)
+        self.assertEqual(packets.gop_distribution(), {6: 5})
+
+    def test_cached_next_to_the_probes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        movie = Path(directory.name) / "movie.mkv"
+        movie.write_bytes(b"movie")
+        cache = ProbeCache(str(Path(directory.name) / "probes.db"), max_age=None)
+        self.addCleanup(cache.close)
+        with mock.patch.object(_packets.sp, "Popen", side_effect=self.fake_popen):
+            first = read_packet_index(str(movie), 0, cache)
+            second = read_packet_index(str(movie), 0, cache)
+        self.assertEqual(len(self.runs), 1)
+        self.assertTrue(Path(f"{cache.path}.packets").is_dir())
+        numpy.testing.assert_array_equal(first.pts, second.pts)
+
+    def test_stream_packet_index(self):
+        container = shane.Container(path="movie.mkv", probe=make_probe(VIDEO, AAC))
+        with mock.patch.object(_packets.sp, "Popen", side_effect=self.fake_popen):
+            packets = container.audios[0].packet_index()
+        self.assertEqual(len(packets), 36)
+        command, = self.runs
+        self.assertEqual(command[command.index("-select_streams") + 1], "1")
+        self.assertEqual(command[-1], "movie.mkv")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import os
+import sys
+import json
+import unittest
+import subprocess as sp
+from unittest import mock
+
+import shane
+from shane import _pipe, _ffmpeg
+from shane._pipe import PipeSource, PipeError, PIPE_PATH
+from shane._ffmpeg import FFmpegCompressorError
+
+from .test_native import box, make_mp4
+from .test_plan import make_probe, VIDEO, AAC
+
+
+POPEN = sp.Popen
+
+# reads stdin and writes its size to stdout
+FAKE_FFMPEG = """
+import sys
+size = len(sys.stdin.buffer.read())
+sys.stdout.buffer.write(str(size).encode())
+"""
+
+
+class Unseekable(io.RawIOBase):
+    def __init__(self, data):
+        self.buffer = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self.buffer.readinto(b)
+
+
+class TestPipeSource(unittest.TestCase):
+    def test_mdat_before_moov_needs_seeking(self):
+        self.assertTrue(PipeSource(make_mp4()).needs_seeking())
+
+    def test_moov_first_and_other_formats_are_streamed(self):
+        ftyp = box(b"ftyp", b"isom\0\0\0\0isom")
+        data = ftyp + box(b"moov", bytes(16)) + box(b"mdat", bytes(100))
+        self.assertFalse(PipeSource(data).needs_seeking())
+        self.assertFalse(PipeSource(b"\x1aE\xdf\xa3" + bytes(100)).needs_seeking())
+
+    def test_chunks_from_the_start(self):
+        fileobj = io.BytesIO(b"prefix" + b"x" * 100)
+        fileobj.read(6)
+        source = PipeSource(fileobj)
+        self.assertEqual(source.size, 100)
+        self.assertEqual(b"".join(source.chunks()), b"x" * 100)
+        # a seekable source can be read again
+        self.assertEqual(b"".join(source.chunks()), b"x" * 100)
+
+    def test_unseekable_source_is_read_once(self):
+        with mock.patch.object(_pipe, "HEAD_SIZE", 10):
+            source = PipeSource(Unseekable(b"y" * 100))
+        self.assertIsNone(source.size)
+        self.assertEqual(b"".join(source.chunks()), b"y" * 100)
+        with self.assertRaises(PipeError):
+            list(source.chunks())
+
+    def test_wrong_type(self):
+        with self.assertRaises(TypeError):
+            PipeSource(42)
+
+
+class TestOpenPipe(unittest.TestCase):
+    def setUp(self):
+        self.data = b"\x1aE\xdf\xa3" + bytes(1000)
+        self.commands = []
+
+    def fake_probe(self, command, input=None, stdout=None):
+        self.assertEqual(command[-1], PIPE_PATH)
+        self.assertEqual(input, self.data)
+        response = json.dumps(make_probe(VIDEO, AAC)).encode()
+        return sp.CompletedProcess(command, 0, response)
+
+    def fake_popen(self, command, **kwargs):
+        self.commands.append(command)
+        return POPEN([sys.executable, "-c", FAKE_FFMPEG], **kwargs)
+
+    def open(self, data):
+        with mock.patch.object(_pipe.sp, "run", side_effect=self.fake_probe):
+            return shane.open(data)
+
+    def test_open_bytes_and_save_to(self):
+        container = self.open(self.data)
+        self.assertIsInstance(container, shane.Container)
+        self.assertEqual(container.default_path, PIPE_PATH)
+        self.assertEqual(container.size, len(self.data))
+        self.assertEqual(len(container.streams), 2)
+        sink = io.BytesIO()
+        with mock.patch.object(_ffmpeg.sp, "Popen", side_effect=self.fake_popen):
+            container.save_to(sink, ".mkv")
+        command = self.commands[0]
+        self.assertEqual(command[command.index("-i") + 1], PIPE_PATH)
+        # FFmpeg got all the data over stdin
+        self.assertEqual(sink.getvalue(), str(len(self.data)).encode())
+
+    def test_unseekable_file_object_can_be_saved_once(self):
+        container = self.open(Unseekable(self.data))
+        with mock.patch.object(_ffmpeg.sp, "Popen", side_effect=self.fake_popen):
+            container.save_to(io.BytesIO(), ".mkv")
+            with self.assertRaises(PipeError):
+                container.save_to(io.BytesIO(), ".mkv")
+
+    def test_saving_needs_a_path(self):
+        container = self.open(self.data)
+        container.remove_streams(lambda s: s.is_audio)
+        with self.assertRaises(FFmpegCompressorError):
+            container.save()
+
+    def test_mdat_first_mp4_is_spooled(self):
+        data = make_mp4()
+        paths = []
+
+        def fake_open(path, keep_raw=False):
+            paths.append(path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data)
+            return shane.Container(path=path, probe=make_probe(VIDEO))
+
+        with mock.patch.object(shane._api, "open", side_effect=fake_open):
+            container = shane._api._open_source(PipeSource(data))
+        self.assertIsNone(container._source)
+        self.assertTrue(paths[0].endswith(".mp4"))
+        del container
+        self.assertFalse(os.path.exists(paths[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest import mock
+
+import shane
+from shane import _ffmpeg
+from shane._ffmpeg import FFmpegCompressor
+
+
+def make_probe(*streams, filename="movie.mkv"):
+    return {
+        "format": {"filename": filename, "duration": "60.0", "size": "1000"},
+        "streams": [
+            dict(stream, index=i, disposition={"default": 0, "forced": 0})
+            for i, stream in enumerate(streams)
+        ],
+        "chapters": [],
+    }
+
+
+VIDEO = {"codec_type": "video", "codec_name": "h264", "width": 1280,
+         "height": 720, "avg_frame_rate": "24/1", "tags": {"language": "eng"}}
+AAC = {"codec_type": "audio", "codec_name": "aac", "channels": 2,
+       "sample_rate": "48000", "tags": {"language": "eng"}}
+DTS = {"codec_type": "audio", "codec_name": "dts", "channels": 6,
+       "sample_rate": "48000", "tags": {"language": "fre"}}
+ASS = {"codec_type": "subtitle", "codec_name": "ass", "tags": {"language": "eng"}}
+FONT = {"codec_type": "attachment", "codec_name": "ttf",
+        "tags": {"filename": "font.ttf"}}
+
+
+class TestPlan(unittest.TestCase):
+    def test_remux(self):
+        container = shane.Container(
+            path="movie.mkv", probe=make_probe(VIDEO, AAC, ASS, FONT)
+        )
+        plan = container.plan()
+        self.assertEqual(plan.cost, "remux")
+        self.assertEqual([s.action for s in plan.streams], ["copy"] * 4)
+        self.assertEqual([s.output for s in plan.streams], [0, 1, 2, 3])
+        self.assertEqual(plan.command[-1], "movie.mkv")
+
+    def test_transcode_to_m4v(self):
+        container = shane.Container(
+            path="movie.mkv", probe=make_probe(VIDEO, DTS, ASS, FONT, AAC)
+        )
+        container.extention = ".m4v"
+        plan = container.plan()
+        self.assertEqual(plan.cost, "transcode")
+        video, dts, ass, font, aac = plan.streams
+        self.assertEqual(video.action, "copy")
+        self.assertEqual((dts.action, dts.codec), ("transcode", "aac"))
+        self.assertEqual((ass.action, ass.codec), ("transcode", "mov_text"))
+        self.assertIn("'ass' is not supported by '.m4v'", ass.reason)
+        self.assertEqual((font.action, font.output), ("drop", None))
+        self.assertEqual(aac.output, 3)
+        command = plan.command
+        self.assertEqual(command[command.index("-codec:3") + 1], "copy")
+        self.assertEqual(command[command.index("-codec:1") + 1], "aac")
+
+    def test_changed_frame_size_is_video_transcode(self):
+        container = shane.Container(
+            path="movie.mkv", probe=make_probe(VIDEO, AAC)
+        )
+        container.videos[0].width = 640
+        container.videos[0].height = 360
+        plan = container.plan(crf=20)
+        self.assertEqual(plan.cost, "video-transcode")
+        self.assertEqual(plan.transcoded[0].reason, "the frame size is changed")
+        self.assertIn("640x360", plan.command)
+        self.assertIn("20", plan.command)
+
+
+def command_for(container, extention=".m4v"):
+    compressor = FFmpegCompressor()
+    compressor.add_input_files(*container._get_all_input_files())
+    compressor.add_output_path("output" + extention)
+    return compressor._generate_common_command()
+
+
+class TestCompiledCommand(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(_ffmpeg, "_compiled_commands", type(_ffmpeg._compiled_commands)())
+        self.compiled = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make(self, title, filename="movie.mkv"):
+        streams = [VIDEO, DTS, ASS, FONT] + [AAC] * 100
+        container = shane.Container(path=filename, probe=make_probe(*streams, filename=filename))
+        container.audios[0].metadata["title"] = title
+        return container
+
+    def test_same_layout_shares_the_compiled_command(self):
+        first = command_for(self.make("First", "a.mkv"))
+        second = command_for(self.make("Second", "b.mkv"))
+        self.assertEqual(len(self.compiled), 1)
+        self.assertIn("title=Second", second)
+        self.assertIn("b.mkv", second)
+        # only the path and the tags differ
+        self.assertEqual(
+            [x for x in first if x not in ("a.mkv", "title=First")],
+            [x for x in second if x not in ("b.mkv", "title=Second")],
+        )
+        self.compiled.clear()
+        self.assertEqual(command_for(self.make("Second", "b.mkv")), second)
+
+    def test_other_layouts_are_compiled_again(self):
+        command_for(self.make("A"))
+        changed = self.make("A")
+        changed.videos[0].fps = 25
+        self.assertIn("-r:0", command_for(changed))
+        command_for(self.make("A"), ".mkv")
+        flagged = self.make("A")
+        flagged.subtitles[0].is_default = True
+        flagged.subtitles[0].is_forced = True
+        command = command_for(flagged)
+        self.assertEqual(command[command.index("-disposition:2") + 1], "default+forced")
+        self.assertEqual(len(self.compiled), 4)
+
+    def test_mapping(self):
+        container = self.make("A")
+        compressor = FFmpegCompressor()
+        compressor.add_input_files(container)
+        compressor.add_output_path("output.m4v")
+        font, last = container.attachments[0], container.streams[-1]
+        self.assertFalse(compressor._keep_attachment(font))
+        self.assertEqual(compressor._get_output_specifier_index_for(last), 102)
+        self.assertEqual(compressor._get_input_specifier_index_for(last), 0)
+        # the mapping follows the output
+        compressor.add_output_path("output.mkv")
+        self.assertTrue(compressor._keep_attachment(font))
+        self.assertEqual(compressor._get_output_specifier_index_for(last), 103)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import json
+import unittest
+from unittest import mock
+
+import shane
+from shane import _utils
+
+
+FFPROBE_RESPONSE = json.dumps({
+    "format": {
+        "filename": "movie.mkv",
+        "nb_streams": 2,
+        "format_name": "matroska,webm",
+        "duration": "120.000000",
+        "size": "149575198",
+        "bit_rate": "9971679",
+        "tags": {"title": "Movie"},
+    },
+    "streams": [
+        {
+            "index": 0,
+            "codec_name": "h264",
+            "codec_type": "video",
+            "width": 1280,
+            "height": 720,
+            "avg_frame_rate": "24000/1001",
+            "disposition": {"default": 1, "forced": 0},
+            "tags": {"language": "eng"},
+        },
+        {
+            "index": 1,
+            "codec_name": "aac",
+            "codec_type": "audio",
+            "channels": 2,
+            "sample_rate": "48000",
+            "disposition": {"default": 1, "forced": 0},
+            "tags": {"language": "eng"},
+        },
+    ],
+    "chapters": [
+        {"start_time": "0.000000", "end_time": "60.000000",
+         "tags": {"title": "Chapter 1"}},
+        {"start_time": "60.000000", "end_time": "120.000000",
+         "tags": {"title": "Chapter 2"}},
+    ],
+}).encode()
+
+
+class TestProbe(unittest.TestCase):
+    def test_parse_ffprobe(self):
+        probe = _utils.parse_ffprobe(FFPROBE_RESPONSE)
+        self.assertEqual(probe["format"]["filename"], "movie.mkv")
+        self.assertEqual(len(probe["streams"]), 2)
+        self.assertEqual(probe["chapters"][1], {
+            "title": "Chapter 2", "start": 60.0, "end": 120.0,
+        })
+
+    def test_parse_empty_response(self):
+        probe = _utils.parse_ffprobe(b"")
+        self.assertEqual(probe, {"format": {}, "streams": [], "chapters": []})
+
+    def test_open_calls_ffprobe_once(self):
+        with mock.patch.object(_utils.sp, "check_output",
+                               return_value=FFPROBE_RESPONSE) as call, \
+             mock.patch("os.path.exists", return_value=True):
+            container = shane.open("movie.mkv", lazy=False)
+        self.assertEqual(call.call_count, 1)
+        self.assertIsInstance(container, shane.Container)
+        self.assertEqual(len(container.streams), 2)
+        self.assertEqual(container.chapters[0]["title"], "Chapter 1")
+
+
+def fake_check_output(command):
+    response = json.loads(FFPROBE_RESPONSE)
+    sections = [c[len("-show_"):] for c in command if c.startswith("-show_")]
+    return json.dumps({k: v for k, v in response.items() if k in sections})
+
+
+class TestLazyContainer(unittest.TestCase):
+    def open(self, **kwargs):
+        patcher = mock.patch.object(_utils.sp, "check_output",
+                                    side_effect=fake_check_output)
+        self.call = patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch("os.path.exists", return_value=True):
+            return shane.open("movie.mkv", **kwargs)
+
+    def test_format_is_read_first(self):
+        container = self.open()
+        self.assertEqual(self.call.call_count, 1)
+        self.assertIn("-show_format", self.call.call_args[0][0])
+        self.assertNotIn("-show_streams", self.call.call_args[0][0])
+        self.assertFalse(container.is_loaded)
+        self.assertEqual(container.duration, 120.0)
+        self.assertEqual(container.metadata["title"], "Movie")
+
+    def test_streams_are_read_on_first_access(self):
+        container = self.open(lazy=True)
+        self.assertEqual(len(container.videos), 1)
+        self.assertEqual(container.chapters[1]["title"], "Chapter 2")
+        self.assertEqual(self.call.call_count, 2)
+        self.assertTrue(container.is_loaded)
+        self.assertIs(container.streams[0].container, container)
+
+    def test_eager_container(self):
+        with mock.patch.object(_utils.sp, "check_output",
+                               side_effect=fake_check_output) as call:
+            container = shane.Container(path="movie.mkv", lazy=False)
+            self.assertTrue(container.is_loaded)
+            self.assertEqual(len(container.streams), 2)
+        self.assertEqual(call.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
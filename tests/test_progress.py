@@ -0,0 +1,73 @@
+import os
+import sys
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+
+from shane._ffmpeg import FFmpegCompressor, ProgressParser
+
+
+PROGRESS_OUTPUT = """\
+frame=120
+fps=48.00
+stream_0_0_q=-1.0
+bitrate=1024.0kbits/s
+total_size=1048576
+out_time_us=5000000
+out_time_ms=5000000
+out_time=00:00:05.000000
+dup_frames=0
+drop_frames=0
+speed=2.00x
+progress=continue
+frame=240
+fps=N/A
+bitrate=N/A
+total_size=2097152
+out_time_us=10000000
+speed=N/A
+progress=end
+"""
+
+
+class TestProgressParser(unittest.TestCase):
+    def test_blocks(self):
+        parser = ProgressParser(duration=20)
+        result = [parser.feed(line) for line in PROGRESS_OUTPUT.splitlines()]
+        first, last = [p for p in result if p is not None]
+        self.assertEqual(first.out_time, 5.0)
+        self.assertEqual(first.frames, 120)
+        self.assertEqual(first.fps, 48.0)
+        self.assertEqual(first.speed, 2.0)
+        self.assertEqual(first.bitrate, 1024000.0)
+        self.assertEqual(first.total_size, 1048576)
+        self.assertEqual(first.percent, 25.0)
+        self.assertFalse(first.done)
+        self.assertIsNone(last.speed)
+        self.assertEqual(last.percent, 100.0)
+        self.assertTrue(last.done)
+
+    def test_unknown_duration(self):
+        parser = ProgressParser()
+        result = [parser.feed(line) for line in PROGRESS_OUTPUT.splitlines()]
+        self.assertIsNone([p for p in result if p][0].percent)
+
+
+class TestRunWithProgress(unittest.TestCase):
+    def test_callback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = Path(directory) / "ffmpeg"
+            script.write_text(f"#!{sys.executable}\nprint({PROGRESS_OUTPUT!r})\n")
+            script.chmod(script.stat().st_mode | stat.S_IEXEC)
+            compressor = FFmpegCompressor()
+            compressor.input_files = []
+            received = []
+            compressor.add_progress(received.append)
+            response = compressor._run_with_progress([str(script)])
+        self.assertEqual(response.returncode, 0)
+        self.assertEqual([p.frames for p in received], [120, 240])
+
+
+if __name__ == "__main__":
+    unittest.main()
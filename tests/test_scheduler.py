@@ -0,0 +1,90 @@
+import time
+import tempfile
+import threading
+import unittest
+from collections import namedtuple
+from pathlib import Path
+from unittest import mock
+
+from shane import _scheduler
+from shane import Scheduler, SchedulerError
+
+
+Usage = namedtuple("Usage", "total used free")
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.output = str(Path(self.dir.name) / "output.mkv")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_priorities(self):
+        order = []
+        started, gate = threading.Event(), threading.Event()
+        with Scheduler(workers=1) as scheduler:
+            scheduler.submit(lambda: started.set() or gate.wait(5))
+            started.wait(5)
+            for priority in (1, 3, 2):
+                scheduler.submit(lambda p=priority: order.append(p), priority=priority)
+            depth = scheduler.queue_depth
+            gate.set()
+        self.assertEqual(depth, 3)
+        self.assertEqual(order, [3, 2, 1])
+
+    def test_concurrency_limit(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+        def job():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+        with Scheduler(workers=2, per_device=10) as scheduler:
+            jobs = [scheduler.submit(job) for _ in range(6)]
+        self.assertEqual(peak[0], 2)
+        self.assertTrue(all(j.run_time >= 0.05 for j in jobs))
+
+    def test_not_enough_space(self):
+        usage = Usage(100, 90, 10)
+        with mock.patch.object(_scheduler.shutil, "disk_usage", return_value=usage):
+            with Scheduler(workers=1) as scheduler:
+                job = scheduler.submit(
+                    lambda: "done", output_path=self.output, expected_size=100,
+                )
+                with self.assertRaises(SchedulerError):
+                    job.result(timeout=5)
+        self.assertEqual(job.state, "failed")
+
+    def test_unreadable_output_fails_the_job(self):
+        error = PermissionError("denied")
+        with mock.patch.object(_scheduler.shutil, "disk_usage", side_effect=error):
+            with Scheduler(workers=1) as scheduler:
+                failed = scheduler.submit(lambda: "done", output_path=self.output)
+                other = scheduler.submit(lambda: "done")
+                with self.assertRaises(PermissionError):
+                    failed.result(timeout=5)
+                self.assertEqual(other.result(timeout=5), "done")
+        self.assertEqual(failed.state, "failed")
+
+    def test_waits_for_space(self):
+        # the second job fits only after the first one releases its space
+        usage = Usage(1000, 850, 150)
+        with mock.patch.object(_scheduler.shutil, "disk_usage", return_value=usage):
+            with Scheduler(workers=2, space_margin=1) as scheduler:
+                first = scheduler.submit(
+                    lambda: time.sleep(0.1), output_path=self.output, expected_size=100,
+                )
+                second = scheduler.submit(
+                    lambda: "done", output_path=self.output, expected_size=100,
+                )
+        self.assertEqual(second.result(), "done")
+        self.assertGreaterEqual(second.started_at, first.finished_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
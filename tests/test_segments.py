@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import subprocess as sp
+from pathlib import Path
+from unittest import mock
+
+import shane
+from shane import _probe, _segments, _ffmpeg
+
+from .test_plan import make_probe, VIDEO, AAC
+
+
+class TestSegmentedSave(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.path = str(self.root / "movie.mkv")
+        self.probe = make_probe(VIDEO, AAC, filename=self.path)
+        self.commands = []
+
+    def fake_run(self, command):
+        self.commands.append(command)
+        if "segment" in command:
+            pattern = command[-1]
+            for i in range(3):
+                Path(pattern % i).write_bytes(b"part")
+        else:
+            Path(command[-1]).write_bytes(b"encoded")
+        return sp.CompletedProcess(command, 0)
+
+    def save(self, container, **settings):
+        with mock.patch.object(_segments.sp, "run", side_effect=self.fake_run), \
+             mock.patch.object(_ffmpeg.sp, "run", side_effect=self.fake_run), \
+             mock.patch.object(_probe, "probe", return_value=self.probe):
+            container.save(**settings)
+
+    def test_video_is_encoded_in_segments(self):
+        container = shane.Container(path=self.path, probe=self.probe)
+        container.videos[0].width = 640
+        container.videos[0].height = 360
+        self.save(container, segments=3, crf=20)
+        split, *encodes, join, remux = self.commands
+        self.assertEqual(split[split.index("-segment_time") + 1], "20.0")
+        self.assertEqual(len(encodes), 3)
+        for command in encodes:
+            self.assertEqual(command[command.index("-s:0") + 1], "640x360")
+            self.assertEqual(command[command.index("-crf") + 1], "20")
+        self.assertIn("concat", join)
+        # the joined video is copied in place of the original one
+        self.assertEqual(remux[remux.index("-i", remux.index("-i") + 1) + 1],
+                         join[-1])
+        self.assertEqual(remux[remux.index("-map") + 1], "1:0")
+        self.assertEqual(remux[remux.index("-codec:0") + 1], "copy")
+        self.assertEqual(remux[remux.index("-codec:1") + 1], "copy")
+        self.assertNotIn("-s:0", remux)
+        self.assertEqual(
+            [p for p in os.listdir(self.root) if p.startswith(".shane")], [])
+
+    def test_remux_is_not_segmented(self):
+        container = shane.Container(path=self.path, probe=self.probe)
+        container.remove_streams(lambda s: s.is_audio)
+        self.save(container, segments=3)
+        self.assertEqual(len(self.commands), 1)
+
+    def test_failed_part_cleans_up(self):
+        container = shane.Container(path=self.path, probe=self.probe)
+        container.videos[0].fps = 25
+
+        def fail_encode(command):
+            if "-r:0" in command:
+                return sp.CompletedProcess(command, 1)
+            return self.fake_run(command)
+
+        with mock.patch.object(_segments.sp, "run", side_effect=fail_encode), \
+             self.assertRaises(_ffmpeg.FFmpegCompressorError):
+            container.save(segments=2)
+        self.assertEqual(os.listdir(self.root), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
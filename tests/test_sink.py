@@ -0,0 +1,80 @@
+import io
+import sys
+import unittest
+import subprocess as sp
+from unittest import mock
+
+import shane
+from shane import _ffmpeg
+from shane._ffmpeg import FFmpegCompressorError
+
+from .test_plan import make_probe, VIDEO, AAC, DTS
+
+
+POPEN = sp.Popen
+
+FAKE_FFMPEG = """
+import sys
+sys.stderr.buffer.write(b"out_time_us=30000000\\nprogress=continue\\n")
+for _ in range(5):
+    sys.stdout.buffer.write(b"x" * 300000)
+sys.stderr.buffer.write(b"out_time_us=60000000\\nprogress=end\\n")
+sys.exit(%d)
+"""
+
+
+class TestSink(unittest.TestCase):
+    def setUp(self):
+        self.container = shane.Container(
+            path="movie.mkv", probe=make_probe(VIDEO, DTS, AAC)
+        )
+        self.commands = []
+
+    def fake_popen(self, returncode=0):
+        def popen(command, **kwargs):
+            self.commands.append(command)
+            return POPEN([sys.executable, "-c", FAKE_FFMPEG % returncode], **kwargs)
+        return mock.patch.object(_ffmpeg.sp, "Popen", side_effect=popen)
+
+    def test_save_to_file_object(self):
+        sink = io.BytesIO()
+        with self.fake_popen():
+            self.container.save_to(sink, ".mp4")
+        self.assertEqual(len(sink.getvalue()), 1500000)
+        command = self.commands[0]
+        self.assertEqual(command[-1], "pipe:1")
+        self.assertIn("frag_keyframe+empty_moov+default_base_moof", command)
+        # the codecs are chosen for the extention of the sink
+        self.assertEqual(command[command.index("-codec:1") + 1], "aac")
+
+    def test_save_to_callable_in_chunks(self):
+        chunks = []
+        progress = []
+        with self.fake_popen():
+            self.container.save_to(chunks.append, progress=progress.append)
+        self.assertLessEqual(max(map(len, chunks)), _ffmpeg.PIPE_CHUNK_SIZE)
+        self.assertEqual(sum(map(len, chunks)), 1500000)
+        self.assertEqual([p.percent for p in progress], [50.0, 100.0])
+        self.assertIn("matroska", self.commands[0])
+        self.assertIn("pipe:2", self.commands[0])
+
+    def test_extract_to(self):
+        sink = io.BytesIO()
+        with self.fake_popen():
+            self.container.audios[1].extract_to(sink, ".aac")
+        command = self.commands[0]
+        self.assertEqual(command[command.index("-map") + 1], "0:2")
+        self.assertIn("adts", command)
+
+    def test_failure_raises(self):
+        with self.fake_popen(returncode=1), \
+             self.assertRaises(FFmpegCompressorError):
+            self.container.save_to(io.BytesIO())
+
+    def test_unsupported_extention(self):
+        with self.assertRaises(FFmpegCompressorError):
+            self.container.save_to(io.BytesIO(), ".avi")
+
+
+if __name__ == "__main__":
+    unittest.main()
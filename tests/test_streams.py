@@ -0,0 +1,114 @@
+import unittest
+import copy
+import pickle
+from fractions import Fraction
+
+from shane._utils import make_stream
+from shane._streams import Tags
+
+
+VIDEO = {
+    "index": 0, "codec_name": "h264", "codec_type": "video",
+    "width": 1280, "height": 720, "avg_frame_rate": "24000/1001",
+    "pix_fmt": "yuv420p", "duration": "120.000000", "bit_rate": "4000000",
+    "disposition": {"default": 1, "forced": 0, "comment": 0},
+    "tags": {"language": "eng", "title": "Main"},
+}
+AUDIO = {
+    "index": 1, "codec_name": "aac", "codec_type": "audio",
+    "channels": 2, "sample_rate": "48000",
+    "disposition": {"default": 0, "forced": 0},
+}
+
+
+class TestStreamFields(unittest.TestCase):
+    def test_fields_are_parsed_once(self):
+        video = make_stream(VIDEO)
+        self.assertEqual(video.frame_rate, Fraction(24000, 1001))
+        self.assertIsInstance(video.fps, float)
+        self.assertAlmostEqual(video.fps, 23.976, places=3)
+        self.assertEqual((video.width, video.height), (1280, 720))
+        self.assertEqual(video.duration, 120.0)
+        self.assertEqual(video.bitrate, 4000000)
+        self.assertEqual(video.pix_fmt, "yuv420p")
+        self.assertTrue(video.is_default)
+        audio = make_stream(AUDIO)
+        self.assertEqual(audio.channels, 2)
+        self.assertEqual(audio.sample_rate, 48000.0)
+        self.assertFalse(audio.is_default)
+
+    def test_streams_have_no_dict(self):
+        self.assertFalse(hasattr(make_stream(VIDEO), "__dict__"))
+        self.assertFalse(hasattr(make_stream(AUDIO), "__dict__"))
+
+    def test_unknown_frame_rate(self):
+        video = make_stream(dict(VIDEO, avg_frame_rate="0/0"))
+        self.assertEqual(video.fps, 0)
+
+    def test_changes_are_kept_apart(self):
+        video = make_stream(VIDEO)
+        video.fps = 25
+        video.width = 1920
+        video.is_default = False
+        self.assertEqual(video.frame_rate, Fraction(25))
+        self.assertEqual(video.default_frame_rate, Fraction(24000, 1001))
+        self.assertEqual(video.default_fps, 24000 / 1001)
+        self.assertEqual(video.default_width, 1280)
+        self.assertTrue(video.with_changed_fps())
+        self.assertFalse(video.is_default)
+        self.assertEqual(video.default_disposition, {"default": 1})
+        video.width = 1280
+        self.assertNotIn("width", video._changes)
+
+    def test_float_fps(self):
+        video = make_stream(VIDEO)
+        video.fps = 23.976
+        self.assertEqual(video.fps, 23.976)
+        self.assertEqual(video.frame_rate, Fraction("23.976"))
+        video.frame_rate = Fraction(30000, 1001)
+        self.assertEqual(video.frame_rate, Fraction(30000, 1001))
+        with self.assertRaises(TypeError):
+            video.fps = "25"
+
+    def test_raw(self):
+        kept = make_stream(VIDEO, keep_raw=True)
+        self.assertIs(kept.raw, VIDEO)
+        raw = make_stream(VIDEO).raw
+        self.assertEqual(raw["avg_frame_rate"], "24000/1001")
+        self.assertEqual(raw["duration"], "120.000000")
+        self.assertEqual(raw["disposition"], {"default": 1})
+        self.assertEqual(make_stream(raw).frame_rate, Fraction(24000, 1001))
+
+
+class TestTags(unittest.TestCase):
+    def test_original(self):
+        tags = Tags({"language": "eng", "title": "Main"})
+        tags["language"] = "fre"
+        tags["language"] = "ger"
+        del tags["title"]
+        tags.setdefault("comment", "new")
+        self.assertEqual(tags, {"language": "ger", "comment": "new"})
+        self.assertEqual(tags.original(), {"language": "eng", "title": "Main"})
+
+    def test_copy_keeps_the_changes(self):
+        tags = Tags({"language": "eng", "title": "Main"})
+        self.assertIsNone(copy.copy(tags)._original)
+        tags["language"] = "fre"
+        tags["comment"] = "new"
+        for copied in (copy.copy(tags), copy.deepcopy(tags),
+                       pickle.loads(pickle.dumps(tags))):
+            self.assertIsInstance(copied, Tags)
+            self.assertEqual(copied, tags)
+            self.assertEqual(copied.original(), {"language": "eng", "title": "Main"})
+            copied["title"] = "Other"
+            self.assertEqual(tags["title"], "Main")
+
+    def test_metadata_setter(self):
+        video = make_stream(VIDEO)
+        video.metadata = {"language": "fre"}
+        self.assertEqual(video.metadata, {"language": "fre"})
+        self.assertEqual(video.default_metadata, VIDEO["tags"])
+
+
+if __name__ == "__main__":
+    unittest.main()
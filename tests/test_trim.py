@@ -0,0 +1,122 @@
+import io
+import unittest
+import subprocess as sp
+from unittest import mock
+
+import shane
+from shane import _probe, _ffmpeg, _container, _streams
+from shane import _keyframes
+from shane._keyframes import Packet, parse_packet, cut_points, size_points, read_packets
+
+from .test_plan import make_probe, VIDEO, AAC, ASS
+
+
+KEYFRAMES = [i * 2.5 for i in range(24)]
+
+
+class TestKeyframes(unittest.TestCase):
+    def test_parse_packet(self):
+        self.assertEqual(parse_packet("0,2.500000,1024,K__\n"),
+                         Packet(0, 2.5, 1024, True))
+        self.assertEqual(parse_packet("1,N/A,12,__\n"), Packet(1, None, 12, False))
+        self.assertIsNone(parse_packet("\n"))
+
+    def test_read_packets_does_not_take_stdin(self):
+        process = mock.Mock(stdout=io.StringIO("0,0.000000,100,K_\n"))
+        with mock.patch.object(_keyframes.sp, "Popen", return_value=process) as popen:
+            self.assertEqual(list(read_packets("movie.mkv", 0)), [Packet(0, 0.0, 100, True)])
+        self.assertIs(popen.call_args.kwargs["stdin"], sp.DEVNULL)
+
+    def test_cut_points(self):
+        self.assertEqual(cut_points(KEYFRAMES, [0.1, 3, 4, 11]), [2.5, 10.0])
+
+    def test_size_points(self):
+        packets = []
+        for second in range(12):
+            packets.append(Packet(0, float(second), 100, second % 3 == 0))
+            packets.append(Packet(1, float(second), 20, True))
+        # 360 bytes are 3 seconds, a part ends before the next keyframe
+        self.assertEqual(size_points(packets, 0, 400), [3.0, 6.0, 9.0])
+        with self.assertRaises(ValueError):
+            size_points(packets, 0, 200)
+
+
+class TestTrim(unittest.TestCase):
+    def setUp(self):
+        self.probe = make_probe(VIDEO, AAC, ASS)
+        self.container = shane.Container(path="movie.mkv", probe=self.probe)
+        self.commands = []
+
+    def fake_run(self, command):
+        self.commands.append(command)
+        return sp.CompletedProcess(command, 0)
+
+    def run_cut(self, function, *args, **kwargs):
+        with mock.patch.object(_ffmpeg.sp, "run", side_effect=self.fake_run), \
+             mock.patch.object(_probe, "probe", return_value=self.probe), \
+             mock.patch.object(_streams.VideoStream, "keyframes", return_value=KEYFRAMES):
+            return function(*args, **kwargs)
+
+    def option(self, command, name):
+        return command[command.index(name) + 1]
+
+    def test_trim_starts_at_a_keyframe(self):
+        part = self.run_cut(self.container.trim, 6, 9, "clip.mkv")
+        command, = self.commands
+        # -ss is an input option
+        self.assertLess(command.index("-ss"), command.index("-i"))
+        self.assertEqual(self.option(command, "-ss"), "5.0")
+        self.assertEqual(self.option(command, "-t"), "4.0")
+        self.assertEqual(self.option(command, "-codec:0"), "copy")
+        self.assertEqual(command[-1], "clip.mkv")
+        self.assertIsInstance(part, shane.Container)
+
+    def test_accurate_trim_reencodes_the_video(self):
+        self.run_cut(self.container.trim, 6, 9, "clip.mkv", accurate=True, crf=18)
+        command, = self.commands
+        self.assertEqual(self.option(command, "-ss"), "6")
+        self.assertEqual(self.option(command, "-codec:0"), "h264")
+        self.assertEqual(self.option(command, "-codec:1"), "copy")
+        self.assertEqual(self.option(command, "-crf"), "18")
+
+    def test_split_every(self):
+        parts = self.run_cut(self.container.split, every=20)
+        self.assertEqual(len(parts), 3)
+        first, second, last = self.commands
+        self.assertNotIn("-ss", first)
+        self.assertEqual(self.option(first, "-t"), "20.0")
+        self.assertEqual(first[-1], "movie.001.mkv")
+        self.assertEqual(self.option(second, "-ss"), "20.0")
+        self.assertEqual(self.option(second, "-t"), "20.0")
+        self.assertEqual(self.option(last, "-ss"), "40.0")
+        self.assertNotIn("-t", last)
+        self.assertEqual(last[-1], "movie.003.mkv")
+
+    def test_split_by_size(self):
+        packets = [Packet(0, float(s), 100, s % 3 == 0) for s in range(60)]
+        with mock.patch.object(_container, "read_packets", return_value=packets):
+            self.run_cut(self.container.split, max_bytes=1000,
+                         path_template="part-{number}-{start}{ext}")
+        self.assertEqual(self.commands[0][-1], "part-1-0.mkv")
+        self.assertEqual(self.commands[1][-1], "part-2-9.0.mkv")
+        self.assertEqual(len(self.commands), 7)
+
+    def test_wrong_arguments(self):
+        with self.assertRaises(ValueError):
+            self.container.split(points=[10], every=10)
+        with self.assertRaises(ValueError):
+            self.container.trim(10, 5, "clip.mkv")
+        for every in (0, -5):
+            with self.assertRaises(ValueError):
+                self.container.split(every=every)
+
+    def test_split_every_without_duration(self):
+        del self.probe["format"]["duration"]
+        container = shane.Container(path="movie.mkv", probe=self.probe)
+        with self.assertRaisesRegex(ValueError, "duration is unknown"):
+            self.run_cut(container.split, every=20)
+        self.assertEqual(self.commands, [])
+
+
+if __name__ == "__main__":
+    unittest.main()